@@ -1,23 +1,23 @@
-import neurokit2 as nk
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from signal_cache import load_signal
+from plotting import show_or_save
+from resample import beat_rate, ppg_process_resampled, sampling_rate_from_times
 
 # Read PPG data from CSV file (assume 2nd column is PPG, 1st column is time)
-df = pd.read_csv("5min.csv")
-print("Available columns:", df.columns.tolist())
-ppg_data = df.iloc[:, 1].values
-time_data = df.iloc[:, 0].values
+ppg_data = load_signal("5min.csv", 1)
+time_data = load_signal("5min.csv", 0)
 
-# Set your actual sampling rate here (Hz)
-sampling_rate = 151
+# Sampling rate from the time column (Hz)
+sampling_rate = sampling_rate_from_times(time_data)
 
-# Process the PPG signal
-signals, info = nk.ppg_process(ppg_data, sampling_rate=sampling_rate)
+# Process the PPG signal at the canonical analysis rate (anti-aliased decimation)
+signals, analysis_rate, peak_times = ppg_process_resampled(ppg_data, sampling_rate)
 
-# Extract PPG rate (BPM)
-ppg_rate = signals["PPG_Rate"].values
-time = signals.index.values / sampling_rate  # convert index to seconds
+# Extract PPG rate (BPM) from the sub-sample peak times
+time = signals.index.values / analysis_rate  # convert index to seconds
+ppg_rate = beat_rate(peak_times, time)
 
 print(f"Average PPG Rate: {np.nanmean(ppg_rate):.2f} BPM")
 print(f"Min PPG Rate: {np.nanmin(ppg_rate):.2f} BPM")
@@ -37,20 +37,21 @@ axs[1].set_title("PPG Rate Over Time")
 axs[1].legend()
 
 plt.tight_layout()
-plt.show()
+show_or_save(name='5min_resampled')
 
 
 
-import neurokit2 as nk
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from excel_cache import read_excel_cached
+from plotting import show_or_save
 
 
 
 
 # Read PPG data from data_calibate.xlsx (column 'My sensor')
-df = pd.read_excel("data_calibate.xlsx")
+df = read_excel_cached("data_calibate.xlsx", columns=['My sensor'])
 print("Available columns:", df.columns.tolist())
 
 print("Available columns:", df.columns.tolist())
@@ -78,4 +79,4 @@ plt.ylabel('PPG Rate (BPM)')
 plt.title('Comparison of PPG Rate: 5min.csv (resampled) vs My sensor (data_calibate.xlsx)')
 plt.legend()
 plt.tight_layout()
-plt.show()
+show_or_save(name='5min_resampled_vs_my_sensor')
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import correlate
+
+
+def to_grid(times, values, grid):
+    """
+    Interpolate an irregular series onto a regular grid
+
+    Args:
+        times (array): Sample times in seconds
+        values (array): Sample values (NaN values are skipped)
+        grid (array): Grid times in seconds
+
+    Returns:
+        array: Values at the grid times
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    return np.interp(grid, times[valid], values[valid])
+
+
+def estimate_lag(reference, signal, max_lag):
+    """
+    Lag of signal behind reference by FFT normalized cross-correlation
+
+    Both series are on the same regular grid; reference must cover max_lag
+    extra samples on each side of signal, i.e.
+    len(reference) == len(signal) + 2 * max_lag.
+
+    Returns:
+        tuple: (lag in samples, sub-sample refined, with signal[n] ~
+            reference[n + max_lag - lag]; peak correlation coefficient)
+    """
+    n = len(signal)
+    signal = signal - signal.mean()
+    signal_norm = np.sqrt(np.sum(signal ** 2))
+
+    # Sliding sums of the reference give each window's norm in O(n)
+    sums = np.concatenate([[0.0], np.cumsum(reference)])
+    squares = np.concatenate([[0.0], np.cumsum(reference ** 2)])
+    window_sum = sums[n:] - sums[:-n]
+    window_var = squares[n:] - squares[:-n] - window_sum ** 2 / n
+    denominator = signal_norm * np.sqrt(np.maximum(window_var, 0))
+
+    numerator = correlate(reference, signal, mode='valid', method='fft')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ncc = np.where(denominator > 0, numerator / denominator, 0)
+
+    j = int(np.argmax(ncc))
+    offset = 0.0
+    if 0 < j < len(ncc) - 1:
+        # Parabolic interpolation around the peak
+        left, centre, right = ncc[j - 1], ncc[j], ncc[j + 1]
+        curvature = left - 2 * centre + right
+        if curvature < 0:
+            offset = 0.5 * (left - right) / curvature
+    return max_lag - (j + offset), ncc[j]
+
+
+def estimate_offset_drift(ref_times, ref_values, times, values, step=1.0,
+                          segment_seconds=600, max_lag=30, min_correlation=0.5,
+                          max_drift=1e-3):
+    """
+    Estimate the clock offset and drift of a series against a reference
+
+    The overlap is cut into half-overlapping segments, each segment's lag is
+    found with estimate_lag, and a line lag(t) = offset + drift * (t - t0)
+    is fitted through the well-correlated segments. When there are fewer
+    than three usable segments, or the fitted drift is implausible, a single
+    offset is estimated over the whole overlap and the drift is taken as zero.
+    When even that correlates below min_correlation the match is not trusted:
+    offset and drift are zero and 'aligned' is False.
+
+    Args:
+        ref_times, ref_values (array): Reference series (times in seconds)
+        times, values (array): Series to align (times in seconds)
+        step (float): Grid spacing used for the correlation (s)
+        segment_seconds (float): Segment length (s)
+        max_lag (float): Largest lag searched (s)
+        min_correlation (float): Segments below this peak correlation are ignored
+        max_drift (float): Largest accepted drift (s per s)
+
+    Returns:
+        dict: 'offset' (s) at 't0', 'drift' (s per s), 'correlation' of the
+            estimate, 'aligned' (False when no correction is applied) and
+            per-segment 'segments' as (centre time, lag, correlation) tuples
+    """
+    times = np.asarray(times, dtype=np.float64)
+    ref_times = np.asarray(ref_times, dtype=np.float64)
+    start = max(times[0], ref_times[0] + max_lag)
+    stop = min(times[-1], ref_times[-1] - max_lag)
+    if stop - start < 2 * step:
+        raise ValueError("Series overlap is too short to estimate a lag")
+
+    lag_samples = int(round(max_lag / step))
+
+    def segment_lag(seg_start, seg_seconds):
+        n = int(seg_seconds / step)
+        signal = to_grid(times, values, seg_start + np.arange(n) * step)
+        reference = to_grid(ref_times, ref_values,
+                            seg_start + np.arange(-lag_samples, n + lag_samples) * step)
+        lag, correlation = estimate_lag(reference, signal, lag_samples)
+        return seg_start + n * step / 2, lag * step, correlation
+
+    segment_seconds = min(segment_seconds, stop - start)
+    segments = [segment_lag(seg_start, segment_seconds)
+                for seg_start in np.arange(start, stop - segment_seconds + step, segment_seconds / 2)]
+
+    usable = [s for s in segments if s[2] >= min_correlation]
+    if len(usable) >= 3:
+        centres = np.array([s[0] for s in usable])
+        lags = np.array([s[1] for s in usable])
+        drift, offset = np.polyfit(centres - start, lags, 1, w=[s[2] for s in usable])
+        if abs(drift) <= max_drift:
+            correlation = float(np.mean([s[2] for s in usable]))
+            return {'offset': offset, 'drift': drift, 't0': start, 'correlation': correlation,
+                    'aligned': True, 'segments': segments}
+
+    _, offset, correlation = segment_lag(start, stop - start)
+    if correlation < min_correlation:
+        # A poor match would still pick some lag up to max_lag; shifting by it
+        # does more harm than leaving the clocks as they are
+        return {'offset': 0.0, 'drift': 0.0, 't0': start, 'correlation': correlation,
+                'aligned': False, 'segments': segments}
+    return {'offset': offset, 'drift': 0.0, 't0': start, 'correlation': correlation,
+            'aligned': True, 'segments': segments}
+
+
+def alignment_summary(alignment):
+    """One line describing an alignment, for the scripts to print"""
+    if not alignment['aligned']:
+        return (f"Sensor clock not corrected: correlation with the reference is too low "
+                f"(r={alignment['correlation']:.2f})")
+    return (f"Sensor clock offset: {alignment['offset']:.2f} s, drift: {alignment['drift'] * 1e6:.0f} ppm "
+            f"(r={alignment['correlation']:.2f})")
+
+
+def align_to_reference(df, ref_df, value_col='My sensor', ref_col='PPG_Rate', **kwargs):
+    """
+    Correct the timestamps of a sensor series to a reference series
+
+    Args:
+        df (DataFrame): Series to align, with 'Timestamp' and value_col
+        ref_df (DataFrame): Reference, with 'Timestamp' and ref_col
+        **kwargs: Passed to estimate_offset_drift
+
+    Returns:
+        tuple: (copy of df with corrected 'Timestamp', alignment dict)
+    """
+    origin = ref_df['Timestamp'].min()
+    ref_times = (ref_df['Timestamp'] - origin).dt.total_seconds().to_numpy()
+    times = (df['Timestamp'] - origin).dt.total_seconds().to_numpy()
+
+    order = np.argsort(ref_times, kind='stable')
+    alignment = estimate_offset_drift(ref_times[order], ref_df[ref_col].to_numpy()[order],
+                                      times, df[value_col].to_numpy(), **kwargs)
+    lag = alignment['offset'] + alignment['drift'] * (times - alignment['t0'])
+
+    aligned = df.copy()
+    aligned['Timestamp'] = df['Timestamp'] - pd.to_timedelta(lag, unit='s')
+    return aligned, alignment
+
+
+def join_nearest(df, ref_df, tolerance='1s'):
+    """Pair every row of df with the reference row nearest in time"""
+    return pd.merge_asof(df.sort_values('Timestamp'), ref_df.sort_values('Timestamp'),
+                         on='Timestamp', direction='nearest',
+                         tolerance=pd.Timedelta(tolerance))
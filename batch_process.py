@@ -0,0 +1,238 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import profiler
+from profiler import stage
+from signal_cache import load_signal, source_hash
+from signal_store import read_channel, read_store_meta
+
+DEFAULT_PATTERNS = ('*.acq',)
+# Time columns above this are seconds since the epoch (signal_cache stores
+# timestamp columns that way), not seconds from the start of the recording
+EPOCH_SECONDS = 1e9
+
+
+def find_recordings(directory, patterns=DEFAULT_PATTERNS):
+    """Return the sorted list of recordings in a directory matching any pattern"""
+    found = set()
+    for pattern in patterns:
+        found.update(glob.glob(os.path.join(directory, pattern)))
+    return sorted(found)
+
+
+def output_paths(source, out_dir):
+    """Return the output and checkpoint paths used for one recording"""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return {
+        'store': os.path.join(out_dir, stem + '.store'),
+        'rate': os.path.join(out_dir, stem + '_with_rate.csv'),
+        'stats': os.path.join(out_dir, stem + '_every10s.csv'),
+        'checkpoint': os.path.join(out_dir, stem + '.done.json'),
+    }
+
+
+def is_done(source, out_dir):
+    """Check whether a recording already has a checkpoint for its current content"""
+    checkpoint = output_paths(source, out_dir)['checkpoint']
+    if not os.path.exists(checkpoint):
+        return False
+    with open(checkpoint) as f:
+        return json.load(f).get('source_hash') == source_hash(source)
+
+
+def prepare_recording(source, out_dir):
+    """
+    Convert or cache a recording so the worker can map it without parsing
+
+    .acq files are converted to a chunked store (see convert_csv.py), again
+    whenever the content hash recorded in the store differs from the file's;
+    CSV and Excel files go through the shared signal cache (see signal_cache.py).
+    """
+    if source.lower().endswith('.acq'):
+        from convert_csv import convert_acq_to_store
+        store = output_paths(source, out_dir)['store']
+        digest = source_hash(source)
+        if store_hash(store) != digest:
+            # Chunks of the old conversion must not outlive it
+            shutil.rmtree(store, ignore_errors=True)
+            convert_acq_to_store(source, store, source_hash=digest)
+    else:
+        load_signal(source, 0)
+        load_signal(source, 1)
+    return source
+
+
+def store_hash(store):
+    """Source hash recorded in a store's metadata (None when missing)"""
+    try:
+        return read_store_meta(store).get('source_hash')
+    except (OSError, ValueError):
+        return None
+
+
+def recording_hash(source, out_dir):
+    """
+    Content hash of the data a worker processes: the one recorded when the
+    .acq store was converted, or the current hash of a CSV/Excel source
+    """
+    if source.lower().endswith('.acq'):
+        return store_hash(output_paths(source, out_dir)['store'])
+    return source_hash(source)
+
+
+def load_recording(source, out_dir):
+    """
+    Load a prepared recording
+
+    Returns:
+        tuple: (time in seconds from the first sample, PPG samples, sampling
+            rate, timestamp of the first sample or None when unknown)
+    """
+    if source.lower().endswith('.acq'):
+        store = output_paths(source, out_dir)['store']
+        meta = read_store_meta(store)
+        time, ppg = read_channel(store, 0, meta=meta)
+        start_time = None
+        if meta.get('start_time'):
+            # ACQ start times are UTC; sensor files use naive local wall-clock times
+            start_time = pd.Timestamp(datetime.fromisoformat(meta['start_time']).astimezone().replace(tzinfo=None))
+        return time, ppg, meta['channels'][0]['sampling_rate'], start_time
+
+    time = np.asarray(load_signal(source, 0))
+    ppg = np.asarray(load_signal(source, 1))
+    start_time = pd.to_datetime(time[0], unit='s').round('us') if time[0] > EPOCH_SECONDS else None
+    time = time - time[0]
+    sampling_rate = 1 / np.median(np.diff(time))
+    return time, ppg, sampling_rate, start_time
+
+
+def window_stats(time, rate, window_seconds=10, start_time=None):
+    """
+    Mean/min/max of the rate in consecutive windows, like calculate_10s_stats.py
+
+    Windows are labelled with 'Time' (seconds from the first sample) and,
+    when start_time is known, 'Timestamp'.
+    """
+    df = pd.DataFrame({'PPG_Rate': rate})
+    bins = (time // window_seconds).astype(np.int64)
+    stats = df.groupby(bins)['PPG_Rate'].agg(['mean', 'min', 'max']).round(2)
+    stats.columns = ['Mean_Rate', 'Min_Rate', 'Max_Rate']
+    stats.insert(0, 'Time', stats.index * window_seconds)
+    if start_time is not None:
+        stats.insert(1, 'Timestamp', start_time + pd.to_timedelta(stats['Time'], unit='s'))
+    return stats.reset_index(drop=True)
+
+
+def process_recording(source, out_dir, window_seconds=10):
+    """
+    Run nk.ppg_process, rate export and windowed stats for one prepared
+    recording, then write its checkpoint
+    """
+    import neurokit2 as nk
+
+    paths = output_paths(source, out_dir)
+    name = os.path.basename(source)
+    # Hash of the prepared data, taken before loading so the checkpoint never
+    # claims a newer version of the source than the one processed
+    digest = recording_hash(source, out_dir)
+    with stage('load_recording', recording=name) as record:
+        time, ppg, sampling_rate, start_time = load_recording(source, out_dir)
+        record.rows = len(ppg)
+
+    with stage('nk.ppg_process', rows=len(ppg), recording=name):
+        signals, info = nk.ppg_process(ppg, sampling_rate=sampling_rate)
+    ppg_rate = signals['PPG_Rate'].values
+
+    with stage('write_outputs', rows=len(ppg_rate), recording=name):
+        # 'Timestamp' lets render_report.py compare the session with a sensor file
+        rate_df = pd.DataFrame({'Time': time, 'PPG_Rate': ppg_rate})
+        if start_time is not None:
+            rate_df.insert(1, 'Timestamp', (start_time + pd.to_timedelta(time, unit='s')).round('us'))
+        rate_df.to_csv(paths['rate'], index=False)
+        window_stats(time, ppg_rate, window_seconds, start_time).to_csv(paths['stats'], index=False)
+
+    checkpoint = {
+        'source': os.path.abspath(source),
+        'source_hash': digest,
+        'sampling_rate': sampling_rate,
+        'beats': len(info['PPG_Peaks']),
+        'outputs': [paths['rate'], paths['stats']],
+    }
+    tmp_path = paths['checkpoint'] + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, paths['checkpoint'])
+    return source
+
+
+def run_batch(directory, out_dir='batch_output', patterns=DEFAULT_PATTERNS,
+              workers=None, window_seconds=10):
+    """
+    Process every recording of a directory in a process pool
+
+    Recordings are prepared one after another in a background thread while
+    the pool works on the ones already prepared, and recordings that already
+    have a checkpoint for their current content are skipped, so an
+    interrupted run resumes where it stopped.
+
+    Args:
+        directory (str): Directory containing the recordings
+        out_dir (str): Directory for outputs and checkpoints
+        patterns (tuple): Glob patterns selecting the recordings
+        workers (int): Number of worker processes (default: all cores)
+        window_seconds (float): Window length for the rate statistics
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    recordings = find_recordings(directory, patterns)
+    todo = [r for r in recordings if not is_done(r, out_dir)]
+    print(f"Found {len(recordings)} recordings, {len(recordings) - len(todo)} already done")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=1) as loader:
+        prepared = [loader.submit(prepare_recording, source, out_dir) for source in todo]
+        futures = {}
+        for source, future in zip(todo, prepared):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to read {source}: {e}")
+                failed.append(source)
+                continue
+            futures[pool.submit(process_recording, source, out_dir, window_seconds)] = source
+
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                future.result()
+                print(f"Processed {source}")
+            except Exception as e:
+                print(f"Failed to process {source}: {e}")
+                failed.append(source)
+
+    print(f"Done: {len(todo) - len(failed)} processed, {len(failed)} failed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process every recording of a directory")
+    parser.add_argument('directory', help="Directory containing the recordings")
+    parser.add_argument('--out-dir', default='batch_output', help="Directory for outputs and checkpoints")
+    parser.add_argument('--pattern', action='append', help="Glob pattern of recordings (default: *.acq)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--window', type=float, default=10, help="Window length for rate statistics (s)")
+    parser.add_argument('--profile', metavar='FILE', help="Append per-stage timings to a JSON-lines file")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable(args.profile)
+
+    run_batch(args.directory, args.out_dir, tuple(args.pattern or DEFAULT_PATTERNS),
+              args.workers, args.window)
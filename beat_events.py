@@ -0,0 +1,281 @@
+import os
+import re
+
+import numpy as np
+
+# pandas is imported inside the functions that build DataFrames, so the
+# numpy-only path (read_beat_arrays, rate_arrays) starts fast for ppg_cli.py
+
+BEATS_FILE = '5min_addtime_beats.csv'
+RATE_FILE = '5min_addtime_with_rate.csv'
+BEAT_COLUMNS = ['Sample', 'Timestamp', 'PPG_Rate', 'Quality']
+STAT_COLUMNS = {'mean': 'Mean_Rate', 'min': 'Min_Rate', 'max': 'Max_Rate', 'std': 'Std_Rate'}
+FREQ_UNITS = {'ms': 1e-3, 's': 1.0, 'sec': 1.0, 'min': 60.0, 't': 60.0, 'h': 3600.0, 'd': 86400.0}
+
+# A beat is flagged (Quality 0) when its rate is outside this range or its
+# RR interval is more than RR_TOLERANCE away from the median of its neighbours
+RATE_RANGE = (30, 220)
+RR_TOLERANCE = 0.3
+RR_NEIGHBOURS = 5
+
+
+def beats_from_peaks(peaks, sampling_rate, start_time=None, timestamps=None):
+    """
+    Beat events from (sub-sample) peak positions
+
+    Args:
+        peaks (array): Peak sample positions, possibly fractional
+        sampling_rate (float): Sampling rate (Hz)
+        start_time: Timestamp of sample 0, when the recording has no time column
+        timestamps (array): Recorded timestamp of every sample; beat times are
+            interpolated on it (see sample_timestamps), so a glitched first
+            row or a gap in the time column does not shift the beats
+
+    Returns:
+        DataFrame: 'Sample' (float), 'Timestamp', 'PPG_Rate' (BPM over the
+            interval ending at the beat; the first beat takes the second's)
+            and 'Quality' (1 good, 0 suspect)
+    """
+    import pandas as pd
+
+    peaks = np.asarray(peaks, dtype=np.float64)
+    rr = np.diff(peaks) / sampling_rate
+    if len(rr):
+        rr = np.concatenate([rr[:1], rr])
+    with np.errstate(divide='ignore'):
+        rates = 60 / rr
+
+    # Median of the surrounding intervals (edges padded with the nearest value)
+    half = RR_NEIGHBOURS // 2
+    if len(rr) > 1:
+        padded = np.pad(rr, half, mode='edge')
+        local = np.median(np.lib.stride_tricks.sliding_window_view(padded, RR_NEIGHBOURS), axis=1)
+    else:
+        local = rr
+    good = (rates >= RATE_RANGE[0]) & (rates <= RATE_RANGE[1]) & (np.abs(rr - local) <= RR_TOLERANCE * local)
+
+    if timestamps is not None:
+        times = sample_timestamps(peaks, timestamps)
+    elif start_time is not None:
+        times = pd.Timestamp(start_time) + pd.to_timedelta(peaks / sampling_rate, unit='s')
+    else:
+        raise ValueError("beats_from_peaks needs start_time or timestamps")
+
+    # Rounded well below the detection accuracy so the CSV stays compact
+    return pd.DataFrame({
+        'Sample': peaks.round(3),
+        'Timestamp': times.round('us'),
+        'PPG_Rate': rates.round(4),
+        'Quality': good.astype(np.int8),
+    })
+
+
+def sample_timestamps(positions, timestamps):
+    """
+    Timestamps at (fractional) sample positions, linearly interpolated on the
+    recorded timestamp of every sample
+
+    The interpolation runs on int64 nanoseconds from the first sample, so it
+    keeps nanosecond precision; positions outside the recording take the
+    first or last timestamp.
+    """
+    import pandas as pd
+
+    ns = np.asarray(timestamps, dtype='datetime64[ns]').astype(np.int64)
+    offsets = np.interp(np.asarray(positions, dtype=np.float64), np.arange(len(ns)), ns - ns[0])
+    return pd.DatetimeIndex(np.round(offsets).astype(np.int64) + ns[0])
+
+
+def write_beats(beats, path=BEATS_FILE):
+    """Write beat events as CSV (one row per beat instead of one per sample)"""
+    beats.to_csv(path, index=False, columns=BEAT_COLUMNS, date_format='%Y-%m-%d %H:%M:%S.%f')
+
+
+def read_beats(path=BEATS_FILE):
+    """Read beat events written by write_beats"""
+    import pandas as pd
+
+    return pd.read_csv(path, parse_dates=['Timestamp'])
+
+
+def read_beat_arrays(path=BEATS_FILE, min_quality=1):
+    """
+    Beat times (datetime64[us]) and rates of a beat file, with numpy only
+
+    Beats with a Quality below min_quality are left out.
+    """
+    with open(path) as f:
+        header = f.readline().strip().split(',')
+    data = np.loadtxt(path, delimiter=',', skiprows=1, dtype=str, ndmin=2)
+    keep = data[:, header.index('Quality')].astype(np.int64) >= min_quality
+    times = data[keep, header.index('Timestamp')].astype('datetime64[us]')
+    return times, data[keep, header.index('PPG_Rate')].astype(np.float64)
+
+
+def load_beats(path=BEATS_FILE):
+    """
+    Beat events for the analysis scripts: the session named by PPG_SESSION
+    in the result store (see beat_store.py) when set, otherwise the beat file
+    """
+    session = os.environ.get('PPG_SESSION')
+    if session:
+        from beat_store import STORE_ENV, STORE_FILE, BeatStore
+        with BeatStore(os.environ.get(STORE_ENV, STORE_FILE)) as store:
+            return store.beats(session)
+    return read_beats(path)
+
+
+def rate_series(beats, freq='1s', start=None, end=None, stats=('mean',), min_quality=1):
+    """
+    Regular-grid rate series computed on demand from beat events
+
+    Args:
+        beats (DataFrame): Beat events (see beats_from_peaks)
+        freq (str): Bin width, e.g. '2s' or '10s' (see rate_arrays)
+        start, end: Time range, within the first to last beat (default: all)
+        stats (tuple): Any of 'mean', 'min', 'max'
+        min_quality (int): Beats with a lower Quality are ignored
+
+    Returns:
+        DataFrame: 'Timestamp' (bin start) and 'PPG_Rate' for stats=('mean',),
+            otherwise 'Mean_Rate', 'Min_Rate', 'Max_Rate' for the requested stats
+    """
+    import pandas as pd
+
+    if 'Quality' in beats:
+        beats = beats[beats['Quality'] >= min_quality]
+    bounds = [None if b is None else pd.Timestamp(b).to_datetime64() for b in (start, end)]
+    bin_starts, columns = rate_arrays(beats['Timestamp'].to_numpy('datetime64[us]'),
+                                      beats['PPG_Rate'].to_numpy(dtype=np.float64), freq, *bounds, stats)
+    timestamps = bin_starts.astype('datetime64[ns]')
+    if tuple(stats) == ('mean',):
+        return pd.DataFrame({'Timestamp': timestamps, 'PPG_Rate': columns['mean']})
+    return pd.DataFrame({'Timestamp': timestamps, **{STAT_COLUMNS[s]: columns[s] for s in stats}})
+
+
+def rate_arrays(times, rates, freq='1s', start=None, end=None, stats=('mean',)):
+    """
+    Windowed rate statistics of beat events, with numpy only
+
+    The rate is the linear interpolation between beats (constant before the
+    first and after the last), as the per-sample PPG_Rate. Bin means are
+    exact integrals of that interpolation, not averages of samples, and bin
+    min/max come from the bin edges and the beats inside; the first and last
+    bins are cut at start and end. The cost is O(beats + bins) whatever the
+    frequency.
+
+    Args:
+        times (array): Beat times (datetime64), sorted
+        rates (array): Beat rates (BPM); NaN rates are ignored
+        freq (str or float): Bin width ('500ms', '2s', '10S', '1min', '1h' or
+            seconds); bins are aligned like DataFrame.resample, on multiples
+            of freq from midnight of the first day
+        start, end (datetime64): Time range, within the first to last beat (default: all)
+        stats (tuple): Any of 'mean', 'meansq' (mean of the squared rate,
+            for variances), 'min', 'max'
+
+    Returns:
+        tuple: (bin starts as datetime64[us], {stat: array})
+    """
+    times = np.asarray(times, dtype='datetime64[us]')
+    rates = np.asarray(rates, dtype=np.float64)
+    valid = np.isfinite(rates)
+    times, rates = times[valid], rates[valid]
+    if not len(times) and (start is None or end is None):
+        raise ValueError("No beats of the required quality; pass start and end for an empty series")
+    step = int(round(freq_seconds(freq) * 1e6))  # microseconds
+
+    # The rate is only known between the first and the last beat
+    start = times[0] if start is None else np.datetime64(start, 'us')
+    end = times[-1] if end is None else np.datetime64(end, 'us')
+    if len(times):
+        start, end = max(start, times[0]), min(end, times[-1])
+    day = start.astype('datetime64[D]').astype('datetime64[us]')
+    origin = day + (start - day).astype(np.int64) // step * step
+
+    # Seconds from the first bin keep the float arithmetic precise
+    t = (times - origin).astype(np.int64) / 1e6
+    r = rates
+    n_bins = int((end - origin).astype(np.int64) // step) + 1
+    width = step / 1e6
+    edges = np.arange(n_bins + 1) * width
+    bin_starts = origin + np.arange(n_bins) * np.timedelta64(step, 'us')
+    # The first and last bins only cover the part inside [start, end]
+    edges[0] = (start - origin).astype(np.int64) / 1e6
+    edges[-1] = min(edges[-1], (end - origin).astype(np.int64) / 1e6)
+    if not len(t):
+        t, r = np.array([0.0]), np.array([np.nan])
+
+    # Constant extension so the interpolation covers every edge
+    knots = np.concatenate([[min(edges[0], t[0]) - 1], t, [max(edges[-1], t[-1]) + 1]])
+    values = np.concatenate([[r[0]], r, [r[-1]]])
+    edge_values = np.interp(edges, knots, values)
+
+    columns = {}
+    k = np.clip(np.searchsorted(knots, edges, side='right') - 1, 0, len(knots) - 2)
+    if 'mean' in stats:
+        # Integral of the piecewise-linear rate from the first knot
+        area = np.concatenate([[0], np.cumsum(np.diff(knots) * (values[1:] + values[:-1]) / 2)])
+        integral = area[k] + (edges - knots[k]) * (values[k] + edge_values) / 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns['mean'] = np.where(np.diff(edges) > 0, np.diff(integral) / np.diff(edges), edge_values[:-1])
+    if 'meansq' in stats:
+        # Same for the squared rate: a linear segment a -> b integrates to L (a^2 + ab + b^2) / 3
+        a, b = values[:-1], values[1:]
+        area = np.concatenate([[0], np.cumsum(np.diff(knots) * (a * a + a * b + b * b) / 3)])
+        a, b = values[k], edge_values
+        integral = area[k] + (edges - knots[k]) * (a * a + a * b + b * b) / 3
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns['meansq'] = np.where(np.diff(edges) > 0, np.diff(integral) / np.diff(edges),
+                                         edge_values[:-1] ** 2)
+    if 'min' in stats or 'max' in stats:
+        # Beats inside each bin [edge_j, edge_j+1)
+        lo = np.searchsorted(t, edges[:-1], side='left')
+        hi = np.searchsorted(t, edges[1:], side='left')
+        has_beats = hi > lo
+        for name, reduce in (('min', np.minimum), ('max', np.maximum)):
+            if name not in stats:
+                continue
+            result = reduce(edge_values[:-1], edge_values[1:])
+            if has_beats.any():
+                inner = _bin_extreme(r, lo[has_beats], hi[has_beats], reduce)
+                result[has_beats] = reduce(result[has_beats], inner)
+            columns[name] = result
+    return bin_starts, columns
+
+
+def freq_seconds(freq):
+    """Width of a resample frequency ('500ms', '2s', '10S', '1min', '1h', or seconds) in seconds"""
+    if isinstance(freq, (int, float)):
+        return float(freq)
+    match = re.fullmatch(r'\s*(\d*\.?\d*)\s*([a-zA-Z]+)\s*', freq)
+    if not match or match.group(2).lower() not in FREQ_UNITS:
+        raise ValueError(f"Unsupported frequency {freq!r}")
+    return float(match.group(1) or 1) * FREQ_UNITS[match.group(2).lower()]
+
+
+def load_ppg_rate(freq='1s', beats_path=BEATS_FILE, rate_path=RATE_FILE):
+    """
+    PPG rate as a 'Timestamp', 'PPG_Rate' DataFrame for the analysis scripts
+
+    Uses the beat events of the PPG_SESSION store session or written by
+    process_ppg.py when they exist, and falls back to the per-sample rate CSV
+    of older runs (resampled to freq).
+    """
+    if os.environ.get('PPG_SESSION') or os.path.exists(beats_path):
+        return rate_series(load_beats(beats_path), freq)
+    import pandas as pd
+
+    ppg_df = pd.read_csv(rate_path)
+    ppg_df['Timestamp'] = pd.to_datetime(ppg_df['Timestamp'])
+    return ppg_df.set_index('Timestamp').resample(freq).mean().reset_index()
+
+
+def _bin_extreme(values, lo, hi, reduce):
+    """reduce (np.minimum / np.maximum) of values[lo:hi] for non-empty, non-overlapping ranges"""
+    bounds = np.empty(2 * len(lo), dtype=np.int64)
+    bounds[0::2] = lo
+    bounds[1::2] = hi
+    # reduceat over [lo, hi, lo, hi, ...]: the even entries are the bin ranges
+    padded = np.append(values, values[-1])
+    return reduce.reduceat(padded, bounds)[0::2]
@@ -0,0 +1,312 @@
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+STORE_FILE = 'ppg_results.db'
+# PPG_SESSION=<name> makes the analysis scripts read that session from the
+# store (PPG_STORE=<file>, default ppg_results.db) instead of the CSV files
+STORE_ENV = 'PPG_STORE'
+SESSION_ENV = 'PPG_SESSION'
+
+# Times are seconds since the epoch (naive timestamps, as in signal_cache.py);
+# every table is clustered on (session, time) so a time range of a session is
+# one index seek, whatever the size of the store
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    device TEXT,
+    source TEXT,
+    start_time REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_device ON sessions (device);
+CREATE TABLE IF NOT EXISTS beats (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    t REAL NOT NULL,
+    sample REAL,
+    rate REAL,
+    quality INTEGER,
+    PRIMARY KEY (session_id, t)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS window_stats (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    window_seconds REAL NOT NULL,
+    t REAL NOT NULL,
+    mean_rate REAL,
+    min_rate REAL,
+    max_rate REAL,
+    PRIMARY KEY (session_id, window_seconds, t)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (
+    session_id INTEGER NOT NULL REFERENCES sessions (id),
+    name TEXT NOT NULL,
+    t REAL NOT NULL,
+    value REAL,
+    PRIMARY KEY (session_id, name, t)
+) WITHOUT ROWID;
+"""
+
+
+def to_seconds(timestamps):
+    """Naive timestamps (scalar or array-like) as float seconds since the epoch"""
+    if np.ndim(timestamps) == 0:
+        return pd.Timestamp(timestamps).value / 1e9
+    return pd.to_datetime(pd.Series(timestamps)).astype('datetime64[ns]').astype(np.int64).to_numpy() / 1e9
+
+
+def from_seconds(seconds):
+    """Inverse of to_seconds, rounded to the microsecond"""
+    return pd.to_datetime(np.asarray(seconds, dtype=np.float64), unit='s').round('us')
+
+
+class BeatStore:
+    """
+    SQLite store of beats, windowed rate statistics and other time series
+    (sensor readings, reference rates) of many sessions
+
+    Sessions are named recordings, optionally tagged with a device. Adding
+    data replaces rows of the same session and time, so re-importing a file
+    is idempotent. Queries take a time range and read only the rows inside.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_session(self, name, device=None, source=None, start_time=None):
+        """
+        Create a session, or update the given fields of an existing one; the
+        source stays the first one recorded (the file imported first)
+
+        Returns:
+            int: Session id
+        """
+        start = None if start_time is None else to_seconds(start_time)
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO sessions (name) VALUES (?)", (name,))
+            self.conn.execute(
+                "UPDATE sessions SET device = COALESCE(?, device), source = COALESCE(source, ?), "
+                "start_time = COALESCE(?, start_time) WHERE name = ?", (device, source, start, name))
+        return self.session_id(name)
+
+    def session_id(self, name):
+        row = self.conn.execute("SELECT id FROM sessions WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"No session {name!r} in {self.path}")
+        return row[0]
+
+    def sessions(self, device=None):
+        """Sessions (name, device, source, start_time), optionally of one device"""
+        query = "SELECT name, device, source, start_time FROM sessions"
+        params = ()
+        if device is not None:
+            query += " WHERE device = ?"
+            params = (device,)
+        df = pd.read_sql_query(query + " ORDER BY name", self.conn, params=params)
+        df['start_time'] = from_seconds(df['start_time'])
+        return df
+
+    def add_beats(self, session, beats, device=None, source=None):
+        """
+        Add beat events (see beat_events.beats_from_peaks) to a session
+
+        The session start is derived from the sample positions and timestamps
+        of the beats when there are at least two.
+        """
+        t = to_seconds(beats['Timestamp'])
+        samples = beats['Sample'].to_numpy(dtype=np.float64)
+        start_time = None
+        if len(t) > 1 and t[-1] > t[0]:
+            sampling_rate = (samples[-1] - samples[0]) / (t[-1] - t[0])
+            start_time = from_seconds(t[0] - samples[0] / sampling_rate)
+        session_id = self.add_session(session, device, source, start_time)
+        rows = zip([session_id] * len(t), t.tolist(), samples.tolist(),
+                   beats['PPG_Rate'].astype(np.float64).tolist(), beats['Quality'].astype(int).tolist())
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO beats VALUES (?, ?, ?, ?, ?)", rows)
+        return len(t)
+
+    def add_window_stats(self, session, stats, window_seconds, device=None, source=None):
+        """Add windowed statistics ('Timestamp', 'Mean_Rate', 'Min_Rate', 'Max_Rate') to a session"""
+        session_id = self.add_session(session, device, source)
+        t = to_seconds(stats['Timestamp'])
+        columns = [stats[c].astype(np.float64).tolist() for c in ('Mean_Rate', 'Min_Rate', 'Max_Rate')]
+        rows = zip([session_id] * len(t), [float(window_seconds)] * len(t), t.tolist(), *columns)
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO window_stats VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(t)
+
+    def add_series(self, session, name, timestamps, values, device=None, source=None):
+        """Add a named time series (e.g. 'My sensor') to a session"""
+        session_id = self.add_session(session, device, source)
+        t = to_seconds(timestamps)
+        rows = zip([session_id] * len(t), [name] * len(t), t.tolist(),
+                   np.asarray(values, dtype=np.float64).tolist())
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?)", rows)
+        return len(t)
+
+    def beats(self, session, start=None, end=None, min_quality=0):
+        """Beats of a session in [start, end], as read_beats returns them"""
+        where, params = self._range(session, start, end)
+        df = pd.read_sql_query(
+            "SELECT sample AS Sample, t AS Timestamp, rate AS PPG_Rate, quality AS Quality FROM beats "
+            f"WHERE {where} AND quality >= ? ORDER BY t", self.conn, params=params + [min_quality])
+        df['Timestamp'] = from_seconds(df['Timestamp'])
+        return df
+
+    def window_stats(self, session, window_seconds, start=None, end=None):
+        """Windowed statistics of a session in [start, end], as calculate_10s_stats.py writes them"""
+        where, params = self._range(session, start, end)
+        df = pd.read_sql_query(
+            "SELECT t AS Timestamp, mean_rate AS Mean_Rate, min_rate AS Min_Rate, max_rate AS Max_Rate "
+            f"FROM window_stats WHERE {where} AND window_seconds = ? ORDER BY t",
+            self.conn, params=params + [float(window_seconds)])
+        df['Timestamp'] = from_seconds(df['Timestamp'])
+        return df
+
+    def series(self, session, name, start=None, end=None):
+        """A named series of a session in [start, end] ('Timestamp' and the series name as columns)"""
+        where, params = self._range(session, start, end)
+        df = pd.read_sql_query(f"SELECT t AS Timestamp, value FROM series WHERE {where} AND name = ? ORDER BY t",
+                               self.conn, params=params + [name])
+        df['Timestamp'] = from_seconds(df['Timestamp'])
+        return df.rename(columns={'value': name})
+
+    def rate_summary(self, start=None, end=None, device=None, sessions=None, min_quality=1):
+        """
+        Beat statistics per session over a time range, computed in SQLite
+
+        The mean rate is beats per minute of beat intervals (number of beats
+        over the summed intervals 60 / rate), not the plain mean of the
+        instantaneous rates, so it is not biased towards fast beats.
+
+        Args:
+            start, end: Time range (inclusive, optional)
+            device (str): Only sessions of this device
+            sessions (list): Only these sessions
+            min_quality (int): Beats with a lower Quality are ignored
+
+        Returns:
+            DataFrame: session, device, beats, mean_rate, min_rate, max_rate,
+                first_beat, last_beat
+        """
+        conditions = ["b.quality >= ?"]
+        params = [min_quality]
+        if start is not None:
+            conditions.append("b.t >= ?")
+            params.append(to_seconds(start))
+        if end is not None:
+            conditions.append("b.t <= ?")
+            params.append(to_seconds(end))
+        if device is not None:
+            conditions.append("s.device = ?")
+            params.append(device)
+        if sessions is not None:
+            conditions.append(f"s.name IN ({', '.join('?' * len(sessions))})")
+            params.extend(sessions)
+        df = pd.read_sql_query(
+            "SELECT s.name AS session, s.device AS device, COUNT(*) AS beats, "
+            "COUNT(*) / SUM(1.0 / b.rate) AS mean_rate, MIN(b.rate) AS min_rate, MAX(b.rate) AS max_rate, "
+            "MIN(b.t) AS first_beat, MAX(b.t) AS last_beat "
+            "FROM sessions s JOIN beats b ON b.session_id = s.id "
+            f"WHERE {' AND '.join(conditions)} GROUP BY s.id ORDER BY s.name", self.conn, params=params)
+        df['first_beat'] = from_seconds(df['first_beat'])
+        df['last_beat'] = from_seconds(df['last_beat'])
+        return df
+
+    def _range(self, session, start, end):
+        where = ["session_id = ?"]
+        params = [self.session_id(session)]
+        if start is not None:
+            where.append("t >= ?")
+            params.append(to_seconds(start))
+        if end is not None:
+            where.append("t <= ?")
+            params.append(to_seconds(end))
+        return ' AND '.join(where), params
+
+
+def import_csv(store, path, session, device=None, start_time=None):
+    """
+    Import a result CSV into a session, recognised by its columns
+
+    - beat events (Sample, Timestamp, PPG_Rate, Quality) go to the beats
+    - windowed statistics (Timestamp, Mean_Rate, Min_Rate, Max_Rate) go to
+      window_stats, with the window taken from the timestamp spacing
+    - anything else is a time column (first column; 'Timestamp' values or
+      seconds from start_time / the session start) followed by series, one
+      per numeric column (e.g. ppg_rate_every10s.csv, Ref_data.csv)
+
+    Returns:
+        int: Number of rows imported
+    """
+    df = pd.read_csv(path)
+    source = os.path.abspath(path)
+    if {'Sample', 'Timestamp', 'PPG_Rate', 'Quality'} <= set(df.columns):
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        return store.add_beats(session, df, device, source)
+    if {'Timestamp', 'Mean_Rate', 'Min_Rate', 'Max_Rate'} <= set(df.columns):
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        window = np.median(np.diff(to_seconds(df['Timestamp']))) if len(df) > 1 else 0.0
+        return store.add_window_stats(session, df, window, device, source)
+
+    time_column = df.columns[0]
+    if time_column == 'Timestamp':
+        timestamps = pd.to_datetime(df[time_column])
+    else:
+        if start_time is None:
+            store.add_session(session, device, source)
+            start_time = store.sessions().set_index('name').loc[session, 'start_time']
+        if pd.isna(start_time):
+            raise ValueError(f"{path} has times relative to the session start; pass start_time")
+        timestamps = pd.Timestamp(start_time) + pd.to_timedelta(df[time_column], unit='s')
+    count = 0
+    for column in df.columns[1:]:
+        if pd.api.types.is_numeric_dtype(df[column]):
+            count += store.add_series(session, column, timestamps, df[column], device, source)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-session store of beats, rate statistics and series")
+    parser.add_argument('--store', default=os.environ.get(STORE_ENV, STORE_FILE), help="SQLite store file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('import', help="Import result CSVs into a session")
+    add.add_argument('files', nargs='+')
+    add.add_argument('--session', required=True)
+    add.add_argument('--device', default=None)
+    add.add_argument('--start', default=None, help="Session start for CSVs with relative times")
+
+    commands.add_parser('sessions', help="List sessions").add_argument('--device', default=None)
+
+    summary = commands.add_parser('summary', help="Beat statistics per session over a time range")
+    summary.add_argument('--start', default=None)
+    summary.add_argument('--end', default=None)
+    summary.add_argument('--device', default=None)
+    summary.add_argument('--sessions', nargs='+', default=None)
+    args = parser.parse_args()
+
+    with BeatStore(args.store) as store:
+        if args.command == 'import':
+            for path in args.files:
+                count = import_csv(store, path, args.session, args.device, args.start)
+                print(f"Imported {count} rows of {path} into session {args.session}")
+        elif args.command == 'sessions':
+            print(store.sessions(args.device).to_string(index=False))
+        else:
+            print(store.rate_summary(args.start, args.end, args.device, args.sessions).round(2).to_string(index=False))
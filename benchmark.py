@@ -0,0 +1,285 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SAMPLING_RATE = 200
+SIZES = {
+    '5min': 5 * 60,
+    '1h': 60 * 60,
+    '8h': 8 * 60 * 60,
+    '24h': 24 * 60 * 60,
+}
+DATA_DIR = '.benchmark_data'
+EXCEL_MAX_ROWS = 1048575  # one sheet of an .xlsx holds 1048576 rows including the header
+SEGMENT_SECONDS = 3600
+
+
+def generate_recording(duration, sampling_rate=SAMPLING_RATE, seed=0):
+    """
+    Deterministic synthetic PPG, simulated one hour at a time
+
+    Each segment has its own heart rate (70-100 BPM) and random state derived
+    from `seed`, so a 24 h recording is not one hour repeated.
+
+    Returns:
+        tuple: (time in seconds, PPG samples)
+    """
+    import neurokit2 as nk
+
+    rng = np.random.default_rng(seed)
+    segments = []
+    for start in range(0, int(duration), SEGMENT_SECONDS):
+        seconds = min(SEGMENT_SECONDS, duration - start)
+        segments.append(nk.ppg_simulate(duration=seconds, sampling_rate=sampling_rate,
+                                        heart_rate=rng.uniform(70, 100),
+                                        random_state=int(rng.integers(2**31))))
+    ppg = np.concatenate(segments)
+    return np.arange(len(ppg)) / sampling_rate, ppg
+
+
+def write_recording(name, time_data, ppg, data_dir=DATA_DIR, sampling_rate=SAMPLING_RATE):
+    """
+    Write a synthetic recording in the formats the scripts read: a CSV laid
+    out like 5min.csv, a chunked store like convert_csv.py --store writes,
+    and an .xlsx like 5min_addtime.xlsx when it fits in one sheet
+
+    Returns:
+        dict: Format -> path
+    """
+    from signal_container import Signal
+    from signal_store import StoreWriter
+
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {'csv': os.path.join(data_dir, f'{name}.csv'),
+             'store': os.path.join(data_dir, f'{name}.store')}
+    if not os.path.exists(paths['csv']):
+        pd.DataFrame({'Time': time_data, 'PPG (Pulse)': ppg}).to_csv(paths['csv'], index=False)
+    if not os.path.exists(os.path.join(paths['store'], 'meta.json')):
+        compact = Signal.from_values(ppg, sampling_rate)
+        writer = StoreWriter(paths['store'], [{'name': 'PPG (Pulse)', 'units': 'Volts',
+                                               'sampling_rate': sampling_rate,
+                                               'dtype': compact.samples.dtype, 'scale': compact.scale,
+                                               'offset': compact.offset}])
+        writer.append(0, compact.samples)
+        writer.close()
+    if len(ppg) <= EXCEL_MAX_ROWS:
+        paths['xlsx'] = os.path.join(data_dir, f'{name}.xlsx')
+        if not os.path.exists(paths['xlsx']):
+            timestamps = pd.Timestamp('2025-07-26 11:42:47') + pd.to_timedelta(time_data, unit='s')
+            pd.DataFrame({'Timestamp': timestamps, 'PPG': ppg}).to_excel(paths['xlsx'], index=False)
+    return paths
+
+
+def measure(func, *args, memory=True):
+    """
+    Time a call, then trace its peak Python/numpy allocation in a second call
+
+    The timing run is not traced, since tracemalloc slows allocation-heavy
+    code down.
+
+    Returns:
+        tuple: (result of the timed call, {'seconds': ..., 'peak_mb': ...})
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args)
+    metrics = {'seconds': round(time.perf_counter() - start, 4)}
+
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(*args)
+            metrics['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        finally:
+            tracemalloc.stop()
+    return result, metrics
+
+
+def benchmark_size(name, duration, data_dir=DATA_DIR, memory=True, xlsx=True):
+    """
+    Run every benchmarked stage on one synthetic recording
+
+    Stages: loading the CSV (pandas parse and signal cache), the store and
+    the .xlsx, nk.ppg_process at the recorded and the canonical rate,
+    compute_calibration_data, the 10 s statistics of the beat events (the
+    rollup pyramid of calculate_10s_stats.py: build and query, and
+    beat_events.rate_arrays) and get_averaged_values of process_2sec.py. A stage that fails (e.g.
+    out of memory) is recorded with its error and the others still run.
+
+    Returns:
+        dict: Stage -> metrics
+    """
+    from beat_events import beats_from_peaks, rate_arrays
+    from extract_calibration import compute_calibration_data
+    from process_2sec import get_averaged_values
+    from resample import ppg_process_resampled
+    from rollup import RatePyramid
+    from signal_cache import load_signal
+    from signal_store import read_store
+
+    time_data, ppg = generate_recording(duration, seed=int(duration))
+    paths = write_recording(name, time_data, ppg, data_dir)
+    cache_dir = os.path.join(data_dir, f'{name}.signal_cache')
+    excel_cache_dir = os.path.join(data_dir, f'{name}.excel_cache')
+    results = {'samples': len(ppg)}
+
+    def run(stage, func, *args, traced=memory):
+        try:
+            value, metrics = measure(func, *args, memory=traced)
+        except MemoryError as e:
+            value, metrics = None, {'error': f'MemoryError: {e}'}
+        results[stage] = metrics
+        print(f"  {stage:22s} {json.dumps(metrics)}")
+        return value
+
+    def load_csv_cached():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return np.asarray(load_signal(paths['csv'], 1, cache_dir))
+
+    def load_xlsx():
+        from excel_cache import read_excel_cached
+        shutil.rmtree(excel_cache_dir, ignore_errors=True)
+        return read_excel_cached(paths['xlsx'], columns=['Timestamp', 'PPG'], cache_dir=excel_cache_dir)
+
+    run('load_csv_pandas', pd.read_csv, paths['csv'])
+    run('load_csv_cold_cache', load_csv_cached)
+    run('load_csv_warm_cache', lambda: np.asarray(load_signal(paths['csv'], 1, cache_dir)))
+    run('load_store', read_store, paths['store'])
+    if xlsx and 'xlsx' in paths:
+        run('load_xlsx', load_xlsx)
+
+    run('ppg_process', _ppg_process, ppg, SAMPLING_RATE)
+    processed = run('ppg_process_50hz', ppg_process_resampled, ppg, SAMPLING_RATE)
+
+    cal = run('extract_calibration', lambda: compute_calibration_data(time_data, ppg, window_size=1)[0])
+
+    if processed is not None:
+        beats = beats_from_peaks(processed[2] * SAMPLING_RATE, SAMPLING_RATE, start_time='2025-07-26 11:42:47')
+        beats = beats[beats['Quality'] == 1]
+        times, rates = beats['Timestamp'].to_numpy('datetime64[us]'), beats['PPG_Rate'].to_numpy()
+        pyramid = run('rollup_build', RatePyramid.from_beats, times, rates)
+        if pyramid is not None:
+            run('rollup_query_10s', pyramid.query, '10s')
+        run('rate_arrays_10s', lambda: rate_arrays(times, rates, '10s', stats=('mean', 'min', 'max')))
+
+    if cal is not None:
+        targets = np.arange(cal['Time (s)'].min(), cal['Time (s)'].max(), 2.0)
+        run('get_averaged_values', get_averaged_values, cal, targets)
+    return results
+
+
+def _ppg_process(ppg, sampling_rate):
+    import neurokit2 as nk
+    return nk.ppg_process(ppg, sampling_rate=sampling_rate)[0]
+
+
+def environment():
+    """Version information stored with the results"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def check_budgets(results, budgets):
+    """
+    Compare results against budgets of the form {size: {stage: {metric: limit}}}
+
+    Returns:
+        list: One message per exceeded budget or failed budgeted stage
+    """
+    violations = []
+    for size, stages in budgets.items():
+        for stage, limits in stages.items():
+            metrics = results.get(size, {}).get(stage)
+            if metrics is None:
+                continue
+            if 'error' in metrics:
+                violations.append(f"{size}/{stage}: {metrics['error']}")
+                continue
+            for metric, limit in limits.items():
+                if metric in metrics and metrics[metric] > limit:
+                    violations.append(f"{size}/{stage}: {metric} {metrics[metric]} > budget {limit}")
+    return violations
+
+
+def compare_runs(baseline, results, tolerance=0.25):
+    """
+    Stages that got slower or bigger than a previous run by more than `tolerance`
+
+    Returns:
+        list: One message per regression
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, metrics in stages.items():
+            old = baseline.get(size, {}).get(stage)
+            if not isinstance(metrics, dict) or not isinstance(old, dict):
+                continue
+            for metric in ('seconds', 'peak_mb'):
+                if metric in metrics and old.get(metric):
+                    change = metrics[metric] / old[metric] - 1
+                    if change > tolerance:
+                        regressions.append(f"{size}/{stage}: {metric} {old[metric]} -> {metrics[metric]} (+{change:.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and memory-profile the pipeline stages on synthetic PPG")
+    parser.add_argument('--sizes', nargs='+', default=list(SIZES), choices=list(SIZES),
+                        help="Recording lengths to benchmark (default: all)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Results JSON")
+    parser.add_argument('--budgets', help="Budgets JSON; exit with status 1 if one is exceeded")
+    parser.add_argument('--baseline', help="Previous results JSON to report regressions against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slow-down against the baseline")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Where the synthetic recordings are kept")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced memory runs")
+    parser.add_argument('--no-xlsx', action='store_true', help="Skip the .xlsx load")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        print(f"{size} ({SIZES[size]} s at {SAMPLING_RATE} Hz)")
+        results[size] = benchmark_size(size, SIZES[size], args.data_dir,
+                                       memory=not args.no_memory, xlsx=not args.no_xlsx)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_runs(json.load(f)['results'], results, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        failed |= bool(regressions)
+    if args.budgets:
+        with open(args.budgets) as f:
+            violations = check_budgets(results, json.load(f))
+        for message in violations:
+            print(f"OVER BUDGET {message}")
+        failed |= bool(violations)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def beat_windows(n, window_size):
+    """
+    Split n beats into consecutive windows of window_size beats
+
+    Only full windows are kept, like the original per-window loop.
+
+    Returns:
+        tuple: (start index of each window, end index of the last window)
+    """
+    num_windows = n // window_size
+    return np.arange(num_windows) * window_size, num_windows * window_size
+
+
+def time_windows(times, window_seconds, start=None):
+    """
+    Split sorted beat times into consecutive windows of window_seconds
+
+    Windows are aligned on `start` (default: the first beat) and windows
+    without any beat are dropped.
+
+    Returns:
+        tuple: (start index of each window, end index of the last window)
+    """
+    times = np.asarray(times)
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int64), 0
+    if start is None:
+        start = times[0]
+    window_ids = np.floor((times - start) / window_seconds).astype(np.int64)
+    starts = np.flatnonzero(np.diff(window_ids, prepend=window_ids[0] - 1))
+    return starts, len(times)
+
+
+def aggregate_windows(values, starts, end):
+    """
+    Mean, std, min and max of values in every window in one vectorized pass
+
+    Args:
+        values (array): Values to aggregate, e.g. beat-to-beat rates
+        starts (array): Index of the first value of each non-empty window
+        end (int): Index one past the last value of the last window
+
+    Returns:
+        dict: 'mean', 'std', 'min', 'max' and 'count' arrays, one entry per window
+    """
+    values = np.asarray(values, dtype=np.float64)[:end]
+    starts = np.asarray(starts, dtype=np.int64)
+    if len(starts) == 0:
+        empty = np.empty(0)
+        return {'mean': empty, 'std': empty, 'min': empty, 'max': empty,
+                'count': np.empty(0, dtype=np.int64)}
+
+    counts = np.diff(np.append(starts, end))
+    means = np.add.reduceat(values, starts) / counts
+    # Deviations from each window's own mean keep the std numerically stable
+    deviations = values[starts[0]:] - np.repeat(means, counts)
+    variances = np.add.reduceat(deviations ** 2, starts - starts[0]) / counts
+    return {
+        'mean': means,
+        'std': np.sqrt(variances),
+        'min': np.minimum.reduceat(values, starts),
+        'max': np.maximum.reduceat(values, starts),
+        'count': counts,
+    }
@@ -1,25 +1,28 @@
+import os
 import pandas as pd
-
-# อ่านข้อมูลจากไฟล์
-df = pd.read_csv('5min_addtime_with_rate.csv')
-df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+from beat_events import load_beats
+from beat_store import SESSION_ENV
+from rollup import RatePyramid, load_pyramid, rollup_series
+from profiler import stage
+
+# อ่าน rollup pyramid ของไฟล์ beat จาก process_ppg.py (สร้างใหม่เมื่อไฟล์ beat เปลี่ยน)
+# หรือสร้างจาก session ใน result store เมื่อกำหนด PPG_SESSION
+with stage('load_pyramid'):
+    if os.environ.get(SESSION_ENV):
+        beats = load_beats()
+        beats = beats[beats['Quality'] >= 1]
+        pyramid = RatePyramid.from_beats(beats['Timestamp'].to_numpy('datetime64[us]'), beats['PPG_Rate'].to_numpy())
+    else:
+        pyramid = load_pyramid()
 
 # กำหนดเวลาเริ่มต้น
 start_time = pd.Timestamp('2025-07-26 11:42:47')
 end_time = start_time + pd.Timedelta(minutes=5)
 
-# กรองข้อมูลในช่วงเวลาที่ต้องการ
-mask = (df['Timestamp'] >= start_time) & (df['Timestamp'] <= end_time)
-df_filtered = df[mask]
-
-# จัดกลุ่มข้อมูลทุก 10 วินาที และคำนวณค่าสถิติ
-df_resampled = df_filtered.set_index('Timestamp').resample('10S').agg({
-    'PPG_Rate': ['mean', 'min', 'max']
-}).round(2)
-
-# ปรับรูปแบบคอลัมน์
-df_resampled.columns = ['Mean_Rate', 'Min_Rate', 'Max_Rate']
-df_resampled = df_resampled.reset_index()
+# คำนวณค่าสถิติทุก 10 วินาทีในช่วงเวลาที่ต้องการ โดยรวม cell ของ pyramid (ไม่อ่าน beat ซ้ำ)
+with stage('rollup_10s'):
+    df_resampled = rollup_series(pyramid, '10s', start_time, end_time,
+                                 stats=('mean', 'min', 'max')).round(2)
 
 # บันทึกผลลัพธ์
 df_resampled.to_csv('every10second_attime.csv', index=False)
@@ -0,0 +1,250 @@
+import argparse
+import bisect
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+MODELS_FILE = 'calibration_models.json'
+KINDS = ('linear', 'piecewise', 'isotonic')
+
+
+class CalibrationModel:
+    """
+    Sensor calibration as a piecewise-linear lookup table raw -> reference
+
+    Every kind of fit (linear, piecewise, isotonic) ends up as sorted knots
+    (x, y); applying the model is np.interp over the knots, so millions of
+    readings are calibrated in one vectorized call. Outside the knots the
+    model either continues the end segments ('linear') or holds the end
+    values ('constant'). NaN readings stay NaN.
+    """
+
+    def __init__(self, x, y, kind='linear', extrapolate='linear', info=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.kind = kind
+        self.extrapolate = extrapolate
+        self.info = info or {}
+        # Plain lists for the per-sample path (bisect is faster than numpy on scalars)
+        self._x = self.x.tolist()
+        self._y = self.y.tolist()
+
+    def apply(self, raw):
+        """
+        Calibrate an array of raw readings
+
+        Args:
+            raw (array): Raw readings (any numeric dtype, NaN for missing)
+
+        Returns:
+            array: Calibrated readings (float64, same shape)
+        """
+        raw = np.asarray(raw, dtype=np.float64)
+        out = np.interp(raw, self.x, self.y)
+        if self.extrapolate == 'linear' and len(self.x) > 1:
+            below = raw < self.x[0]
+            above = raw > self.x[-1]
+            out[below] = self.y[0] + (raw[below] - self.x[0]) * self._slope(0)
+            out[above] = self.y[-1] + (raw[above] - self.x[-1]) * self._slope(-1)
+        return out
+
+    def __call__(self, value):
+        """Calibrate one reading (for streaming, one sample at a time)"""
+        x, y = self._x, self._y
+        if value != value:  # NaN
+            return value
+        i = bisect.bisect_right(x, value)
+        if 0 < i < len(x):
+            return y[i - 1] + (value - x[i - 1]) * (y[i] - y[i - 1]) / (x[i] - x[i - 1])
+        end = 0 if i == 0 else -1
+        if self.extrapolate == 'linear' and len(x) > 1:
+            return y[end] + (value - x[end]) * self._slope(end)
+        return y[end]
+
+    def _slope(self, end):
+        """Slope of the first (end=0) or last (end=-1) segment; 0 for a zero-width one"""
+        i = 0 if end == 0 else len(self.x) - 2
+        width = self.x[i + 1] - self.x[i]
+        return (self.y[i + 1] - self.y[i]) / width if width else 0.0
+
+    def to_dict(self):
+        return {'kind': self.kind, 'extrapolate': self.extrapolate,
+                'x': self.x.tolist(), 'y': self.y.tolist(), **self.info}
+
+    @classmethod
+    def from_dict(cls, d):
+        info = {k: v for k, v in d.items() if k not in ('kind', 'extrapolate', 'x', 'y')}
+        return cls(d['x'], d['y'], d['kind'], d['extrapolate'], info)
+
+
+def fit_linear(raw, reference):
+    """Least-squares line, stored as its two end knots"""
+    if not len(raw) or np.ptp(raw) == 0:
+        raise ValueError("A calibration line needs at least two distinct raw readings")
+    slope, intercept = np.polyfit(raw, reference, 1)
+    x = np.array([np.min(raw), np.max(raw)])
+    return CalibrationModel(x, slope * x + intercept, 'linear', 'linear')
+
+
+def fit_piecewise(raw, reference, n_segments=3):
+    """
+    Continuous piecewise-linear least-squares fit with knots at quantiles of raw
+
+    Args:
+        n_segments (int): Number of segments (reduced when raw has few distinct values)
+    """
+    knots = np.unique(np.quantile(raw, np.linspace(0, 1, n_segments + 1)))
+    if len(knots) < 3:
+        return fit_linear(raw, reference)
+    # Hinge basis: 1, x, max(x - k, 0) for the inner knots
+    basis = np.column_stack([np.ones(len(raw)), raw] + [np.maximum(raw - k, 0) for k in knots[1:-1]])
+    coef = np.linalg.lstsq(basis, reference, rcond=None)[0]
+    knot_basis = np.column_stack([np.ones(len(knots)), knots] + [np.maximum(knots - k, 0) for k in knots[1:-1]])
+    return CalibrationModel(knots, knot_basis @ coef, 'piecewise', 'linear')
+
+
+def fit_isotonic(raw, reference, increasing=True):
+    """
+    Isotonic (monotone) regression by pool-adjacent-violators
+
+    Readings with the same raw value are pooled first; the fitted value of
+    each distinct raw value becomes a knot, and the ends are held constant.
+    """
+    df = pd.DataFrame({'x': raw, 'y': reference}).groupby('x')['y'].agg(['sum', 'count'])
+    x = df.index.to_numpy(dtype=np.float64)
+    sign = 1 if increasing else -1
+    # Blocks of [sum, count, number of distinct x]
+    blocks = []
+    for total, count in zip(sign * df['sum'].to_numpy(), df['count'].to_numpy()):
+        blocks.append([total, count, 1])
+        while len(blocks) > 1 and blocks[-2][0] / blocks[-2][1] >= blocks[-1][0] / blocks[-1][1]:
+            total, count, width = blocks.pop()
+            blocks[-1][0] += total
+            blocks[-1][1] += count
+            blocks[-1][2] += width
+    y = np.repeat([sign * b[0] / b[1] for b in blocks], [b[2] for b in blocks])
+    return CalibrationModel(x, y, 'isotonic', 'constant')
+
+
+def fit(raw, reference, kind='linear', **kwargs):
+    """
+    Fit a calibration model on (raw, reference) pairs, ignoring pairs with NaN
+
+    Args:
+        raw (array): Sensor readings
+        reference (array): Reference readings at the same times
+        kind (str): 'linear', 'piecewise' or 'isotonic'
+        **kwargs: Passed to the fit function (e.g. n_segments)
+
+    Returns:
+        CalibrationModel: with n, mae_before and mae_after in its info
+    """
+    raw = np.asarray(raw, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    valid = np.isfinite(raw) & np.isfinite(reference)
+    raw, reference = raw[valid], reference[valid]
+    fitters = {'linear': fit_linear, 'piecewise': fit_piecewise, 'isotonic': fit_isotonic}
+    if kind not in fitters:
+        raise ValueError(f"Unknown calibration kind {kind!r}, expected one of {KINDS}")
+    model = fitters[kind](raw, reference, **kwargs)
+    model.info.update({
+        'n': int(len(raw)),
+        'mae_before': float(np.mean(np.abs(raw - reference))),
+        'mae_after': float(np.mean(np.abs(model.apply(raw) - reference))),
+    })
+    return model
+
+
+def save_models(models, path=MODELS_FILE):
+    """Save {device: CalibrationModel} as JSON (other devices already in the file are kept)"""
+    stored = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+    stored.update({device: model.to_dict() for device, model in models.items()})
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(stored, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_models(path=MODELS_FILE):
+    """Load the {device: CalibrationModel} saved by save_models"""
+    with open(path) as f:
+        return {device: CalibrationModel.from_dict(d) for device, d in json.load(f).items()}
+
+
+def sensor_pairs(path='Calibration.xlsx'):
+    """(Sensor, Biopac) pairs of the calibration session, one every 10 s"""
+    from excel_cache import read_excel_cached
+
+    df = read_excel_cached(path, columns=['Sensor', 'Biopac'])
+    return pd.to_numeric(df['Sensor'], errors='coerce'), pd.to_numeric(df['Biopac'], errors='coerce')
+
+
+def cloud_pairs(path='Example_data.csv'):
+    """(Raw HR, Calibrated HR) pairs of a cloud export, sentinels removed"""
+    from cloud_ingest import clean_export
+
+    df = clean_export(pd.read_csv(path))
+    return df['Raw HR'], df['Calibrated HR']
+
+
+def recalibrate_store(store_dir, model):
+    """
+    Recompute 'Calibrated HR' from 'Raw HR' for every row of a cloud store
+    (see cloud_ingest.py), e.g. after a firmware change
+
+    Each part file is rewritten with one vectorized model.apply call.
+
+    Returns:
+        int: Number of rows recalibrated
+    """
+    from cloud_ingest import CloudStore
+
+    store = CloudStore(store_dir)
+    n_rows = 0
+    for part in store.meta['parts']:
+        path = store._part_path(part['file'])
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+        columns['Calibrated HR'] = model.apply(columns['Raw HR']).astype(np.float32)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, path)
+        n_rows += len(columns['Raw HR'])
+    return n_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit, save and apply sensor calibration models")
+    parser.add_argument('--models', default=MODELS_FILE, help="Model JSON file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fit_parser = commands.add_parser('fit', help="Fit the sensor (Calibration.xlsx) and cloud (Example_data.csv) models")
+    fit_parser.add_argument('--kind', choices=KINDS, default='linear')
+    fit_parser.add_argument('--segments', type=int, default=3, help="Segments of a piecewise model")
+
+    apply_parser = commands.add_parser('recalibrate', help="Recompute Calibrated HR of a cloud store")
+    apply_parser.add_argument('store', help="Cloud store directory (cloud_ingest.py --store)")
+    apply_parser.add_argument('--device', default='cloud', help="Model to apply")
+    args = parser.parse_args()
+
+    if args.command == 'fit':
+        kwargs = {'n_segments': args.segments} if args.kind == 'piecewise' else {}
+        models = {
+            'sensor': fit(*sensor_pairs(), kind=args.kind, **kwargs),
+            'cloud': fit(*cloud_pairs(), kind=args.kind, **kwargs),
+        }
+        save_models(models, args.models)
+        for device, model in models.items():
+            print(f"{device}: {model.kind} fit on {model.info['n']} pairs, "
+                  f"MAE {model.info['mae_before']:.2f} -> {model.info['mae_after']:.2f} BPM")
+        print(f"Saved models to {args.models}")
+    else:
+        model = load_models(args.models)[args.device]
+        n_rows = recalibrate_store(args.store, model)
+        print(f"Recalibrated {n_rows} rows of {args.store} with the {args.device} {model.kind} model")
@@ -0,0 +1,267 @@
+import argparse
+import os
+
+import numpy as np
+from scipy.signal import butter, find_peaks, sosfiltfilt
+
+from profiler import stage
+from resample import refine_peaks
+
+BEAT_COLUMNS = 'Time (s),PPG_Rate,Amplitude'
+
+
+class BeatDetector:
+    """
+    Beat detection of extract_calibration.py (3rd order 0.5-5 Hz zero-phase
+    bandpass, find_peaks with a 1/3 s refractory distance) applied to one
+    block of a longer signal
+
+    The block is read with `margin` extra samples on each side so the
+    zero-phase filter and the peak prominences see the same neighbourhood as
+    in a whole-signal run; only peaks inside the block's core are returned.
+    The filtered signal has zero mean, so height=0 stands in for the
+    whole-signal np.mean(ppg_filtered).
+    """
+
+    def __init__(self, sampling_rate, lowcut=0.5, highcut=5, order=3, refractory=1/3,
+                 prominence=0.1, margin_seconds=5.0):
+        self.sampling_rate = sampling_rate
+        nyq = sampling_rate / 2
+        self.sos = butter(order, [lowcut/nyq, highcut/nyq], btype='band', output='sos')
+        self.distance = max(1, int(sampling_rate * refractory))
+        self.prominence = prominence
+        self.margin = int(np.ceil(margin_seconds * sampling_rate))
+
+    def blocks(self, n_samples, block_samples):
+        """Core ranges (start, stop) covering n_samples in blocks of block_samples"""
+        starts = np.arange(0, n_samples, block_samples)
+        return [(int(s), int(min(s + block_samples, n_samples))) for s in starts]
+
+    def detect(self, read, start, stop, n_samples):
+        """
+        Peaks of the core [start, stop) of a signal
+
+        Args:
+            read (callable): read(first, last) returns samples [first, last)
+            start, stop (int): Core range (absolute sample indexes)
+            n_samples (int): Total signal length
+
+        Returns:
+            tuple: (sub-sample peak positions, filtered peak heights, raw
+                amplitudes), absolute sample positions sorted in time
+        """
+        first = max(start - self.margin, 0)
+        last = min(stop + self.margin, n_samples)
+        raw = np.asarray(read(first, last), dtype=np.float64)
+        # sosfiltfilt needs more samples than its default padding
+        if len(raw) <= 3 * (2 * len(self.sos) + 1):
+            return np.empty(0), np.empty(0), np.empty(0)
+        filtered = sosfiltfilt(self.sos, raw)
+
+        peaks, _ = find_peaks(filtered, distance=self.distance, height=0.0,
+                              prominence=self.prominence)
+        core = (peaks + first >= start) & (peaks + first < stop)
+        peaks = peaks[core]
+        return refine_peaks(filtered, peaks) + first, filtered[peaks], raw[peaks]
+
+
+class BeatStitcher:
+    """
+    Merge the peaks of consecutive blocks into one beat sequence
+
+    Peaks on both sides of a block boundary can be closer than the refractory
+    distance; as find_peaks does, only the higher one is kept. The last beat
+    of every block is held back until the next block is seen, so beats that
+    have been emitted are final.
+    """
+
+    def __init__(self, distance, sampling_rate):
+        self.distance = distance
+        self.sampling_rate = sampling_rate
+        self._held = None  # (position, height, amplitude) of the last beat
+        self._previous = None  # position of the last emitted beat
+
+    def add(self, positions, heights, amplitudes):
+        """
+        Add the peaks of the next block
+
+        Returns:
+            tuple: (beat times in s, rates in BPM, amplitudes) of the beats now final
+        """
+        beats = list(zip(positions, heights, amplitudes))
+        if self._held is not None:
+            while beats and beats[0][0] - self._held[0] < self.distance:
+                if beats[0][1] > self._held[1]:
+                    self._held = None
+                    break
+                beats.pop(0)
+            if self._held is not None:
+                beats.insert(0, self._held)
+        if not beats:
+            self._held = None
+            return _no_beats()
+        self._held = beats.pop()
+        return self._emit(beats)
+
+    def flush(self):
+        """Emit the held-back last beat"""
+        beats = [] if self._held is None else [self._held]
+        self._held = None
+        return self._emit(beats)
+
+    def _emit(self, beats):
+        if not beats:
+            return _no_beats()
+        positions = np.array([b[0] for b in beats])
+        amplitudes = np.array([b[2] for b in beats])
+        previous = [np.nan] if self._previous is None else [self._previous]
+        rates = 60 * self.sampling_rate / np.diff(np.concatenate([previous, positions]))
+        self._previous = positions[-1]
+        return positions / self.sampling_rate, rates, amplitudes
+
+
+def array_reader(signal):
+    """read(first, last) over an in-memory or memory-mapped array"""
+    return lambda first, last: signal[first:last]
+
+
+def store_reader(store_dir, channel=0):
+    """
+    read(first, last) over a channel of a chunked store (see signal_store.py)
+
+    Blocks are returned as Signal objects in the stored dtype (e.g. raw int16
+    counts) and only converted to float by BeatDetector.detect.
+
+    Returns:
+        tuple: (read function, number of samples, sampling rate)
+    """
+    from signal_store import read_signal, read_store_meta
+
+    meta = read_store_meta(store_dir)
+    info = meta['channels'][channel] if isinstance(channel, int) else \
+        next(c for c in meta['channels'] if c['name'] == channel)
+    fs = info['sampling_rate']
+
+    def read(first, last):
+        # Sample times are index / fs; the half-sample shift keeps float rounding off the edges
+        return read_signal(store_dir, channel, (first - 0.5) / fs, (last - 0.5) / fs, meta=meta)
+    return read, info['n_samples'], fs
+
+
+def process_chunked(read, n_samples, sampling_rate, output=None, block_seconds=600,
+                    margin_seconds=5.0, **detector_kwargs):
+    """
+    Detect beats block by block, so memory stays bounded by the block size
+
+    Args:
+        read (callable): read(first, last) returns samples [first, last), e.g.
+            array_reader(np.load(path, mmap_mode='r')) or store_reader(...)[0]
+        n_samples (int): Signal length
+        sampling_rate (float): Sampling rate (Hz)
+        output (str): CSV the beats are streamed to ('Time (s)', 'PPG_Rate',
+            'Amplitude'), written block by block (optional)
+        block_seconds (float): Core length of each block (s)
+        margin_seconds (float): Overlap read on each side of a block (s)
+        **detector_kwargs: Passed to BeatDetector
+
+    Returns:
+        tuple: (beat times in s, rates in BPM) of the whole recording
+    """
+    detector = BeatDetector(sampling_rate, margin_seconds=margin_seconds, **detector_kwargs)
+    blocks = detector.blocks(n_samples, block_samples(detector, block_seconds))
+
+    def detect_all():
+        for start, stop in blocks:
+            with stage('detect_block', rows=stop - start):
+                found = detector.detect(read, start, stop, n_samples)
+            yield found
+    return stitch_blocks(detect_all(), detector, output)
+
+
+def block_samples(detector, block_seconds):
+    """Core block length in samples (at least one refractory distance)"""
+    return max(int(block_seconds * detector.sampling_rate), detector.distance)
+
+
+def stitch_blocks(found_blocks, detector, output=None):
+    """
+    Stitch the peaks of consecutive blocks, in block order, and stream the beats
+
+    Args:
+        found_blocks (iterable): BeatDetector.detect results, one per block
+        detector (BeatDetector): The detector that produced them
+        output (str): Beat CSV (optional)
+
+    Returns:
+        tuple: (beat times in s, rates in BPM)
+    """
+    stitcher = BeatStitcher(detector.distance, detector.sampling_rate)
+    writer = _BeatWriter(output)
+    try:
+        for found in found_blocks:
+            writer.write(*stitcher.add(*found))
+        writer.write(*stitcher.flush())
+    finally:
+        writer.close()
+    return writer.times(), writer.rates()
+
+
+class _BeatWriter:
+    """Streams beats to a CSV and keeps only the (small) time and rate arrays"""
+
+    def __init__(self, path):
+        self.file = None
+        if path:
+            tmp_path = path + '.tmp'
+            self.path, self.tmp_path = path, tmp_path
+            self.file = open(tmp_path, 'w')
+            self.file.write(BEAT_COLUMNS + '\n')
+        self._times = []
+        self._rates = []
+
+    def write(self, times, rates, amplitudes):
+        if not len(times):
+            return
+        self._times.append(times)
+        self._rates.append(rates)
+        if self.file:
+            np.savetxt(self.file, np.column_stack([times, rates, amplitudes]), delimiter=',', fmt='%.6f')
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            os.replace(self.tmp_path, self.path)
+
+    def times(self):
+        return np.concatenate(self._times) if self._times else np.empty(0)
+
+    def rates(self):
+        return np.concatenate(self._rates) if self._rates else np.empty(0)
+
+
+def _no_beats():
+    return np.empty(0), np.empty(0), np.empty(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect beats of a long recording in bounded memory")
+    parser.add_argument('source', help="Chunked store directory (convert_csv.py --store) or CSV/Excel recording")
+    parser.add_argument('--output', default=None, help="Beat CSV (default: <source>_beats.csv)")
+    parser.add_argument('--block', type=float, default=600, help="Block length (s)")
+    parser.add_argument('--margin', type=float, default=5.0, help="Overlap on each side of a block (s)")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        read, n_samples, sampling_rate = store_reader(args.source)
+    else:
+        from resample import sampling_rate_from_times
+        from signal_cache import load_signal
+        signal = load_signal(args.source, 1)  # memory-mapped: blocks are paged in as read
+        read, n_samples = array_reader(signal), len(signal)
+        sampling_rate = sampling_rate_from_times(load_signal(args.source, 0)[:1000])
+
+    output = args.output or os.path.splitext(args.source.rstrip('/\\'))[0] + '_beats.csv'
+    times, rates = process_chunked(read, n_samples, sampling_rate, output, args.block, args.margin)
+    print(f"Detected {len(times)} beats, mean rate {np.nanmean(rates):.2f} BPM")
+    print(f"Saved beats to {output}")
@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+TIME_COLUMN = 'created_at'
+ID_COLUMN = 'entry_id'
+
+# Value columns of the cloud export and the sentinel each one uses for "no reading"
+VALUE_COLUMNS = {
+    'Calibrated HR': 0,
+    'Raw HR': -1,
+    'SpO2': 0,
+}
+CHECK_BYTES = 4096  # bytes before the resume offset used to detect a rewritten file
+# An export not modified for this long is complete, so its last line counts
+# even without a trailing newline
+SETTLE_SECONDS = 60
+
+
+def iter_export_chunks(path, start=0, chunk_bytes=16 << 20, final=False):
+    """
+    Read a cloud export (Example_data.csv schema) in blocks of whole lines
+
+    Args:
+        path (str): Path to the export CSV
+        start (int): Byte offset to resume from (0 or before the first data line
+            starts right after the header)
+        chunk_bytes (int): Approximate size of each block
+        final (bool): The export is complete: a last line without a newline
+            is read too instead of being left for a later run
+
+    Yields:
+        tuple: (raw DataFrame of the block, byte offset just past the block)
+    """
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        names = header_line.decode('utf-8-sig').strip().split(',')
+        f.seek(max(start, len(header_line)))
+
+        def parse(lines):
+            return pd.read_csv(io.BytesIO(lines), header=None, names=names,
+                               usecols=[TIME_COLUMN, ID_COLUMN, *VALUE_COLUMNS])
+
+        rest = b''
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            data = rest + block
+            cut = data.rfind(b'\n') + 1
+            # A trailing line without newline may still be being written: keep it for later
+            rest = data[cut:]
+            if cut == 0:
+                continue
+            yield parse(data[:cut]), f.tell() - len(rest)
+        if final and rest.strip():
+            yield parse(rest), f.tell()
+
+
+def clean_export(df):
+    """
+    Vectorized cleaning of a raw export block
+
+    Sentinel readings (Raw HR = -1, Calibrated HR = 0, SpO2 = 0) become NaN,
+    rows without any reading or without a valid time are dropped, times are
+    parsed as timezone-aware UTC and duplicate entry_ids keep their last row.
+
+    Returns:
+        DataFrame: created_at (UTC), entry_id (int64) and the value columns (float32)
+    """
+    out = pd.DataFrame({
+        TIME_COLUMN: pd.to_datetime(df[TIME_COLUMN], utc=True, errors='coerce', format='ISO8601'),
+        ID_COLUMN: pd.to_numeric(df[ID_COLUMN], errors='coerce'),
+    })
+    for column, sentinel in VALUE_COLUMNS.items():
+        values = pd.to_numeric(df[column], errors='coerce').astype(np.float32)
+        out[column] = values.mask(values == sentinel)
+
+    valid = out[TIME_COLUMN].notna() & out[ID_COLUMN].notna()
+    valid &= out[list(VALUE_COLUMNS)].notna().any(axis=1)
+    out = out[valid].astype({ID_COLUMN: np.int64})
+    out = out.drop_duplicates(ID_COLUMN, keep='last')
+    return out.reset_index(drop=True)
+
+
+class CloudStore:
+    """
+    Local columnar store of cleaned cloud-export rows
+
+    Layout of a store directory:
+        meta.json           parts, stored entry_id range and per-source resume offsets
+        part-00000.npz      one array per column (created_at as int64 ns UTC)
+        part-00001.npz      ...
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        meta_path = os.path.join(store_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'columns': [TIME_COLUMN, ID_COLUMN, *VALUE_COLUMNS],
+                         'n_rows': 0, 'max_entry_id': None, 'parts': [], 'sources': {}}
+        self._ids = None
+
+    def stored_ids(self):
+        """Sorted entry_ids already in the store (loaded once)"""
+        if self._ids is None:
+            parts = []
+            for part in self.meta['parts']:
+                with np.load(self._part_path(part['file'])) as data:
+                    parts.append(data[ID_COLUMN])
+            self._ids = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        return self._ids
+
+    def append(self, df):
+        """
+        Append the rows of a cleaned block whose entry_id is not stored yet
+
+        Returns:
+            int: Number of rows written
+        """
+        ids = self.stored_ids()
+        new_ids = df[ID_COLUMN].to_numpy()
+        position = np.searchsorted(ids, new_ids).clip(max=max(len(ids) - 1, 0))
+        known = (ids[position] == new_ids) if len(ids) else np.zeros(len(df), dtype=bool)
+        df = df[~known]
+        if df.empty:
+            return 0
+
+        name = f"part-{len(self.meta['parts']):05d}.npz"
+        times = df[TIME_COLUMN].dt.tz_convert('UTC').dt.tz_localize(None).to_numpy('datetime64[ns]').view(np.int64)
+        columns = {TIME_COLUMN: times, ID_COLUMN: df[ID_COLUMN].to_numpy(np.int64)}
+        for column in VALUE_COLUMNS:
+            columns[column] = df[column].to_numpy(np.float32)
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(self._part_path(name), 'wb') as f:
+            np.savez(f, **columns)
+
+        self.meta['parts'].append({
+            'file': name,
+            'n_rows': len(df),
+            'min_time': int(times.min()),
+            'max_time': int(times.max()),
+        })
+        self.meta['n_rows'] += len(df)
+        max_id = int(columns[ID_COLUMN].max())
+        if self.meta['max_entry_id'] is None or max_id > self.meta['max_entry_id']:
+            self.meta['max_entry_id'] = max_id
+        self._ids = np.union1d(ids, columns[ID_COLUMN])
+        return len(df)
+
+    def resume_offset(self, path):
+        """Byte offset where a previous ingest of this file stopped, 0 if the file was rewritten"""
+        entry = self.meta['sources'].get(os.path.abspath(path))
+        if not entry or os.path.getsize(path) < entry['offset']:
+            return 0
+        if _check_hash(path, entry['offset']) != entry['check']:
+            return 0
+        return entry['offset']
+
+    def mark_source(self, path, offset):
+        """Remember how far a source has been ingested and save the metadata"""
+        self.meta['sources'][os.path.abspath(path)] = {
+            'offset': offset,
+            'check': _check_hash(path, offset),
+        }
+        self.save()
+
+    def save(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        meta_path = os.path.join(self.store_dir, META_FILE)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, meta_path)
+
+    def read(self, start=None, stop=None, tz=None):
+        """
+        Load the stored rows between two times, sorted by created_at
+
+        Args:
+            start, stop: Anything pd.Timestamp accepts; naive times are taken as UTC
+            tz (str): Convert created_at to this timezone (e.g. 'Asia/Bangkok')
+
+        Returns:
+            DataFrame: Same columns as clean_export
+        """
+        lo = None if start is None else _to_ns(start)
+        hi = None if stop is None else _to_ns(stop)
+
+        parts = []
+        for part in self.meta['parts']:
+            if (lo is not None and part['max_time'] < lo) or (hi is not None and part['min_time'] >= hi):
+                continue
+            with np.load(self._part_path(part['file'])) as data:
+                parts.append({column: data[column] for column in self.meta['columns']})
+
+        columns = {c: np.concatenate([p[c] for p in parts]) if parts else np.empty(0)
+                   for c in self.meta['columns']}
+        times = columns[TIME_COLUMN].astype(np.int64)
+        keep = np.ones(len(times), dtype=bool)
+        if lo is not None:
+            keep &= times >= lo
+        if hi is not None:
+            keep &= times < hi
+
+        df = pd.DataFrame({c: v[keep] for c, v in columns.items()})
+        df[TIME_COLUMN] = pd.to_datetime(times[keep], unit='ns', utc=True)
+        df[ID_COLUMN] = df[ID_COLUMN].astype(np.int64)
+        if tz is not None:
+            df[TIME_COLUMN] = df[TIME_COLUMN].dt.tz_convert(tz)
+        return df.sort_values(TIME_COLUMN, kind='stable').reset_index(drop=True)
+
+    def _part_path(self, name):
+        return os.path.join(self.store_dir, name)
+
+
+def ingest_export(path, store_dir, chunk_bytes=16 << 20, model=None, final=None):
+    """
+    Append the new rows of a cloud export to a store
+
+    Ingestion resumes from the byte offset where the previous run on the same
+    file stopped, so a growing export is never re-parsed from the start. If
+    the file was replaced instead of appended to, it is read again in full
+    and only entry_ids not yet in the store are written.
+
+    Args:
+        path (str): Path to the export CSV
+        store_dir (str): Store directory (created if needed)
+        chunk_bytes (int): Approximate size of each block read
+        model (CalibrationModel): Recompute 'Calibrated HR' from 'Raw HR'
+            with this model (see calibration_model.py) instead of keeping the
+            device's value (optional)
+        final (bool): The export is complete, so a last line without a
+            newline is ingested too (default: when the file has not been
+            modified for SETTLE_SECONDS)
+
+    Returns:
+        int: Number of new rows written
+    """
+    if final is None:
+        final = time.time() - os.path.getmtime(path) >= SETTLE_SECONDS
+    store = CloudStore(store_dir)
+    start = store.resume_offset(path)
+    written = 0
+    for raw, offset in iter_export_chunks(path, start, chunk_bytes, final):
+        df = clean_export(raw)
+        if model is not None:
+            df['Calibrated HR'] = model.apply(df['Raw HR']).astype(np.float32)
+        written += store.append(df)
+        # Saved after every block so an interrupted ingest resumes where it stopped
+        store.mark_source(path, offset)
+    return written
+
+
+def _check_hash(path, offset):
+    with open(path, 'rb') as f:
+        f.seek(max(offset - CHECK_BYTES, 0))
+        return hashlib.blake2b(f.read(min(offset, CHECK_BYTES)), digest_size=8).hexdigest()
+
+
+def _to_ns(value):
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append new rows of device cloud exports to a local store")
+    parser.add_argument('exports', nargs='+', help="Export CSV files (created_at, entry_id, Calibrated HR, ...)")
+    parser.add_argument('--store', default='cloud_store', help="Store directory")
+    parser.add_argument('--calibrate', default=None, metavar='DEVICE',
+                        help="Recompute Calibrated HR with this model of calibration_models.json")
+    parser.add_argument('--final', action='store_true',
+                        help="The exports are complete: also ingest a last line without a newline")
+    args = parser.parse_args()
+
+    model = None
+    if args.calibrate:
+        from calibration_model import load_models
+        model = load_models()[args.calibrate]
+    for export in args.exports:
+        n_new = ingest_export(export, args.store, model=model, final=args.final or None)
+        print(f"{export}: {n_new} new rows")
+
+    store = CloudStore(args.store)
+    print(f"Store {args.store}: {store.meta['n_rows']} rows, last entry_id {store.meta['max_entry_id']}")
@@ -0,0 +1,69 @@
+import sys
+
+import neurokit2 as nk
+import numpy as np
+
+from online_ppg import OnlinePPGRate
+from signal_cache import load_signal
+
+
+def compare_beats(batch_times, online_times, tolerance=0.1):
+    """
+    Match every batch beat to the nearest online beat
+
+    Args:
+        batch_times (array): Beat times from nk.ppg_process (s)
+        online_times (array): Beat times from OnlinePPGRate (s)
+        tolerance (float): Largest time difference counted as a match (s)
+
+    Returns:
+        dict: match rate, timing errors and beat counts
+    """
+    idx = np.clip(np.searchsorted(online_times, batch_times), 1, len(online_times) - 1)
+    nearest = np.where(np.abs(online_times[idx - 1] - batch_times) < np.abs(online_times[idx] - batch_times),
+                       online_times[idx - 1], online_times[idx])
+    errors = nearest - batch_times
+    matched = np.abs(errors) <= tolerance
+    return {
+        'batch_beats': len(batch_times),
+        'online_beats': len(online_times),
+        'matched': matched.mean(),
+        'mean_error': errors[matched].mean(),
+        'mean_abs_error': np.abs(errors[matched]).mean(),
+    }
+
+
+def run_online(ppg_data, sampling_rate, block_sizes=(1, 7, 64, 333, 1000), seed=0):
+    """Push the signal through OnlinePPGRate in randomly sized blocks"""
+    rng = np.random.default_rng(seed)
+    engine = OnlinePPGRate(sampling_rate)
+    times = []
+    start = 0
+    while start < len(ppg_data):
+        stop = start + rng.choice(block_sizes)
+        times.append(engine.push(ppg_data[start:stop])[1])
+        start = stop
+    times.append(engine.flush()[1])
+    return np.concatenate(times)
+
+
+if __name__ == "__main__":
+    input_file = "5min.csv"
+    sampling_rate = 200
+
+    ppg_data = np.asarray(load_signal(input_file, 1))
+
+    signals, info = nk.ppg_process(ppg_data, sampling_rate=sampling_rate)
+    batch_times = np.asarray(info['PPG_Peaks']) / sampling_rate
+    online_times = run_online(ppg_data, sampling_rate)
+
+    result = compare_beats(batch_times, online_times)
+    print(f"Batch beats: {result['batch_beats']}, online beats: {result['online_beats']}")
+    print(f"Matched within 100 ms: {100 * result['matched']:.1f}%")
+    print(f"Mean timing error: {1000 * result['mean_error']:.1f} ms "
+          f"(mean absolute {1000 * result['mean_abs_error']:.1f} ms)")
+
+    # Used as a regression check: fail loudly when the engines disagree
+    if result['matched'] < 0.95 or abs(result['online_beats'] - result['batch_beats']) > 0.05 * result['batch_beats']:
+        sys.exit("Online beat detection does not match nk.ppg_process")
+    print("Online beat detection matches nk.ppg_process")
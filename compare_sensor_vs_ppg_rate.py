@@ -1,17 +1,18 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+from excel_cache import read_excel_cached
+from alignment import align_to_reference, alignment_summary
+from plotting import show_or_save
+from beat_events import load_ppg_rate
 
-# Read PPG Rate from 5min_addtime_with_rate.csv
-ppg_df = pd.read_csv('5min_addtime_with_rate.csv')
+# PPG Rate ทุก 1 วินาที จาก beat events (หรือไฟล์ 5min_addtime_with_rate.csv เดิม)
+ppg_df = load_ppg_rate('1s')
 
 # Read My sensor from data_calibate.xlsx and process it
-sensor_df = pd.read_excel('data_calibate.xlsx')
+sensor_df = read_excel_cached('data_calibate.xlsx', columns=['My sensor'])
 print("\nSensor data columns:", sensor_df.columns.tolist())
 print("\nFirst few rows of sensor data:\n", sensor_df.head())
 
-# แปลง Timestamp ของ PPG เป็น datetime
-ppg_df['Timestamp'] = pd.to_datetime(ppg_df['Timestamp'])
-
 # เตรียมข้อมูล sensor
 sensor_values = [95,95,95,95,95,97,92,92,92,93,93,93,92,92,91,91,91,91,96,96,94,94,
                 96,96,96,96,84,94,90,90,91,91,88,88,88,88,88,88,88,88,87,87,90,90,
@@ -33,13 +34,17 @@ sensor_df_valid = pd.DataFrame({
     'My sensor': sensor_values
 })
 
+# ปรับเวลาของ sensor ให้ตรงกับ PPG (offset/drift จาก FFT cross-correlation)
+sensor_df_valid, alignment = align_to_reference(sensor_df_valid, ppg_df)
+print("\n" + alignment_summary(alignment))
+
 print("\nValid sensor data:")
 print("Shape:", sensor_df_valid.shape)
 print("Sample data:\n", sensor_df_valid.head())
 
 
 
-# ใช้ timestamp จาก 5min_addtime_with_rate.csv เป็นแกน x หลัก
+# ใช้ timestamp ของ PPG rate เป็นแกน x หลัก
 timestamp = ppg_df['Timestamp']
 ppg_rate = ppg_df['PPG_Rate']
 
@@ -50,7 +55,8 @@ print("Number of PPG data points:", len(ppg_df))
 print("Number of Sensor data points:", len(sensor_df_valid))
 
 # กรองข้อมูล PPG เฉพาะช่วงเวลาที่ต้องการ
-mask = (ppg_df['Timestamp'] >= start_time) & (ppg_df['Timestamp'] <= timestamps[-1])
+mask = ((ppg_df['Timestamp'] >= sensor_df_valid['Timestamp'].min()) &
+        (ppg_df['Timestamp'] <= sensor_df_valid['Timestamp'].max()))
 ppg_filtered = ppg_df[mask]
 
 # Resample PPG rate ให้เป็นทุก 2 วินาที
@@ -89,4 +95,4 @@ plt.gcf().autofmt_xdate()
 plt.grid(True, which='major', axis='x', linestyle='-', alpha=0.3)
 
 plt.tight_layout()
-plt.show()
+show_or_save(name='compare_sensor_vs_ppg_rate')
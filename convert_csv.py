@@ -1,6 +1,9 @@
 import bioread
 import pandas as pd
 import os
+import sys
+
+from signal_store import StoreWriter
 
 def convert_acq_to_csv(input_file, output_file=None):
     """
@@ -34,7 +37,53 @@ def convert_acq_to_csv(input_file, output_file=None):
     df.to_csv(output_file, index=False)
     print(f"File converted successfully: {output_file}")
 
+def convert_acq_to_store(input_file, output_dir=None, chunk_seconds=60, source_hash=None):
+    """
+    Convert .acq file to a chunked binary store (see signal_store.py)
+
+    The file is streamed block by block, so memory use does not grow with
+    the length of the recording.
+
+    Args:
+        input_file (str): Path to input .acq file
+        output_dir (str): Path to output store directory (optional)
+        chunk_seconds (float): Seconds of signal per chunk file
+        source_hash (str): Content hash of input_file, recorded in the store metadata
+    """
+    if output_dir is None:
+        output_dir = os.path.splitext(input_file)[0] + '.store'
+
+    with open(input_file, 'rb') as f:
+        reader = bioread.reader_for_streaming(f)
+        datafile = reader.datafile
+
+        start_time = datafile.earliest_marker_created_at
+        # Integer channels keep their raw int16 counts (scale/offset in the
+        # metadata), float channels are stored as float32
+        channels = [{
+            'name': channel.name,
+            'units': channel.units,
+            'sampling_rate': channel.samples_per_second,
+            'dtype': 'int16' if channel.dtype.kind == 'i' else 'float32',
+            'scale': channel.raw_scale_factor if channel.dtype.kind == 'i' else 1.0,
+            'offset': channel.raw_offset if channel.dtype.kind == 'i' else 0.0,
+        } for channel in datafile.channels]
+        writer = StoreWriter(output_dir, channels,
+                             start_time=start_time.isoformat() if start_time else None,
+                             chunk_seconds=chunk_seconds, source_hash=source_hash)
+
+        # Each chunk holds the raw integer samples of every channel
+        for chunk in reader.stream():
+            for i, buffer in enumerate(chunk):
+                writer.append(i, buffer.buffer)
+        writer.close()
+
+    print(f"File converted successfully: {output_dir}")
+
 # Example usage
 if __name__ == "__main__":
     input_file = "5min.acq"  # Using the .acq file in the current directory
-    convert_acq_to_csv(input_file)
\ No newline at end of file
+    if '--store' in sys.argv:
+        convert_acq_to_store(input_file)
+    else:
+        convert_acq_to_csv(input_file)
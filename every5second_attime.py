@@ -1,33 +1,31 @@
-import neurokit2 as nk
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from signal_cache import load_signal, load_timestamps
+from plotting import show_or_save
+from resample import beat_rate, detect_sampling_rate, ppg_process_resampled
 
 
 # Read PPG data from CSV file (assume 2nd column is PPG, 1st column is time)
-df = pd.read_excel("5min_addtime.xlsx")
-print("Available columns:", df.columns.tolist())
-ppg_data = df.iloc[:, 1].values
-time_data = df.iloc[:, 0].values
+ppg_data = load_signal("5min_addtime.xlsx", 1)
+time_data = load_timestamps("5min_addtime.xlsx", 0)
 
-# Extract data every 5 seconds
+# Sampling rate from the time column (Hz)
+sampling_rate = detect_sampling_rate("5min_addtime.xlsx")
+
+# Average the PPG over every 10 seconds (a plain stride would alias)
 interval = 10  # seconds
-sampling_rate = 500  # Hz (0.005s per sample)
-step = int(interval / 0.005)  # number of samples per 5 seconds
-indices = np.arange(0, len(time_data), step)
-df_every5s = df.iloc[indices]
+df_every5s = pd.DataFrame({'Timestamp': time_data, 'PPG': ppg_data})
+df_every5s = df_every5s.resample(f'{interval}s', on='Timestamp').mean().reset_index()
 df_every5s.to_csv('every10second_attime.csv', index=False)
-print('Saved every 5s data to every5second_attime.csv')
-
-# Set your actual sampling rate here (Hz)
-sampling_rate = 200
+print('Saved every 10s data to every10second_attime.csv')
 
-# Process the PPG signal
-signals, info = nk.ppg_process(ppg_data, sampling_rate=sampling_rate)
+# Process the PPG signal at the canonical analysis rate (anti-aliased decimation)
+signals, analysis_rate, peak_times = ppg_process_resampled(ppg_data, sampling_rate)
 
-# Extract PPG rate (BPM)
-ppg_rate = signals["PPG_Rate"].values
-time = signals.index.values / sampling_rate  # convert index to seconds
+# Extract PPG rate (BPM) from the sub-sample peak times
+time = signals.index.values / analysis_rate  # convert index to seconds
+ppg_rate = beat_rate(peak_times, time)
 
 print(f"Average PPG Rate: {np.nanmean(ppg_rate):.2f} BPM")
 print(f"Min PPG Rate: {np.nanmin(ppg_rate):.2f} BPM")
@@ -47,4 +45,4 @@ axs[1].set_title("PPG Rate Over Time")
 axs[1].legend()
 
 plt.tight_layout()
-plt.show()
+show_or_save(name='every5second_attime')
@@ -2,12 +2,14 @@ import neurokit2 as nk
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from excel_cache import read_excel_cached
+from plotting import show_or_save
 
 
 
 
 # Read PPG data from data_calibate.xlsx (column 'My sensor')
-df = pd.read_excel("data_calibate.xlsx")
+df = read_excel_cached("data_calibate.xlsx", columns=['My sensor'])
 print("Available columns:", df.columns.tolist())
 
 print("Available columns:", df.columns.tolist())
@@ -39,4 +41,4 @@ plt.ylabel('PPG Rate (BPM)')
 plt.title('PPG Rate from My sensor (data_calibate.xlsx)')
 plt.legend()
 plt.tight_layout()
-plt.show()
+show_or_save(name='every5second_mysensor')
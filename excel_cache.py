@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+import openpyxl
+import pandas as pd
+
+from profiler import stage
+from signal_cache import file_hash
+
+CACHE_DIR = '.excel_cache'
+
+
+def read_excel_cached(path, columns=None, sheet_name=0, cache_dir=CACHE_DIR):
+    """
+    Read selected columns of an Excel sheet, through a binary sidecar cache
+
+    The first read streams the sheet with openpyxl in read-only mode and
+    keeps only the requested columns; the result is pickled next to a small
+    JSON file recording the workbook's size, mtime and content hash. Later
+    reads load the pickle as long as the workbook is unchanged (same mtime,
+    or same content hash if only the mtime moved).
+
+    Args:
+        path (str): Path to the .xlsx file
+        columns (list): Column names or positions to keep (default: all)
+        sheet_name (int or str): Sheet position or name
+        cache_dir (str): Directory holding the sidecar files
+
+    Returns:
+        DataFrame: The selected columns, in the requested order
+    """
+    key = hashlib.blake2b(
+        json.dumps([os.path.abspath(path), sheet_name, columns]).encode(), digest_size=8
+    ).hexdigest()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    data_path = os.path.join(cache_dir, f'{stem}-{key}.pkl')
+    meta_path = os.path.join(cache_dir, f'{stem}-{key}.json')
+
+    stat = os.stat(path)
+    meta = None
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+            return pd.read_pickle(data_path)
+
+    digest = file_hash(path)
+    if meta is not None and meta['hash'] == digest:
+        df = pd.read_pickle(data_path)
+    else:
+        with stage('read_excel', file=os.path.basename(path)) as record:
+            df = _read_sheet(path, columns, sheet_name)
+            record.rows = len(df)
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_pickle(data_path)
+
+    with open(meta_path, 'w') as f:
+        json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest}, f, indent=2)
+    return df
+
+
+def _read_sheet(path, columns, sheet_name):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        if isinstance(sheet_name, int):
+            sheet = workbook.worksheets[sheet_name]
+        else:
+            sheet = workbook[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = _column_names(next(rows, ()))
+
+        if columns is None:
+            indexes = list(range(len(header)))
+        else:
+            indexes = []
+            for column in columns:
+                if isinstance(column, int):
+                    indexes.append(column)
+                elif column in header:
+                    indexes.append(header.index(column))
+                else:
+                    raise ValueError(f"Column '{column}' not found in {path}")
+
+        data = {header[i]: [] for i in indexes}
+        for row in rows:
+            if not any(value is not None for value in row):
+                continue
+            for i in indexes:
+                data[header[i]].append(row[i] if i < len(row) else None)
+    finally:
+        workbook.close()
+
+    # Numbers stored as text become numeric, as pandas.read_excel does
+    df = pd.DataFrame(data)
+    for name in df.columns:
+        if df[name].dtype == object:
+            try:
+                df[name] = pd.to_numeric(df[name])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def _column_names(header):
+    """Name header cells like pandas.read_excel (Unnamed: i, duplicates as name.1)"""
+    names = []
+    for i, value in enumerate(header):
+        name = f'Unnamed: {i}' if value is None else value
+        if isinstance(name, float) and name.is_integer():
+            name = int(name)
+        base, count = name, 1
+        while name in names:
+            name = f'{base}.{count}'
+            count += 1
+        names.append(name)
+    return names
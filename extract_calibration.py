@@ -1,76 +1,112 @@
 import pandas as pd
 import numpy as np
-from scipy import stats
 from scipy.signal import find_peaks, butter, filtfilt
 import matplotlib.pyplot as plt
+from signal_cache import load_signal
+from block_aggregate import aggregate_windows, beat_windows, time_windows
+from stats_kernel import describe
+from plotting import show_or_save
+from profiler import stage
+from resample import CANONICAL_RATE, refine_peaks, resample_signal, sampling_rate_from_times
+from signal_quality import segment_index, usable_segments, window_quality
 
-def extract_calibration_data(csv_file, window_size=200):
+def compute_calibration_data(time_data, ppg_data, window_size=200, window_seconds=None,
+                             analysis_rate=CANONICAL_RATE, quality_gate=False):
     """
-    Extract calibration data from PPG signal by averaging every 200 samples
+    Detect beats and average the heart rate over windows, without plotting
     
     Args:
-        csv_file (str): Path to input CSV file containing PPG data
-        window_size (int): Number of samples to average for each point
+        time_data (array): Sample times (s)
+        ppg_data (array): PPG samples
+        window_size (int): Number of beats to average for each point
+        window_seconds (float): Average over windows of this many seconds
+            instead of window_size beats (optional)
+        analysis_rate (float): Rate the signal is decimated to before filtering
+            and peak detection (None keeps the recorded rate)
+        quality_gate (bool): Drop beats in windows that fail the signal quality
+            gates (see signal_quality.py) and intervals across them
+    
+    Returns:
+        tuple: (calibration DataFrame, beat-to-beat rates, peak times)
     """
-    # Read CSV file
-    df = pd.read_csv(csv_file)
-    print("Available columns:", df.columns.tolist())
-    
-    # Get PPG data
-    ppg_data = df.iloc[:, 1].values  # PPG column
-    time_data = df['Time'].values
-    
-    # Signal Preprocessing
-    fs = 1 / (time_data[1] - time_data[0])  # Sampling frequency
+    # Signal Preprocessing: anti-aliased decimation to the analysis rate
+    recorded_fs = sampling_rate_from_times(time_data)
+    if analysis_rate is None:
+        ppg_analysis, fs = np.asarray(ppg_data), recorded_fs
+    else:
+        ppg_analysis, fs = resample_signal(ppg_data, recorded_fs, analysis_rate)
     nyq = fs / 2  # Nyquist frequency
     b, a = butter(3, [0.5/nyq, 5/nyq], btype='band')
     
     # Apply filter
-    ppg_filtered = filtfilt(b, a, ppg_data)
+    with stage('filtfilt', rows=len(ppg_analysis)):
+        ppg_filtered = filtfilt(b, a, ppg_analysis)
     
     # Peak Detection
-    peaks, properties = find_peaks(ppg_filtered, 
-                                 distance=int(fs/3),
-                                 height=np.mean(ppg_filtered),
-                                 prominence=0.1)
-    
-    # Calculate heart rates for entire signal
-    peak_times = time_data[peaks]
-    peak_intervals = np.diff(peak_times)
+    with stage('find_peaks', rows=len(ppg_filtered)):
+        peaks, properties = find_peaks(ppg_filtered, 
+                                     distance=int(fs/3),
+                                     height=np.mean(ppg_filtered),
+                                     prominence=0.1)
+    
+    # ตัด peak ในช่วงสัญญาณเสีย (motion artifact, flat, clipped) ออกก่อนคำนวณ rate
+    segment = np.zeros(len(peaks), dtype=np.int64)
+    if quality_gate:
+        segments = usable_segments(window_quality(ppg_analysis, fs), fs)
+        segment = segment_index(peaks, segments)
+        peaks = peaks[segment >= 0]
+        segment = segment[segment >= 0]
+    
+    # Calculate heart rates for entire signal (sub-sample peak times keep the
+    # rate accurate at the lower analysis rate)
+    peak_times = time_data[0] + refine_peaks(ppg_filtered, peaks) / fs
+    raw_peaks = np.clip(np.round((peak_times - time_data[0]) * recorded_fs).astype(np.int64),
+                        0, len(ppg_data) - 1)
+    # Each interval is counted at its second beat; intervals across a gap are skipped
+    following = np.arange(1, len(peaks))
+    following = following[segment[following] == segment[following - 1]]
+    peak_intervals = peak_times[following] - peak_times[following - 1]
     rates = 60 / peak_intervals  # Convert to BPM
     
-    # Divide data into windows and calculate average
-    num_windows = len(rates) // window_size
-    averaged_rates = []
-    averaged_times = []
-    averaged_raw = []
-    averaged_filtered = []
-    
-    for i in range(num_windows):
-        start_idx = i * window_size
-        end_idx = (i + 1) * window_size
-        
-        # Calculate averages for this window
-        avg_rate = np.mean(rates[start_idx:end_idx])
-        avg_time = np.mean(peak_times[start_idx+1:end_idx+1])  # +1 because rates are calculated from intervals
-        avg_raw = np.mean(ppg_data[peaks[start_idx+1:end_idx+1]])
-        avg_filtered = np.mean(ppg_filtered[peaks[start_idx+1:end_idx+1]])
-        
-        averaged_rates.append(avg_rate)
-        averaged_times.append(avg_time)
-        averaged_raw.append(avg_raw)
-        averaged_filtered.append(avg_filtered)
+    # Divide data into windows and calculate averages in one vectorized pass
+    beat_times = peak_times[following]
+    if window_seconds is None:
+        starts, end = beat_windows(len(rates), window_size)
+    else:
+        starts, end = time_windows(beat_times, window_seconds)
+    rate_stats = aggregate_windows(rates, starts, end)
+    averaged_rates = rate_stats['mean']
     
     # Prepare calibration data
     calibration_data = {
-        'Time (s)': averaged_times,
+        'Time (s)': aggregate_windows(beat_times, starts, end)['mean'],
         'Heart_Rate (BPM)': averaged_rates,
-        'Raw_Signal': averaged_raw,
-        'Filtered_Signal': averaged_filtered
+        'Raw_Signal': aggregate_windows(ppg_data[raw_peaks[following]], starts, end)['mean'],
+        'Filtered_Signal': aggregate_windows(ppg_filtered[peaks[following]], starts, end)['mean'],
+        'Heart_Rate_Std (BPM)': rate_stats['std'],
+        'Heart_Rate_Min (BPM)': rate_stats['min'],
+        'Heart_Rate_Max (BPM)': rate_stats['max']
     }
     
-    # Create DataFrame
-    cal_df = pd.DataFrame(calibration_data)
+    return pd.DataFrame(calibration_data), rates, peak_times
+
+def extract_calibration_data(csv_file, window_size=200, window_seconds=None):
+    """
+    Extract calibration data from PPG signal by averaging every 200 samples
+    
+    Args:
+        csv_file (str): Path to input CSV file containing PPG data
+        window_size (int): Number of samples to average for each point
+        window_seconds (float): Average over windows of this many seconds
+            instead of window_size beats (optional)
+    """
+    # Get PPG data (cached as a memory-mapped array after the first run)
+    ppg_data = load_signal(csv_file, 1)  # PPG column
+    time_data = load_signal(csv_file, 'Time')
+    
+    with stage('compute_calibration_data', rows=len(ppg_data)):
+        cal_df, rates, peak_times = compute_calibration_data(time_data, ppg_data, window_size, window_seconds)
+    averaged_rates = cal_df['Heart_Rate (BPM)'].values
     
     # Save to CSV
     output_file = 'calibration_data_averaged.csv'
@@ -91,8 +127,9 @@ def extract_calibration_data(csv_file, window_size=200):
     
     # Plot 2: Averaged heart rates
     plt.subplot(3, 1, 2)
+    window_label = f'{window_size} points' if window_seconds is None else f'{window_seconds} s'
     plt.plot(cal_df['Time (s)'], cal_df['Heart_Rate (BPM)'], 'r.-', 
-             label=f'Averaged every {window_size} points')
+             label=f'Averaged every {window_label}')
     plt.title('Averaged Heart Rate Measurements for Calibration')
     plt.xlabel('Time (s)')
     plt.ylabel('Heart Rate (BPM)')
@@ -109,59 +146,61 @@ def extract_calibration_data(csv_file, window_size=200):
     plt.legend()
     
     plt.tight_layout()
-    plt.show()
+    show_or_save(name='calibration_data_averaged')
     
     # Calculate detailed statistics
     print("\n=== Detailed Statistical Analysis ===")
     
+    rate_summary = describe(rates)
     print("\n1. Original Data Statistics:")
-    print(f"Sample Size: {len(rates)}")
+    print(f"Sample Size: {rate_summary['count']}")
     print("\nCentral Tendency:")
-    print(f"Mean Heart Rate: {np.mean(rates):.1f} BPM")
-    print(f"Median Heart Rate: {np.median(rates):.1f} BPM")
-    print(f"Mode Heart Rate: {stats.mode(rates)[0]:.1f} BPM")
+    print(f"Mean Heart Rate: {rate_summary['mean']:.1f} BPM")
+    print(f"Median Heart Rate: {rate_summary['median']:.1f} BPM")
+    print(f"Mode Heart Rate: {rate_summary['mode']:.1f} BPM")
     
     print("\nDispersion Measures:")
-    print(f"Standard Deviation: {np.std(rates):.2f} BPM")
-    print(f"Variance: {np.var(rates):.2f} BPM²")
-    print(f"Range: {np.ptp(rates):.2f} BPM")
-    print(f"Interquartile Range (IQR): {stats.iqr(rates):.2f} BPM")
-    print(f"Minimum: {np.min(rates):.1f} BPM")
-    print(f"Maximum: {np.max(rates):.1f} BPM")
+    print(f"Standard Deviation: {rate_summary['std']:.2f} BPM")
+    print(f"Variance: {rate_summary['var']:.2f} BPM²")
+    print(f"Range: {rate_summary['range']:.2f} BPM")
+    print(f"Interquartile Range (IQR): {rate_summary['iqr']:.2f} BPM")
+    print(f"Minimum: {rate_summary['min']:.1f} BPM")
+    print(f"Maximum: {rate_summary['max']:.1f} BPM")
     
     print("\nShape Measures:")
-    print(f"Skewness: {stats.skew(rates):.3f}")
-    print(f"Kurtosis: {stats.kurtosis(rates):.3f}")
+    print(f"Skewness: {rate_summary['skew']:.3f}")
+    print(f"Kurtosis: {rate_summary['kurtosis']:.3f}")
     
     print("\nPercentiles:")
-    for p in [25, 50, 75, 95]:
-        print(f"{p}th percentile: {np.percentile(rates, p):.1f} BPM")
+    for p, value in rate_summary['percentiles'].items():
+        print(f"{p}th percentile: {value:.1f} BPM")
     
+    averaged_summary = describe(averaged_rates)
     print("\n2. Averaged Data Statistics:")
-    print(f"Sample Size: {len(averaged_rates)}")
+    print(f"Sample Size: {averaged_summary['count']}")
     print("\nCentral Tendency:")
-    print(f"Mean Heart Rate: {np.mean(averaged_rates):.1f} BPM")
-    print(f"Median Heart Rate: {np.median(averaged_rates):.1f} BPM")
-    print(f"Mode Heart Rate: {stats.mode(averaged_rates)[0]:.1f} BPM")
+    print(f"Mean Heart Rate: {averaged_summary['mean']:.1f} BPM")
+    print(f"Median Heart Rate: {averaged_summary['median']:.1f} BPM")
+    print(f"Mode Heart Rate: {averaged_summary['mode']:.1f} BPM")
     
     print("\nDispersion Measures:")
-    print(f"Standard Deviation: {np.std(averaged_rates):.2f} BPM")
-    print(f"Variance: {np.var(averaged_rates):.2f} BPM²")
-    print(f"Range: {np.ptp(averaged_rates):.2f} BPM")
-    if len(averaged_rates) >= 4:  # Need at least 4 points for IQR
-        print(f"Interquartile Range (IQR): {stats.iqr(averaged_rates):.2f} BPM")
-    print(f"Minimum: {np.min(averaged_rates):.1f} BPM")
-    print(f"Maximum: {np.max(averaged_rates):.1f} BPM")
-    
-    if len(averaged_rates) >= 3:  # Need at least 3 points for these statistics
+    print(f"Standard Deviation: {averaged_summary['std']:.2f} BPM")
+    print(f"Variance: {averaged_summary['var']:.2f} BPM²")
+    print(f"Range: {averaged_summary['range']:.2f} BPM")
+    if averaged_summary['count'] >= 4:  # Need at least 4 points for IQR
+        print(f"Interquartile Range (IQR): {averaged_summary['iqr']:.2f} BPM")
+    print(f"Minimum: {averaged_summary['min']:.1f} BPM")
+    print(f"Maximum: {averaged_summary['max']:.1f} BPM")
+    
+    if averaged_summary['count'] >= 3:  # Need at least 3 points for these statistics
         print("\nShape Measures:")
-        print(f"Skewness: {stats.skew(averaged_rates):.3f}")
-        print(f"Kurtosis: {stats.kurtosis(averaged_rates):.3f}")
+        print(f"Skewness: {averaged_summary['skew']:.3f}")
+        print(f"Kurtosis: {averaged_summary['kurtosis']:.3f}")
     
-    if len(averaged_rates) >= 4:  # Need at least 4 points for percentiles
+    if averaged_summary['count'] >= 4:  # Need at least 4 points for percentiles
         print("\nPercentiles:")
-        for p in [25, 50, 75, 95]:
-            print(f"{p}th percentile: {np.percentile(averaged_rates, p):.1f} BPM")
+        for p, value in averaged_summary['percentiles'].items():
+            print(f"{p}th percentile: {value:.1f} BPM")
     
     # Additional analyses
     print("\n3. Additional Analyses:")
@@ -1,13 +1,18 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from stats_kernel import describe
+from alignment import align_to_reference, alignment_summary, join_nearest
+from beat_events import load_ppg_rate
+from profiler import stage
 
 def load_data():
     """Load data from PPG file and sensor data"""
     # อ่านข้อมูล PPG
-    ppg_df = pd.read_csv('5min_addtime_with_rate.csv')
-    ppg_df['Timestamp'] = pd.to_datetime(ppg_df['Timestamp'])
+    ppg_df = load_ppg_rate('1s')
     
+    return ppg_df, load_sensor_data()
+
+def load_sensor_data():
+    """Sensor readings of the 5 min session"""
     # สร้างข้อมูล sensor
     sensor_values = [95,95,95,95,95,97,92,92,92,93,93,93,92,92,91,91,91,91,96,96,94,94,
                     96,96,96,96,84,94,90,90,91,91,88,88,88,88,88,88,88,88,87,87,90,90,
@@ -24,12 +29,10 @@ def load_data():
     timestamps = [start_time + pd.Timedelta(seconds=s) for s in time_seconds]
     
     # สร้าง DataFrame สำหรับ sensor
-    sensor_df = pd.DataFrame({
+    return pd.DataFrame({
         'Timestamp': timestamps,
         'My sensor': sensor_values
     })
-    
-    return ppg_df, sensor_df
 
 def process_data(ppg_df, sensor_df):
     """Process and format data for analysis"""
@@ -47,19 +50,10 @@ def process_data(ppg_df, sensor_df):
 
 def calculate_statistics(sensor_data, ppg_data):
     """Calculate statistical metrics"""
+    # ddof=1 keeps the sample standard deviation pandas reported before
     stats = {
-        'Raw Sensor': {
-            'min': sensor_data['My sensor'].min(),
-            'max': sensor_data['My sensor'].max(),
-            'mean': sensor_data['My sensor'].mean(),
-            'std': sensor_data['My sensor'].std()
-        },
-        'Reference': {
-            'min': ppg_data['PPG_Rate'].min(),
-            'max': ppg_data['PPG_Rate'].max(),
-            'mean': ppg_data['PPG_Rate'].mean(),
-            'std': ppg_data['PPG_Rate'].std()
-        }
+        'Raw Sensor': describe(sensor_data['My sensor'], ddof=1),
+        'Reference': describe(ppg_data['PPG_Rate'], ddof=1)
     }
     
     # คำนวณค่าความคลาดเคลื่อน
@@ -70,6 +64,10 @@ def calculate_statistics(sensor_data, ppg_data):
         'SD Difference': abs(stats['Raw Sensor']['std'] - stats['Reference']['std'])
     }
     
+    # Error between each sensor reading and the nearest reference value
+    paired = join_nearest(sensor_data[['Timestamp', 'My sensor']], ppg_data[['Timestamp', 'PPG_Rate']])
+    errors['Paired Mean Absolute Error'] = (paired['My sensor'] - paired['PPG_Rate']).abs().mean()
+    
     return stats, errors
 
 def print_statistics(stats, errors):
@@ -88,6 +86,10 @@ def print_statistics(stats, errors):
 
 def create_comparison_plot(sensor_df, ppg_df, stats):
     """Create comparison plots for time series and statistics"""
+    # matplotlib เฉพาะตอน plot เพื่อให้ ppg_cli.py compare เริ่มได้เร็ว
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    
     # สร้าง subplot
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), height_ratios=[2, 1])
     
@@ -141,20 +143,30 @@ def create_comparison_plot(sensor_df, ppg_df, stats):
 
 def main():
     # โหลดข้อมูล
-    ppg_df, sensor_df = load_data()
+    with stage('load_data'):
+        ppg_df, sensor_df = load_data()
+    
+    # ปรับเวลาของ sensor ให้ตรงกับ PPG (offset/drift จาก FFT cross-correlation)
+    with stage('align_to_reference', rows=len(sensor_df)):
+        sensor_df, alignment = align_to_reference(sensor_df, ppg_df)
+    print(alignment_summary(alignment))
     
     # ประมวลผลข้อมูล
-    ppg_processed, sensor_processed = process_data(ppg_df, sensor_df)
+    with stage('process_data', rows=len(ppg_df)):
+        ppg_processed, sensor_processed = process_data(ppg_df, sensor_df)
     
     # คำนวณค่าสถิติ
-    stats, errors = calculate_statistics(sensor_processed, ppg_processed)
+    with stage('calculate_statistics'):
+        stats, errors = calculate_statistics(sensor_processed, ppg_processed)
     
     # แสดงผลค่าสถิติ
     print_statistics(stats, errors)
     
     # สร้างและแสดงกราฟ
-    fig = create_comparison_plot(sensor_processed, ppg_processed, stats)
-    plt.show()
+    with stage('plot'):
+        fig = create_comparison_plot(sensor_processed, ppg_processed, stats)
+    from plotting import show_or_save
+    show_or_save(fig, name='heart_rate_comparison')
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,20 @@
 import pandas as pd
-import openpyxl
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from stats_kernel import describe
+from alignment import align_to_reference, alignment_summary, join_nearest
+from excel_cache import read_excel_cached
+from plotting import show_or_save
+from beat_events import load_ppg_rate
+from profiler import stage
 
 def load_data():
     """Load data from PPG file and sensor data"""
     # Read PPG data
-    ppg_df = pd.read_csv('5min_addtime_with_rate.csv')
-    ppg_df['Timestamp'] = pd.to_datetime(ppg_df['Timestamp'])
+    ppg_df = load_ppg_rate('1s')
     
     # Read sensor data from Excel file
-    sensor_df = pd.read_excel('data_calibate.xlsx')
+    sensor_df = read_excel_cached('data_calibate.xlsx', columns=['My sensor'])
     # Convert time_stamp to datetime
     sensor_df['Timestamp'] = pd.Timestamp('2025-07-26 11:42:47') + pd.to_timedelta(sensor_df.index * 2, unit='s')
     
@@ -34,19 +38,10 @@ def process_data(ppg_df, sensor_df):
 
 def calculate_statistics(sensor_data, ppg_data):
     """Calculate statistical metrics"""
+    # ddof=1 keeps the sample standard deviation pandas reported before
     stats = {
-        'Raw Sensor': {
-            'min': sensor_data['My sensor'].min(),
-            'max': sensor_data['My sensor'].max(),
-            'mean': sensor_data['My sensor'].mean(),
-            'std': sensor_data['My sensor'].std()
-        },
-        'Reference': {
-            'min': ppg_data['PPG_Rate'].min(),
-            'max': ppg_data['PPG_Rate'].max(),
-            'mean': ppg_data['PPG_Rate'].mean(),
-            'std': ppg_data['PPG_Rate'].std()
-        }
+        'Raw Sensor': describe(sensor_data['My sensor'], ddof=1),
+        'Reference': describe(ppg_data['PPG_Rate'], ddof=1)
     }
     
     # Calculate error metrics
@@ -57,6 +52,10 @@ def calculate_statistics(sensor_data, ppg_data):
         'SD Difference': abs(stats['Raw Sensor']['std'] - stats['Reference']['std'])
     }
     
+    # Error between each sensor reading and the nearest reference value
+    paired = join_nearest(sensor_data[['Timestamp', 'My sensor']], ppg_data[['Timestamp', 'PPG_Rate']])
+    errors['Paired Mean Absolute Error'] = (paired['My sensor'] - paired['PPG_Rate']).abs().mean()
+    
     return stats, errors
 
 def print_statistics(stats, errors):
@@ -134,20 +133,29 @@ def plot_comparison(sensor_df, ppg_df, stats):
 
 def main():
     # Load data
-    ppg_df, sensor_df = load_data()
+    with stage('load_data'):
+        ppg_df, sensor_df = load_data()
+    
+    # Align sensor clock to the PPG reference (offset/drift from FFT cross-correlation)
+    with stage('align_to_reference', rows=len(sensor_df)):
+        sensor_df, alignment = align_to_reference(sensor_df, ppg_df)
+    print(alignment_summary(alignment))
     
     # Process data
-    ppg_processed, sensor_processed = process_data(ppg_df, sensor_df)
+    with stage('process_data', rows=len(ppg_df)):
+        ppg_processed, sensor_processed = process_data(ppg_df, sensor_df)
     
     # Calculate statistics
-    stats, errors = calculate_statistics(sensor_processed, ppg_processed)
+    with stage('calculate_statistics'):
+        stats, errors = calculate_statistics(sensor_processed, ppg_processed)
     
     # Display statistics
     print_statistics(stats, errors)
     
     # Create and display plots
-    fig = plot_comparison(sensor_processed, ppg_processed, stats)
-    plt.show()
+    with stage('plot'):
+        fig = plot_comparison(sensor_processed, ppg_processed, stats)
+    show_or_save(fig, name='heart_rate_comparison_stats')
 
 if __name__ == "__main__":
     main()
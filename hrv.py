@@ -0,0 +1,196 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.4)
+
+
+def window_bounds(times, window_seconds, hop_seconds=None, start=None, stop=None):
+    """
+    Sliding windows [t, t + window_seconds) every hop_seconds over sorted times
+
+    Returns:
+        tuple: (window start times, index of the first and one past the last
+            element of times in each window)
+    """
+    times = np.asarray(times, dtype=np.float64)
+    hop_seconds = hop_seconds or window_seconds
+    start = times[0] if start is None else start
+    stop = times[-1] if stop is None else stop
+    window_starts = start + np.arange(max(int(np.floor((stop - start - window_seconds) / hop_seconds)) + 1, 1)) * hop_seconds
+    lo = np.searchsorted(times, window_starts, side='left')
+    hi = np.searchsorted(times, window_starts + window_seconds, side='left')
+    return window_starts, lo, hi
+
+
+def rolling_hrv(peak_times, window_seconds=60, hop_seconds=None, start=None, freqs=None):
+    """
+    Time- and frequency-domain HRV over sliding windows
+
+    RR intervals are stamped with the time of the beat that ends them. Every
+    window sum comes from prefix sums over the whole recording, so the cost
+    is O(beats + windows) whatever the overlap, instead of recomputing each
+    window from scratch.
+
+    Args:
+        peak_times (array): Sorted beat times (s)
+        window_seconds (float): Window length (s)
+        hop_seconds (float): Step between window starts (default: window_seconds)
+        start (float): Start of the first window (default: first beat)
+        freqs (array): Frequencies for the Lomb-Scargle spectrum (default:
+            0.0033-0.5 Hz in 0.0025 Hz steps); an empty array skips LF/HF
+
+    Returns:
+        DataFrame: One row per window with 'Start (s)', 'Beats', 'Mean_HR (BPM)',
+            'SDNN (ms)', 'RMSSD (ms)', 'pNN50 (%)', 'LF (ms²)', 'HF (ms²)' and 'LF/HF'
+    """
+    peak_times = np.asarray(peak_times, dtype=np.float64)
+    rr_times = peak_times[1:]
+    rr = np.diff(peak_times) * 1000  # ms
+    window_starts, lo, hi = window_bounds(rr_times, window_seconds, hop_seconds, start)
+    n = hi - lo
+
+    # Sums of RR around the overall mean keep the variance numerically stable
+    centred = rr - rr.mean()
+    s1 = _prefix(centred)
+    s2 = _prefix(centred ** 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_centred = (s1[hi] - s1[lo]) / n
+        mean_rr = rr.mean() + mean_centred
+        sdnn = np.sqrt(np.maximum((s2[hi] - s2[lo]) / n - mean_centred ** 2, 0))
+
+        # Successive differences whose two intervals both lie in the window:
+        # difference i (rr[i + 1] - rr[i]) belongs to windows with lo <= i and i + 1 < hi
+        diffs = np.diff(rr)
+        d2 = _prefix(diffs ** 2)
+        nn50 = _prefix(np.abs(diffs) > 50)
+        d_hi = np.maximum(hi - 1, lo)
+        n_diffs = d_hi - lo
+        rmssd = np.sqrt((d2[d_hi] - d2[lo]) / n_diffs)
+        pnn50 = 100 * (nn50[d_hi] - nn50[lo]) / n_diffs
+
+    result = pd.DataFrame({
+        'Start (s)': window_starts,
+        'Beats': n,
+        'Mean_HR (BPM)': 60000 / mean_rr,
+        'SDNN (ms)': np.where(n >= 2, sdnn, np.nan),
+        'RMSSD (ms)': rmssd,
+        'pNN50 (%)': pnn50,
+    })
+
+    if freqs is None:
+        freqs = np.arange(0.0033, 0.5, 0.0025)
+    if len(freqs):
+        psd = lomb_scargle_windows(rr_times, rr, lo, hi, freqs)
+        lf = band_power(psd, freqs, LF_BAND)
+        hf = band_power(psd, freqs, HF_BAND)
+        result['LF (ms²)'] = lf
+        result['HF (ms²)'] = hf
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result['LF/HF'] = lf / hf
+    return result
+
+
+def lomb_scargle_windows(times, values, lo, hi, freqs, min_samples=8, freq_chunk=16):
+    """
+    Lomb-Scargle power spectral density of many windows of an irregular series at once
+
+    Each window is values[lo:hi], centred on its own mean. All the sums the
+    periodogram needs (y*cos, y*sin, cos, sin and the double-angle terms used
+    for the time offset tau) are window differences of prefix sums over the
+    whole series, evaluated a few frequencies at a time to bound memory.
+
+    Args:
+        times (array): Sorted sample times (s)
+        values (array): Sample values
+        lo, hi (array): First and one-past-last sample index of each window
+        freqs (array): Frequencies (Hz)
+        min_samples (int): Windows with fewer samples get NaN
+        freq_chunk (int): Frequencies evaluated per pass
+
+    Returns:
+        array: (windows, freqs) one-sided PSD in units of values² per Hz
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    lo = np.asarray(lo)
+    hi = np.asarray(hi)
+    n = (hi - lo).astype(np.float64)
+
+    # Per-window mean, and window span for the PSD scaling
+    sums = _prefix(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums[hi] - sums[lo]) / n
+    last = np.maximum(hi - 1, lo).clip(max=len(times) - 1)
+    span = times[last] - times[lo.clip(max=len(times) - 1)]
+
+    # Times relative to the first sample keep the phases accurate
+    t = times - times[0] if len(times) else times
+    psd = np.full((len(lo), len(freqs)), np.nan)
+    for first in range(0, len(freqs), freq_chunk):
+        omega = 2 * np.pi * freqs[first:first + freq_chunk]
+        phase = np.outer(t, omega)
+        cos, sin = np.cos(phase), np.sin(phase)
+        c = _prefix(cos)
+        s = _prefix(sin)
+        yc = _prefix(values[:, None] * cos)
+        ys = _prefix(values[:, None] * sin)
+        c2 = _prefix(np.cos(2 * phase))
+        s2 = _prefix(np.sin(2 * phase))
+
+        def window(p):
+            return p[hi] - p[lo]
+
+        # Mean-centring inside the window: sum((y - mean) * cos) = sum(y*cos) - mean*sum(cos)
+        ycw = window(yc) - means[:, None] * window(c)
+        ysw = window(ys) - means[:, None] * window(s)
+        c2w, s2w = window(c2), window(s2)
+        tau2 = np.arctan2(s2w, c2w)  # 2 * omega * tau
+        cos_tau, sin_tau = np.cos(tau2 / 2), np.sin(tau2 / 2)
+
+        cc = n[:, None] / 2 + (c2w * np.cos(tau2) + s2w * np.sin(tau2)) / 2
+        ss = n[:, None] - cc
+        with np.errstate(invalid='ignore', divide='ignore'):
+            power = ((ycw * cos_tau + ysw * sin_tau) ** 2 / cc
+                     + (ysw * cos_tau - ycw * sin_tau) ** 2 / ss) / 2
+        psd[:, first:first + freq_chunk] = power
+
+    # Periodogram power to one-sided PSD: white noise of variance v has power
+    # v at every frequency and must integrate to v up to the Nyquist n / (2 * span)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        psd *= (2 * span / n)[:, None]
+    psd[n < min_samples] = np.nan
+    return psd
+
+
+def band_power(psd, freqs, band):
+    """Integrate a PSD (windows, freqs) over a frequency band with the trapezoidal rule"""
+    inside = (freqs >= band[0]) & (freqs <= band[1])
+    return np.trapezoid(psd[:, inside], freqs[inside], axis=1)
+
+
+def _prefix(values):
+    """Prefix sums with a leading zero row, so a window sum is p[hi] - p[lo]"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling HRV (SDNN, RMSSD, pNN50, LF/HF) of a PPG recording")
+    parser.add_argument('recording', nargs='?', default='5min.csv', help="CSV/Excel recording (time, PPG)")
+    parser.add_argument('--window', type=float, default=60, help="Window length (s)")
+    parser.add_argument('--hop', type=float, default=None, help="Step between windows (s, default: window)")
+    parser.add_argument('--output', default='hrv_rolling.csv', help="Output CSV")
+    args = parser.parse_args()
+
+    from resample import detect_sampling_rate, ppg_process_resampled
+    from signal_cache import load_signal
+
+    _, _, beats = ppg_process_resampled(load_signal(args.recording, 1), detect_sampling_rate(args.recording))
+    hrv = rolling_hrv(beats, args.window, args.hop)
+    hrv.to_csv(args.output, index=False)
+    print(hrv.round(2).to_string(index=False))
+    print(f"\nSaved {len(hrv)} windows to {args.output}")
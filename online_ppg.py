@@ -0,0 +1,128 @@
+import numpy as np
+from scipy.signal import butter, find_peaks, group_delay, sosfilt, sosfilt_zi
+
+
+class OnlinePPGRate:
+    """
+    Incremental PPG beat and rate detector
+
+    Samples can be pushed in blocks of any size. The bandpass filter state and
+    the tail of the filtered signal are carried between pushes, so beats come
+    out as soon as they can no longer be replaced by a higher peak inside the
+    refractory window (the same `distance=int(fs/3)` rule used in
+    extract_calibration.py). Because the causal filter lags the signal, each
+    peak is moved back to the raw signal's maximum within one filter delay.
+    """
+
+    def __init__(self, sampling_rate, lowcut=0.5, highcut=5, order=3,
+                 refractory=1/3, prominence=0.1, context_seconds=2.0,
+                 delay_frequency=1.5):
+        """
+        Args:
+            sampling_rate (float): Sampling rate of the pushed samples (Hz)
+            lowcut (float): Bandpass low cut-off (Hz)
+            highcut (float): Bandpass high cut-off (Hz)
+            order (int): Butterworth filter order
+            refractory (float): Minimum time between two beats (s)
+            prominence (float): Minimum peak prominence of the filtered signal
+            context_seconds (float): Filtered history kept for peak prominence (s)
+            delay_frequency (float): Frequency (Hz) at which the causal filter's
+                group delay sets how far back peaks are searched in the raw signal
+        """
+        self.sampling_rate = sampling_rate
+        self.prominence = prominence
+        nyq = sampling_rate / 2
+        self.sos = butter(order, [lowcut/nyq, highcut/nyq], btype='band', output='sos')
+        b, a = butter(order, [lowcut/nyq, highcut/nyq], btype='band')
+        self.delay = int(np.ceil(group_delay((b, a), w=[delay_frequency], fs=sampling_rate)[1][0]))
+
+        self.distance = max(1, int(sampling_rate * refractory))
+        self.context = max(int(sampling_rate * context_seconds), self.distance + 1, self.delay + 1)
+        self.reset()
+
+    def reset(self):
+        """Forget all filter state and detected beats"""
+        self._zi = None
+        self._buffer = np.empty(0)
+        self._raw = np.empty(0)
+        self._buffer_start = 0  # absolute sample index of self._buffer[0]
+        self._pending = 0  # samples in the buffer not yet searched for peaks
+        self._n_samples = 0
+        self._sum = 0.0
+        self._last_peak = None  # last confirmed peak of the filtered signal
+        self._last_beat = None  # the same peak refined on the raw signal
+        self.rate = np.nan
+
+    def push(self, samples):
+        """
+        Feed a block of raw PPG samples
+
+        Args:
+            samples (array-like): Next raw samples, any length
+
+        Returns:
+            tuple: (peaks, times, rates) numpy arrays for the beats confirmed by
+                this block: absolute sample index of each peak, its time in
+                seconds, and the PPG_Rate (BPM) since the previous beat
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) == 0:
+            return _no_beats()
+
+        if self._zi is None:
+            self._zi = sosfilt_zi(self.sos) * samples[0]
+        filtered, self._zi = sosfilt(self.sos, samples, zi=self._zi)
+
+        self._n_samples += len(filtered)
+        self._sum += filtered.sum()
+        self._buffer = np.concatenate([self._buffer, filtered])
+        self._raw = np.concatenate([self._raw, samples])
+        self._pending += len(filtered)
+
+        # Searching costs O(context + pending), so wait for at least one
+        # refractory window of new samples to keep the per-sample cost constant
+        if self._pending < self.distance:
+            return _no_beats()
+        return self._detect()
+
+    def flush(self):
+        """Confirm the beats still waiting at the end of the recording"""
+        return self._detect(final=True)
+
+    def _detect(self, final=False):
+        buffer = self._buffer
+        peaks, _ = find_peaks(buffer,
+                              distance=self.distance,
+                              height=self._sum / max(self._n_samples, 1),
+                              prominence=self.prominence)
+
+        # A peak is final once a full refractory window follows it
+        limit = len(buffer) if final else len(buffer) - self.distance
+        peaks = peaks[peaks < limit]
+        if self._last_peak is not None:
+            peaks = peaks[peaks + self._buffer_start > self._last_peak]
+
+        # Refine on the raw signal: its maximum within one filter delay before
+        # the filtered peak
+        windows = np.lib.stride_tricks.sliding_window_view(
+            np.concatenate([np.full(self.delay, -np.inf), self._raw]), self.delay + 1)
+        beats = peaks - self.delay + np.argmax(windows[peaks], axis=1) + self._buffer_start
+
+        previous = [np.nan] if self._last_beat is None else [self._last_beat]
+        rates = 60 * self.sampling_rate / np.diff(np.concatenate([previous, beats]))
+        if len(beats):
+            self._last_peak = int(peaks[-1]) + self._buffer_start
+            self._last_beat = int(beats[-1])
+            self.rate = rates[-1]
+
+        keep = min(len(buffer), self.context)
+        self._buffer = buffer[len(buffer) - keep:]
+        self._raw = self._raw[len(buffer) - keep:]
+        self._buffer_start += len(buffer) - keep
+        self._pending = 0
+
+        return beats, beats / self.sampling_rate, rates
+
+
+def _no_beats():
+    return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
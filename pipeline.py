@@ -0,0 +1,347 @@
+import argparse
+import ast
+import functools
+import glob
+import hashlib
+import importlib.metadata
+import inspect
+import json
+import os
+import sys
+import textwrap
+
+import pandas as pd
+
+import profiler
+from signal_cache import file_hash, source_hash
+
+CACHE_DIR = '.pipeline_cache'
+# Modules of this repository are the .py files next to pipeline.py
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stage:
+    """
+    One step of the pipeline
+
+    The stage function is called as func(**upstream results, **source paths,
+    **params) and may return any picklable value. Its cache key is a hash of
+    the function's source code, the code it imports (see code_dependencies),
+    its params, the content hash of its source files and the keys of its
+    upstream stages, so it changes exactly when something the result depends
+    on changes.
+    """
+
+    def __init__(self, name, func, inputs=None, sources=None, params=None, output=None, writes=()):
+        """
+        Args:
+            name (str): Stage name
+            func (callable): Function computing the result
+            inputs (dict): Argument name -> upstream stage name
+            sources (dict): Argument name -> input file path
+            params (dict): Argument name -> parameter value (JSON-serializable)
+            output (str): CSV file the DataFrame result is exported to (optional)
+            writes (tuple): Names of params holding paths of files the function
+                writes itself, e.g. figures (optional)
+        """
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs or {})
+        self.sources = dict(sources or {})
+        self.params = dict(params or {})
+        self.output = output
+        self.writes = tuple(writes)
+
+
+class Pipeline:
+    """
+    Run stages in dependency order, recomputing only the stale ones
+
+    Results are pickled under CACHE_DIR as <stage>-<key>.pkl. A stage whose
+    key already has a result is not run, and upstream results are loaded
+    only when a downstream stage actually has to run, so changing a plot
+    parameter re-runs the plot alone.
+    """
+
+    def __init__(self, stages, cache_dir=CACHE_DIR):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir
+        self._keys = {}
+        self._results = {}
+
+    def set_param(self, stage, param, value):
+        """Override one parameter of a stage before running"""
+        self.stages[stage].params[param] = value
+        self._keys.clear()
+
+    def key(self, name):
+        """Cache key of a stage (computed without running anything)"""
+        if name not in self._keys:
+            stage = self.stages[name]
+            modules, packages = code_dependencies(stage.func)
+            description = {
+                'code': inspect.getsource(stage.func),
+                'modules': {module: file_hash(_module_path(module)) for module in sorted(modules)},
+                'packages': {package: _package_version(package) for package in sorted(packages)},
+                'params': stage.params,
+                'sources': {arg: source_hash(path) for arg, path in stage.sources.items()},
+                'inputs': {arg: self.key(upstream) for arg, upstream in stage.inputs.items()},
+            }
+            text = json.dumps(description, sort_keys=True, default=str)
+            self._keys[name] = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        return self._keys[name]
+
+    def is_stale(self, name):
+        """Check whether a stage has no cached result for its current key"""
+        stage = self.stages[name]
+        return not (os.path.exists(self._cache_path(name))
+                    and all(os.path.exists(stage.params[param]) for param in stage.writes))
+
+    def result(self, name, force=()):
+        """
+        Result of a stage, from the cache or by running it (and any stale upstream stage)
+
+        Args:
+            name (str): Stage name
+            force (tuple): Stage names to re-run even when cached
+        """
+        if name in self._results:
+            return self._results[name]
+
+        stage = self.stages[name]
+        path = self._cache_path(name)
+        if name not in force and not self.is_stale(name):
+            value = pd.read_pickle(path)
+            print(f"[{name}] cached")
+        else:
+            kwargs = {arg: self.result(upstream, force) for arg, upstream in stage.inputs.items()}
+            kwargs.update(stage.sources)
+            kwargs.update(stage.params)
+            print(f"[{name}] running")
+            with profiler.stage(f'pipeline.{name}'):
+                value = stage.func(**kwargs)
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for old in glob.glob(os.path.join(self.cache_dir, f'{name}-*.pkl')):
+                os.remove(old)
+            pd.to_pickle(value, path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+        if stage.output and (name in force or not os.path.exists(stage.output)
+                             or os.path.getmtime(stage.output) < os.path.getmtime(path)):
+            value.to_csv(stage.output, index=False)
+            print(f"[{name}] saved {stage.output}")
+        self._results[name] = value
+        return value
+
+    def run(self, targets=None, force=()):
+        """
+        Bring the target stages up to date (default: every stage)
+
+        Returns:
+            dict: Stage name -> result, for the targets
+        """
+        targets = targets or list(self.stages)
+        return {name: self.result(name, tuple(force)) for name in targets}
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, f'{name}-{self.key(name)}.pkl')
+
+
+def code_dependencies(func):
+    """
+    Code a stage function runs besides its own source
+
+    The imports of the function are followed through the modules of this
+    repository (also their module-level imports, transitively), so editing a
+    helper such as extract_calibration.compute_calibration_data changes the
+    key of every stage that reaches it.
+
+    Returns:
+        tuple: (set of repository module names, set of third-party top-level
+            package names)
+    """
+    modules, packages = set(), set()
+    pending = _imported_names(textwrap.dedent(inspect.getsource(func)))
+    while pending:
+        name = pending.pop()
+        if name in modules or name in packages or name in sys.stdlib_module_names:
+            continue
+        if os.path.exists(_module_path(name)):
+            modules.add(name)
+            with open(_module_path(name), encoding='utf-8') as f:
+                pending |= _imported_names(f.read())
+        else:
+            packages.add(name)
+    return modules, packages
+
+
+def _imported_names(source):
+    """Top-level names of every module imported in a piece of source code"""
+    names = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def _distributions():
+    # Scans every installed distribution: done once per run
+    return importlib.metadata.packages_distributions()
+
+
+def _module_path(name):
+    return os.path.join(REPO_DIR, name + '.py')
+
+
+@functools.lru_cache(maxsize=None)
+def _package_version(name):
+    """Installed version of a package, from its metadata (the package is not imported)"""
+    distributions = _distributions().get(name, [name])
+    try:
+        return importlib.metadata.version(distributions[0])
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+# Stages of the 5 min session: the same steps as the scripts, with their
+# hard-coded settings lifted into params
+
+def beats_stage(recording, analysis_rate, quality_gate):
+    """nk.ppg_process at the analysis rate over the recording, as process_ppg.py"""
+    from beat_events import beats_from_peaks
+    from resample import detect_sampling_rate, ppg_process_resampled
+    from signal_cache import load_signal, load_timestamps
+    from signal_quality import ppg_process_gated
+
+    ppg = load_signal(recording, 1)
+    sampling_rate = detect_sampling_rate(recording)
+    if quality_gate:
+        _, _, peak_times, _ = ppg_process_gated(ppg, sampling_rate, analysis_rate)
+    else:
+        _, _, peak_times = ppg_process_resampled(ppg, sampling_rate, analysis_rate)
+    return beats_from_peaks(peak_times * sampling_rate, sampling_rate, timestamps=load_timestamps(recording, 0))
+
+
+def rate_stats_stage(beats, start_time, minutes, window):
+    """Mean/min/max of the rate per window, as calculate_10s_stats.py"""
+    from beat_events import rate_series
+
+    start = pd.Timestamp(start_time)
+    return rate_series(beats, window, start, start + pd.Timedelta(minutes=minutes),
+                       stats=('mean', 'min', 'max')).round(2)
+
+
+def calibration_stage(recording, window_size, window_seconds, analysis_rate, quality_gate):
+    """Beat detection and windowed averages, as extract_calibration.py"""
+    from extract_calibration import compute_calibration_data
+    from signal_cache import load_signal
+
+    cal_df, _, _ = compute_calibration_data(load_signal(recording, 'Time'), load_signal(recording, 1),
+                                            window_size, window_seconds, analysis_rate, quality_gate)
+    return cal_df
+
+
+def calibration_resampled_stage(calibration, num_points, window_size):
+    """Calibration data averaged around evenly spaced times, as process_2sec.py"""
+    import numpy as np
+    from process_2sec import get_averaged_values
+
+    times = np.linspace(calibration['Time (s)'].min(), calibration['Time (s)'].max(), num_points)
+    return get_averaged_values(calibration, times, window_size)
+
+
+def comparison_stage(beats):
+    """Aligned sensor vs reference statistics, as heart_rate_analysis.py"""
+    from alignment import align_to_reference
+    from beat_events import rate_series
+    from heart_rate_analysis import calculate_statistics, load_sensor_data, process_data
+
+    ppg_rate = rate_series(beats, '1s')
+    sensor_df, alignment = align_to_reference(load_sensor_data(), ppg_rate)
+    ppg_processed, sensor_processed = process_data(ppg_rate, sensor_df)
+    stats, errors = calculate_statistics(sensor_processed, ppg_processed)
+    return {'ppg': ppg_processed, 'sensor': sensor_processed, 'stats': stats,
+            'errors': errors, 'alignment': alignment}
+
+
+def comparison_plot_stage(comparison, path, ylim):
+    """Comparison figure of heart_rate_analysis.py, saved to a file"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from heart_rate_analysis import create_comparison_plot
+
+    fig = create_comparison_plot(comparison['sensor'], comparison['ppg'], comparison['stats'])
+    fig.axes[0].set_ylim(*ylim)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def default_pipeline(cache_dir=CACHE_DIR):
+    return Pipeline([
+        Stage('beats', beats_stage,
+              sources={'recording': '5min_addtime.xlsx'},
+              params={'analysis_rate': 50, 'quality_gate': True},
+              output='5min_addtime_beats.csv'),
+        Stage('rate_10s', rate_stats_stage,
+              inputs={'beats': 'beats'},
+              params={'start_time': '2025-07-26 11:42:47', 'minutes': 5, 'window': '10s'},
+              output='every10second_attime.csv'),
+        Stage('calibration', calibration_stage,
+              sources={'recording': '5min.csv'},
+              params={'window_size': 200, 'window_seconds': None, 'analysis_rate': 50, 'quality_gate': False},
+              output='calibration_data_averaged.csv'),
+        Stage('calibration_resampled', calibration_resampled_stage,
+              inputs={'calibration': 'calibration'},
+              params={'num_points': 150, 'window_size': 1.0},
+              output='calibration_data.csv'),
+        Stage('comparison', comparison_stage,
+              inputs={'beats': 'beats'}),
+        Stage('comparison_plot', comparison_plot_stage,
+              inputs={'comparison': 'comparison'},
+              params={'path': os.path.join('figures', 'heart_rate_comparison.png'), 'ylim': [75, 115]},
+              writes=('path',)),
+    ], cache_dir)
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the analysis outputs up to date, re-running only stale stages")
+    parser.add_argument('targets', nargs='*', help="Stages to bring up to date (default: all)")
+    parser.add_argument('--set', action='append', default=[], metavar='STAGE.PARAM=VALUE',
+                        help="Override a stage parameter (value parsed as JSON when possible)")
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help="Re-run a stage even if its result is cached")
+    parser.add_argument('--list', action='store_true', help="List stages and whether they are stale")
+    parser.add_argument('--profile', metavar='FILE', help="Append per-stage timings to a JSON-lines file")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable(args.profile)
+    pipeline = default_pipeline()
+    for assignment in args.set:
+        target, value = assignment.split('=', 1)
+        stage, param = target.split('.', 1)
+        pipeline.set_param(stage, param, _parse_value(value))
+
+    if args.list:
+        for name, stage in pipeline.stages.items():
+            state = 'stale' if pipeline.is_stale(name) else 'cached'
+            print(f"{name:24s} {state:7s} <- {', '.join(list(stage.inputs.values()) + list(stage.sources.values()))}")
+    else:
+        results = pipeline.run(args.targets, args.force)
+        if 'comparison' in results:
+            for error_type, value in results['comparison']['errors'].items():
+                print(f"{error_type}: {value:.2f} BPM")
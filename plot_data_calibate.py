@@ -1,8 +1,11 @@
-import neurokit2 as nk
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import os
 import pandas as pd
+from calibration_model import MODELS_FILE, load_models
+from excel_cache import read_excel_cached
+from plotting import show_or_save
 
 
 
@@ -10,7 +13,7 @@ import pandas as pd
 
 
 # Read PPG data from Calibration.xlsx (columns 'Sensor' and 'Biopac')
-df = pd.read_excel("Calibration.xlsx")
+df = read_excel_cached("Calibration.xlsx", columns=['Timestamp', 'Sensor', 'Biopac'])
 print("Available columns:", df.columns.tolist())
 
 if not all(col in df.columns for col in ['Timestamp', 'Sensor', 'Biopac']):
@@ -29,6 +32,11 @@ timestamp = df['Timestamp']
 plt.figure(figsize=(14, 6))
 plt.plot(timestamp, sensor_data, marker='o', label='Sensor')
 plt.plot(timestamp, biopac_data, marker='x', label='Biopac')
+
+# Sensor หลัง calibrate (ถ้ามีโมเดลจาก calibration_model.py fit)
+if os.path.exists(MODELS_FILE):
+    model = load_models()['sensor']
+    plt.plot(timestamp, model.apply(sensor_data), marker='.', label=f'Sensor ({model.kind} calibrated)')
 plt.xlabel('Time')
 plt.ylabel('Heart Rate (BPM)')
 plt.title('Comparison: Heart Rate (Sensor vs Biopac) from Calibration.xlsx')
@@ -44,4 +52,4 @@ end_time = pd.Timestamp('2025-07-26 11:47:47')
 plt.xlim(start_time, end_time)
 
 plt.tight_layout()
-plt.show()
+show_or_save(name='plot_data_calibate')
@@ -0,0 +1,45 @@
+import os
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+from profiler import stage
+
+# Backends that cannot open a window (e.g. MPLBACKEND=Agg on a server)
+NON_INTERACTIVE_BACKENDS = {'agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template'}
+FIGURE_DIR = os.environ.get('PPG_FIGURE_DIR', 'figures')
+
+
+def is_headless():
+    """Check whether matplotlib runs with a non-interactive backend"""
+    return matplotlib.get_backend().lower() in NON_INTERACTIVE_BACKENDS
+
+
+def show_or_save(fig=None, name='figure', formats=('png',), figure_dir=None):
+    """
+    Show a figure, or save it to FIGURE_DIR when running headless
+
+    Scripts call this instead of plt.show(), so running them with
+    MPLBACKEND=Agg writes their figures instead of blocking.
+
+    Args:
+        fig (Figure): Figure to show or save (default: current figure)
+        name (str): File name without extension used when saving
+        formats (tuple): File formats used when saving
+        figure_dir (str): Output directory (default: $PPG_FIGURE_DIR or 'figures')
+    """
+    if not is_headless():
+        plt.show()
+        return []
+
+    fig = fig or plt.gcf()
+    figure_dir = figure_dir or FIGURE_DIR
+    os.makedirs(figure_dir, exist_ok=True)
+    paths = []
+    with stage('savefig', figure=name):
+        for fmt in formats:
+            path = os.path.join(figure_dir, f'{name}.{fmt}')
+            fig.savefig(path)
+            paths.append(path)
+    print(f"Saved figure to {', '.join(paths)}")
+    return paths
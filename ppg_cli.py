@@ -0,0 +1,243 @@
+import argparse
+import os
+import sys
+
+# Only the standard library is imported here: every command imports what it
+# needs when it runs, so `stats` (numpy only) starts without pandas, scipy,
+# matplotlib or neurokit2, and --help without anything at all
+
+
+def cmd_convert(args):
+    """ACQ recording -> CSV (as convert_csv.py) or chunked store of raw counts"""
+    from convert_csv import convert_acq_to_csv, convert_acq_to_store
+
+    if args.store:
+        convert_acq_to_store(args.source, args.output)
+    else:
+        convert_acq_to_csv(args.source, args.output)
+
+
+def cmd_process(args):
+    """Recording -> beat events (as process_ppg.py, without the figure)"""
+    import numpy as np
+    from beat_events import beats_from_peaks, write_beats
+    from resample import CANONICAL_RATE, ppg_process_resampled
+    from signal_container import signal_from_source
+    from signal_quality import ppg_process_gated
+
+    signal = signal_from_source(args.source, 1)
+    rate = args.rate or CANONICAL_RATE
+    ppg = np.asarray(signal, dtype=np.float64)
+    if args.no_gate:
+        _, _, peak_times = ppg_process_resampled(ppg, signal.sampling_rate, rate)
+    else:
+        _, _, peak_times, quality = ppg_process_gated(ppg, signal.sampling_rate, rate)
+        print(f"Usable windows: {quality['usable'].sum()} of {len(quality)}")
+
+    beats = beats_from_peaks(peak_times * signal.sampling_rate, signal.sampling_rate,
+                             **_beat_timing(args.source, args.start or signal.t0))
+    output = args.output or os.path.splitext(args.source.rstrip('/\\'))[0] + '_beats.csv'
+    write_beats(beats, output)
+    good = beats.loc[beats['Quality'] == 1, 'PPG_Rate']
+    print(f"Saved {len(beats)} beats ({(beats['Quality'] == 0).sum()} flagged) to {output}")
+    print(f"Average PPG Rate: {good.mean():.2f} BPM")
+
+
+def cmd_stats(args):
+    """Beat events -> mean/min/max rate per window (as calculate_10s_stats.py)"""
+    import numpy as np
+    from beat_events import read_beat_arrays, rate_arrays
+
+    bounds = [None if b is None else np.datetime64(b.replace(' ', 'T'), 'us') for b in (args.start, args.end)]
+    columns = None
+    if args.session:
+        from beat_store import BeatStore
+        with BeatStore(args.store) as store:
+            beats = store.beats(args.session, min_quality=1)
+        times, rates = beats['Timestamp'].to_numpy('datetime64[us]'), beats['PPG_Rate'].to_numpy()
+    else:
+        # Whole-second windows are merged from the rollup pyramid of the beat file
+        from rollup import load_pyramid
+        try:
+            bin_starts, columns = load_pyramid(args.beats).query(args.window, *bounds)
+        except ValueError:
+            times, rates = read_beat_arrays(args.beats)
+    if columns is None:
+        bin_starts, columns = rate_arrays(times, rates, args.window, *bounds, stats=('mean', 'min', 'max'))
+
+    table = np.column_stack([columns['mean'], columns['min'], columns['max']]).round(2)
+    # Fractions of a second only when a window starts inside one, as pandas to_csv writes them
+    micros = bin_starts.astype('datetime64[us]').astype(np.int64)
+    unit = 's' if not (micros % 1_000_000).any() else 'ms' if not (micros % 1000).any() else 'us'
+    labels = np.datetime_as_string(bin_starts, unit=unit)
+    lines = ['Timestamp,Mean_Rate,Min_Rate,Max_Rate']
+    # Empty bins (no good beat) are left blank, as pandas to_csv writes NaN
+    cells = np.where(np.isnan(table), '', table.astype(str))
+    lines += [label.replace('T', ' ') + ',' + ','.join(row) for label, row in zip(labels, cells)]
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        print(f"Saved {len(table)} windows to {args.output}")
+    else:
+        print('\n'.join(lines))
+    print(f"Mean Rate range: {table[:, 0].min():.2f} to {table[:, 0].max():.2f}, "
+          f"Absolute Min: {table[:, 1].min():.2f}, Absolute Max: {table[:, 2].max():.2f}", file=sys.stderr)
+
+
+def cmd_compare(args):
+    """Sensor vs reference statistics (as heart_rate_analysis.py)"""
+    from alignment import align_to_reference, alignment_summary
+    from beat_events import load_ppg_rate
+    from heart_rate_analysis import calculate_statistics, load_sensor_data, print_statistics, process_data
+
+    ppg_df = load_ppg_rate('1s', beats_path=args.beats)
+    sensor_df, alignment = align_to_reference(load_sensor_data(), ppg_df)
+    print(alignment_summary(alignment))
+    ppg_processed, sensor_processed = process_data(ppg_df, sensor_df)
+    stats, errors = calculate_statistics(sensor_processed, ppg_processed)
+    print_statistics(stats, errors)
+    if args.plot:
+        from heart_rate_analysis import create_comparison_plot
+        from plotting import show_or_save
+        show_or_save(create_comparison_plot(sensor_processed, ppg_processed, stats), name='heart_rate_comparison')
+
+
+def cmd_plot(args):
+    """Figures: beat rate series, sensor comparison or calibration pairs"""
+    if args.figure == 'comparison':
+        args.plot = True
+        cmd_compare(args)
+    elif args.figure == 'calibration':
+        import runpy
+        runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plot_data_calibate.py'),
+                       run_name='__main__')
+    else:
+        import matplotlib.pyplot as plt
+        from beat_events import rate_series, read_beats
+        from plotting import show_or_save
+
+        series = rate_series(read_beats(args.beats), args.window, stats=('mean', 'min', 'max'))
+        fig, ax = plt.subplots(figsize=(14, 6))
+        ax.fill_between(series['Timestamp'], series['Min_Rate'], series['Max_Rate'], alpha=0.3, label='Min-Max')
+        ax.plot(series['Timestamp'], series['Mean_Rate'], label=f'Mean ({args.window})')
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Heart Rate (BPM)')
+        ax.set_title('PPG Rate Over Time')
+        ax.legend()
+        fig.tight_layout()
+        show_or_save(fig, name='ppg_rate')
+
+
+def cmd_calibrate(args):
+    """Fit calibration models, or apply one to a CSV column or a cloud store"""
+    import calibration_model as cm
+
+    if args.action == 'fit':
+        kwargs = {'n_segments': args.segments} if args.kind == 'piecewise' else {}
+        models = {'sensor': cm.fit(*cm.sensor_pairs(), kind=args.kind, **kwargs),
+                  'cloud': cm.fit(*cm.cloud_pairs(), kind=args.kind, **kwargs)}
+        cm.save_models(models, args.models)
+        for device, model in models.items():
+            print(f"{device}: {model.kind} fit on {model.info['n']} pairs, "
+                  f"MAE {model.info['mae_before']:.2f} -> {model.info['mae_after']:.2f} BPM")
+        return
+
+    model = cm.load_models(args.models)[args.device]
+    if os.path.isdir(args.target):
+        n_rows = cm.recalibrate_store(args.target, model)
+        print(f"Recalibrated {n_rows} rows of {args.target}")
+        return
+    import pandas as pd
+    from cloud_ingest import VALUE_COLUMNS
+    df = pd.read_csv(args.target)
+    raw = pd.to_numeric(df[args.column], errors='coerce')
+    if args.column in VALUE_COLUMNS:
+        raw = raw.mask(raw == VALUE_COLUMNS[args.column])  # sentinel (no reading) stays empty
+    df[args.column + ' (calibrated)'] = model.apply(raw).round(2)
+    output = args.output or os.path.splitext(args.target)[0] + '_calibrated.csv'
+    df.to_csv(output, index=False)
+    print(f"Saved {len(df)} calibrated rows to {output}")
+
+
+def _beat_timing(source, start=None):
+    """
+    How beats_from_peaks times the beats: from the start of the recording
+    (--start, store/ACQ header), or for Excel recordings by interpolating
+    the timestamp column, whose first row may be a glitch (see beat_events)
+    """
+    if start is not None:
+        return {'start_time': start}
+    if os.path.splitext(source)[1].lower() in ('.xlsx', '.xlsm', '.xls'):
+        from signal_cache import load_timestamps
+        return {'timestamps': load_timestamps(source, 0)}
+    sys.exit(f"{source} has relative times only; pass --start 'YYYY-MM-DD HH:MM:SS'")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ppg_cli.py', description="PPG processing commands")
+    parser.add_argument('--profile', metavar='FILE', help="Append per-stage timings to a JSON-lines file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('convert', help=cmd_convert.__doc__)
+    p.add_argument('source', help=".acq recording")
+    p.add_argument('--output', default=None, help="CSV file or store directory (default: next to the source)")
+    p.add_argument('--store', action='store_true', help="Write a chunked store instead of a CSV")
+    p.set_defaults(func=cmd_convert)
+
+    p = commands.add_parser('process', help=cmd_process.__doc__)
+    p.add_argument('source', help="CSV/Excel recording or store directory")
+    p.add_argument('--output', default=None, help="Beat CSV (default: <source>_beats.csv)")
+    p.add_argument('--start', default=None, help="Timestamp of the first sample (CSV recordings)")
+    p.add_argument('--rate', type=float, default=None, help="Analysis rate (Hz, default: resample.CANONICAL_RATE)")
+    p.add_argument('--no-gate', action='store_true', help="Process every window, also unusable ones")
+    p.set_defaults(func=cmd_process)
+
+    p = commands.add_parser('stats', help=cmd_stats.__doc__)
+    p.add_argument('beats', nargs='?', default='5min_addtime_beats.csv', help="Beat CSV")
+    p.add_argument('--window', default='10s', help="Window, e.g. 2s, 10s, 1min")
+    p.add_argument('--start', default=None)
+    p.add_argument('--end', default=None)
+    p.add_argument('--output', default=None, help="CSV file (default: print)")
+    p.add_argument('--session', default=None, help="Read the beats of this session from the result store")
+    p.add_argument('--store', default='ppg_results.db', help="Result store (see beat_store.py)")
+    p.set_defaults(func=cmd_stats)
+
+    p = commands.add_parser('compare', help=cmd_compare.__doc__)
+    p.add_argument('--beats', default='5min_addtime_beats.csv', help="Beat CSV of the reference")
+    p.add_argument('--plot', action='store_true', help="Also show or save the comparison figure")
+    p.set_defaults(func=cmd_compare)
+
+    p = commands.add_parser('plot', help=cmd_plot.__doc__)
+    p.add_argument('figure', choices=['rate', 'comparison', 'calibration'])
+    p.add_argument('--beats', default='5min_addtime_beats.csv', help="Beat CSV")
+    p.add_argument('--window', default='10s', help="Window of the rate figure")
+    p.set_defaults(func=cmd_plot)
+
+    p = commands.add_parser('calibrate', help=cmd_calibrate.__doc__)
+    p.add_argument('action', choices=['fit', 'apply'])
+    p.add_argument('target', nargs='?', help="apply: CSV file or cloud store directory")
+    p.add_argument('--models', default='calibration_models.json', help="Model JSON file")
+    p.add_argument('--kind', choices=['linear', 'piecewise', 'isotonic'], default='linear')
+    p.add_argument('--segments', type=int, default=3, help="Segments of a piecewise model")
+    p.add_argument('--device', default='cloud', help="apply: model to use")
+    p.add_argument('--column', default='Raw HR', help="apply: column of the CSV to calibrate")
+    p.add_argument('--output', default=None, help="apply: output CSV")
+    p.set_defaults(func=cmd_calibrate)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'calibrate' and args.action == 'apply' and not args.target:
+        parser.error("calibrate apply needs a CSV file or store directory")
+    # profiler is standard library only, so timing the command costs no startup
+    from profiler import enable, stage
+    if args.profile:
+        enable(args.profile)
+    with stage(args.command):
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
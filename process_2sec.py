@@ -1,52 +1,90 @@
 import pandas as pd
 import numpy as np
 
-# อ่านไฟล์ CSV
-df = pd.read_csv(r'c:\Users\satit\OneDrive\เดสก์ท็อป\Personal Monitor\calibration_data.csv')
+# สร้างฟังก์ชันสำหรับหาค่าเฉลี่ยรอบๆ แต่ละจุดเวลา
+def get_averaged_values(df, times, window_size=1.0,
+                        columns=('Heart_Rate (BPM)', 'Raw_Signal', 'Filtered_Signal')):
+    """
+    Average each column over a window of window_size seconds centred on every
+    target time. Targets with no sample in their window take the values of
+    the nearest sample.
 
-# สร้างช่วงเวลาใหม่ที่มีระยะห่างเท่ากัน
-start_time = df['Time (s)'].min()
-end_time = df['Time (s)'].max()
-num_points = 150  # จำนวนจุดที่ต้องการ
-new_times = np.linspace(start_time, end_time, num_points)
+    Window bounds come from np.searchsorted on the sorted time column and
+    window sums from prefix sums, so the cost is O(N + M) for N samples and
+    M target times.
 
-# สร้างฟังก์ชันสำหรับหาค่าเฉลี่ยรอบๆ แต่ละจุดเวลา
-def get_averaged_values(df, times, window_size=1.0):
-    result_data = []
-    for t in times:
-        # หาข้อมูลในช่วง window_size วินาทีรอบๆ เวลาที่สนใจ
-        mask = (df['Time (s)'] >= t - window_size/2) & (df['Time (s)'] <= t + window_size/2)
-        window_data = df[mask]
-        
-        # ถ้าไม่มีข้อมูลในช่วง ให้ใช้ข้อมูลที่ใกล้ที่สุด
-        if len(window_data) == 0:
-            closest_idx = (df['Time (s)'] - t).abs().idxmin()
-            window_data = df.iloc[[closest_idx]]
-        
-        result_data.append({
-            'Time (s)': t,
-            'Heart_Rate (BPM)': window_data['Heart_Rate (BPM)'].mean(),
-            'Raw_Signal': window_data['Raw_Signal'].mean(),
-            'Filtered_Signal': window_data['Filtered_Signal'].mean()
-        })
-    
-    return pd.DataFrame(result_data)
-
-# ประมวลผลข้อมูล
-processed_df = get_averaged_values(df, new_times)
-
-# บันทึกลงไฟล์ CSV
-processed_df.to_csv('calibration_data.csv', index=False)
-
-print(f"บันทึกข้อมูลเรียบร้อยแล้ว")
-print(f"จำนวนข้อมูลที่เก็บได้: {len(processed_df)} ค่า")
-print(f"ช่วงเวลาระหว่างแต่ละจุด: {(end_time - start_time) / (num_points - 1):.2f} วินาที")
-print("\nตัวอย่าง 5 ค่าแรก:")
-print(processed_df.head())
-
-interval = (end_time - start_time) / (num_points - 1)
-print(f"บันทึกข้อมูลเรียบร้อยแล้ว")
-print(f"จำนวนข้อมูลที่เก็บได้: {len(processed_df)} ค่า")
-print(f"ช่วงเวลาระหว่างแต่ละจุด: {interval:.2f} วินาที")
-print("\nตัวอย่าง 5 ค่าแรก:")
-print(processed_df.head())
+    Args:
+        df (DataFrame): Data with a 'Time (s)' column
+        times (array): Target times (s)
+        window_size (float): Window length around each target time (s)
+        columns (tuple): Columns to average
+    """
+    times = np.asarray(times, dtype=np.float64)
+    sample_times = df['Time (s)'].to_numpy(dtype=np.float64)
+
+    # เรียงข้อมูลตามเวลา (ข้ามแถวที่ไม่มีเวลา)
+    order = np.argsort(sample_times, kind='stable')
+    order = order[~np.isnan(sample_times[order])]
+    sorted_times = sample_times[order]
+
+    # หาขอบเขตของแต่ละช่วงเวลา [t - window_size/2, t + window_size/2]
+    left = np.searchsorted(sorted_times, times - window_size/2, side='left')
+    right = np.searchsorted(sorted_times, times + window_size/2, side='right')
+    counts = right - left
+
+    # ถ้าไม่มีข้อมูลในช่วง ให้ใช้ข้อมูลที่ใกล้ที่สุด (แถวแรกเมื่อระยะเท่ากัน เหมือน idxmin)
+    before = np.clip(left - 1, 0, len(sorted_times) - 1)
+    after = np.clip(left, 0, len(sorted_times) - 1)
+    before = np.searchsorted(sorted_times, sorted_times[before], side='left')
+    d_before = np.abs(times - sorted_times[before])
+    d_after = np.abs(sorted_times[after] - times)
+    nearest = np.where((d_before < d_after) |
+                       ((d_before == d_after) & (order[before] < order[after])),
+                       before, after)
+
+    result = {'Time (s)': times}
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)[order]
+        valid = ~np.isnan(values)
+        sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+        valid_counts = np.concatenate([[0], np.cumsum(valid)])
+
+        window_sums = sums[right] - sums[left]
+        window_counts = valid_counts[right] - valid_counts[left]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = window_sums / window_counts
+        means[window_counts == 0] = np.nan
+        means[counts == 0] = values[nearest[counts == 0]]
+        result[column] = means
+
+    return pd.DataFrame(result)
+
+
+if __name__ == "__main__":
+    # อ่านไฟล์ CSV
+    df = pd.read_csv(r'c:\Users\satit\OneDrive\เดสก์ท็อป\Personal Monitor\calibration_data.csv')
+
+    # สร้างช่วงเวลาใหม่ที่มีระยะห่างเท่ากัน
+    start_time = df['Time (s)'].min()
+    end_time = df['Time (s)'].max()
+    num_points = 150  # จำนวนจุดที่ต้องการ
+    new_times = np.linspace(start_time, end_time, num_points)
+
+    # ประมวลผลข้อมูล
+    processed_df = get_averaged_values(df, new_times)
+
+    # บันทึกลงไฟล์ CSV
+    processed_df.to_csv('calibration_data.csv', index=False)
+
+    print(f"บันทึกข้อมูลเรียบร้อยแล้ว")
+    print(f"จำนวนข้อมูลที่เก็บได้: {len(processed_df)} ค่า")
+    print(f"ช่วงเวลาระหว่างแต่ละจุด: {(end_time - start_time) / (num_points - 1):.2f} วินาที")
+    print("\nตัวอย่าง 5 ค่าแรก:")
+    print(processed_df.head())
+
+    interval = (end_time - start_time) / (num_points - 1)
+    print(f"บันทึกข้อมูลเรียบร้อยแล้ว")
+    print(f"จำนวนข้อมูลที่เก็บได้: {len(processed_df)} ค่า")
+    print(f"ช่วงเวลาระหว่างแต่ละจุด: {interval:.2f} วินาที")
+    print("\nตัวอย่าง 5 ค่าแรก:")
+    print(processed_df.head())
@@ -1,32 +1,39 @@
-import neurokit2 as nk
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
+from signal_cache import load_signal, load_timestamps
+from plotting import show_or_save
+from resample import detect_sampling_rate
+from signal_quality import ppg_process_gated
+from beat_events import BEATS_FILE, beats_from_peaks, write_beats
+from profiler import stage
 
 
 # Read PPG data from Excel file (assume 2nd column is PPG, 1st column is timestamp)
-df = pd.read_excel("5min_addtime.xlsx")
-print("Available columns:", df.columns.tolist())
-ppg_data = df.iloc[:, 1].values
-timestamp = df.iloc[:, 0].values
+with stage('load_recording'):
+    ppg_data = load_signal("5min_addtime.xlsx", 1)
+    timestamp = load_timestamps("5min_addtime.xlsx", 0)
 
 
-# Set your actual sampling rate here (Hz)
-sampling_rate = 200
+# Sampling rate from the time column (Hz)
+sampling_rate = detect_sampling_rate("5min_addtime.xlsx")
 
 
-# Process the PPG signal
-signals, info = nk.ppg_process(ppg_data, sampling_rate=sampling_rate)
+# Process the PPG signal at the canonical analysis rate (anti-aliased decimation),
+# skipping windows that fail the signal quality gates (artifact, flat, clipped)
+signals, analysis_rate, peak_times, quality = ppg_process_gated(ppg_data, sampling_rate)
+print(f"Usable windows: {quality['usable'].sum()} of {len(quality)}")
+time = signals.index.values / analysis_rate  # convert index to seconds
 
 
 
-# Extract PPG rate (BPM)
-ppg_rate = signals["PPG_Rate"].values
-
-# Save Timestamp and PPG_Rate to new CSV
-df_out = pd.DataFrame({'Timestamp': timestamp, 'PPG_Rate': ppg_rate})
-df_out.to_csv('5min_addtime_with_rate.csv', index=False)
-print('Saved Timestamp and PPG Rate to 5min_addtime_with_rate.csv')
+# One row per beat (sample, timestamp, rate, quality) instead of one per sample,
+# timed from the recorded Timestamp column at each peak position;
+# any regular-grid rate series is computed from it with beat_events.rate_series
+beats = beats_from_peaks(peak_times * sampling_rate, sampling_rate, timestamps=timestamp)
+ppg_rate = beats.loc[beats['Quality'] == 1, 'PPG_Rate']
+with stage('to_csv', rows=len(beats)):
+    write_beats(beats, BEATS_FILE)
+print(f'Saved {len(beats)} beats ({(beats["Quality"] == 0).sum()} flagged) to {BEATS_FILE}')
 
 print(f"Average PPG Rate: {np.nanmean(ppg_rate):.2f} BPM")
 print(f"Min PPG Rate: {np.nanmin(ppg_rate):.2f} BPM")
@@ -39,11 +46,11 @@ axs[0].set_ylabel("Amplitude")
 axs[0].set_title("Cleaned PPG Signal")
 axs[0].legend()
 
-axs[1].plot(time, ppg_rate, label="PPG Rate (BPM)")
+axs[1].plot(time, signals["PPG_Rate"], label="PPG Rate (BPM)")
 axs[1].set_xlabel("Time (s)")
 axs[1].set_ylabel("Rate (BPM)")
 axs[1].set_title("PPG Rate Over Time")
 axs[1].legend()
 
 plt.tight_layout()
-plt.show()
+show_or_save(name='process_ppg')
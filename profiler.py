@@ -0,0 +1,250 @@
+import argparse
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# PPG_PROFILE=<file.jsonl> (or 1 for profile.jsonl) turns the profiler on for
+# any script, appending to the file across runs; PPG_PROFILE_CHROME=<file.json>
+# also writes a Chrome trace of the run (open it in chrome://tracing or
+# https://ui.perfetto.dev). `python profiler.py <file.jsonl> --chrome <file.json>`
+# converts a whole JSON-lines profile, e.g. of a batch with worker processes.
+PROFILE_ENV = 'PPG_PROFILE'
+CHROME_ENV = 'PPG_PROFILE_CHROME'
+DEFAULT_PATH = 'profile.jsonl'
+
+
+class _Profiler:
+    def __init__(self):
+        self.path = None
+        self.chrome_path = None
+        self.events = []
+        self.local = threading.local()
+        self.script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+        self._registered = False
+
+    @property
+    def enabled(self):
+        return self.path is not None or self.chrome_path is not None
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+
+_profiler = _Profiler()
+
+
+class StageRecord:
+    """Counters of one running stage; set `rows` to the number of rows or samples processed"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.extra = {}
+
+
+def enable(path=DEFAULT_PATH, chrome_path=None):
+    """
+    Turn the profiler on for this process
+
+    Args:
+        path (str): JSON-lines file every finished stage is appended to (None: no JSON lines)
+        chrome_path (str): Chrome trace file written when the process exits (optional)
+    """
+    _profiler.path = path
+    _profiler.chrome_path = chrome_path
+    # Worker processes started with spawn (e.g. on Windows) enable themselves from these
+    if path:
+        os.environ[PROFILE_ENV] = path
+    if chrome_path:
+        os.environ[CHROME_ENV] = chrome_path
+    if chrome_path and not _profiler._registered:
+        atexit.register(_write_chrome_trace)
+        _profiler._registered = True
+
+
+def is_enabled():
+    return _profiler.enabled
+
+
+@contextmanager
+def stage(name, rows=None, **extra):
+    """
+    Measure a block of work as one stage
+
+    Records wall time, CPU time, peak RSS of the process at the end of the
+    stage, the rows counter and the stage nesting. Costs nothing but a
+    function call when the profiler is off.
+
+        with stage('nk.ppg_process', rows=len(ppg)):
+            signals, info = nk.ppg_process(ppg, sampling_rate=sampling_rate)
+
+    Args:
+        name (str): Stage name
+        rows (int): Rows or samples processed (can also be set on the yielded record)
+        **extra: Additional JSON-serializable fields stored with the stage
+    """
+    record = StageRecord(name)
+    record.rows = rows
+    record.extra = extra
+    if not _profiler.enabled:
+        yield record
+        return
+
+    stack = _profiler.stack()
+    parent = stack[-1].name if stack else None
+    stack.append(record)
+    started = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stack.pop()
+        event = {
+            'script': _profiler.script,
+            'stage': name,
+            'parent': parent,
+            'depth': len(stack),
+            'start': round(started, 6),
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'rows': record.rows,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        event.update(record.extra)
+        _emit(event)
+
+
+def profiled(name=None):
+    """Decorator running a function as a stage (default name: module.function)"""
+    def decorator(func):
+        stage_name = name or f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB (None where it cannot be read)"""
+    if resource is None:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 2**20, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+def summarize(events):
+    """
+    Total time, CPU, calls, rows and peak RSS per (script, stage), slowest first
+
+    Args:
+        events (list): Stage events as written to the JSON-lines file
+    """
+    totals = {}
+    for event in events:
+        key = (event['script'], event['stage'])
+        total = totals.setdefault(key, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0, 'peak_rss_mb': 0})
+        total['calls'] += 1
+        total['wall_s'] += event['wall_s']
+        total['cpu_s'] += event['cpu_s']
+        total['rows'] += event.get('rows') or 0
+        total['peak_rss_mb'] = max(total['peak_rss_mb'], event.get('peak_rss_mb') or 0)
+    return sorted(totals.items(), key=lambda item: -item[1]['wall_s'])
+
+
+def read_events(path):
+    """Read the stage events of a JSON-lines profile"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _emit(event):
+    if _profiler.path:
+        with open(_profiler.path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+    if _profiler.chrome_path:
+        _profiler.events.append(event)
+
+
+def write_chrome_trace(events, path):
+    """Write stage events as a Chrome trace (complete 'X' events, one row per process/thread)"""
+    trace = []
+    for event in events:
+        args = {k: v for k, v in event.items()
+                if k not in ('stage', 'start', 'wall_s', 'pid', 'tid') and v is not None}
+        trace.append({
+            'name': event['stage'],
+            'cat': event['script'],
+            'ph': 'X',
+            'ts': event['start'] * 1e6,
+            'dur': event['wall_s'] * 1e6,
+            'pid': event['pid'],
+            'tid': event['tid'],
+            'args': args,
+        })
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+
+
+def _write_chrome_trace():
+    if _profiler.events:
+        write_chrome_trace(_profiler.events, _profiler.chrome_path)
+
+
+def _enable_from_environment():
+    path = os.environ.get(PROFILE_ENV)
+    chrome_path = os.environ.get(CHROME_ENV)
+    if path in ('', '0'):
+        path = None
+    elif path == '1':
+        path = DEFAULT_PATH
+    if path or chrome_path:
+        enable(path, chrome_path)
+
+
+_enable_from_environment()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a stage profile written with PPG_PROFILE=<file>")
+    parser.add_argument('profile', nargs='?', default=DEFAULT_PATH, help="JSON-lines profile")
+    parser.add_argument('--script', help="Only stages of this script")
+    parser.add_argument('--chrome', help="Also convert the profile to a Chrome trace file")
+    args = parser.parse_args()
+
+    events = read_events(args.profile)
+    if args.script:
+        events = [e for e in events if e['script'] == args.script]
+    if args.chrome:
+        write_chrome_trace(events, args.chrome)
+        print(f"Saved Chrome trace to {args.chrome}")
+
+    print(f"{'script':28s} {'stage':36s} {'calls':>5s} {'wall s':>9s} {'cpu s':>9s} {'rows':>11s} {'peak MB':>8s}")
+    for (script, name), total in summarize(events):
+        print(f"{script:28s} {name:36s} {total['calls']:5d} {total['wall_s']:9.3f} {total['cpu_s']:9.3f} "
+              f"{total['rows']:11d} {total['peak_rss_mb']:8.1f}")
@@ -0,0 +1,216 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')  # headless: never open a window, even if a display exists
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import pandas as pd
+
+RATE_SUFFIX = '_with_rate.csv'
+STATS_SUFFIX = '_every10s.csv'
+SENSOR_SUFFIX = '_sensor.csv'
+CALIBRATION_SUFFIX = '_calibration.xlsx'
+FIVE_MINUTES = 5 / (24 * 60)  # in matplotlib date units (days)
+
+
+class RateTemplate:
+    """PPG rate over time with the 10 s mean and min/max band"""
+
+    def __init__(self, time_axis):
+        self.time_axis = time_axis
+        self.fig, self.ax = plt.subplots(figsize=(14, 6))
+        self.rate_line, = self.ax.plot([], [], 'orange', label='PPG Rate', linewidth=1, alpha=0.7)
+        self.mean_line, = self.ax.plot([], [], 'r.-', label='10 s mean')
+        self.band = None
+
+        self.ax.grid(True, linestyle='--', alpha=0.3)
+        self.ax.set_title('PPG Rate Over Time')  # reserves room for the title in tight_layout
+        self.ax.set_ylabel('Heart Rate (BPM)')
+        self.ax.legend(frameon=True, loc='upper right')
+        if time_axis:
+            self.ax.xaxis_date()
+            self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+            self.ax.set_xlabel('Time')
+        else:
+            self.ax.set_xlabel('Time (s)')
+        self.fig.tight_layout()
+
+    def update(self, name, rate_x, rate, stats_x=None, stats=None):
+        self.ax.set_title(f'PPG Rate Over Time: {name}')
+        self.rate_line.set_data(rate_x, rate)
+        if self.band is not None:
+            self.band.remove()
+            self.band = None
+        if stats is not None:
+            self.mean_line.set_data(stats_x, stats['Mean_Rate'])
+            self.band = self.ax.fill_between(stats_x, stats['Min_Rate'], stats['Max_Rate'],
+                                             color='red', alpha=0.1)
+        else:
+            self.mean_line.set_data([], [])
+        _autoscale(self.ax)
+
+
+class CalibrationTemplate:
+    """Sensor vs Biopac readings, as in plot_data_calibate.py"""
+
+    def __init__(self):
+        self.fig, self.ax = plt.subplots(figsize=(14, 6))
+        self.sensor_line, = self.ax.plot([], [], marker='o', label='Sensor')
+        self.biopac_line, = self.ax.plot([], [], marker='x', label='Biopac')
+        self.ax.set_title('Comparison: Heart Rate (Sensor vs Biopac)')
+        self.ax.set_xlabel('Time')
+        self.ax.set_ylabel('Heart Rate (BPM)')
+        self.ax.legend()
+        self.ax.xaxis_date()
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+        self.ax.xaxis.set_major_locator(mdates.SecondLocator(interval=30))
+        self.ax.set_xlim(0, FIVE_MINUTES)
+        self.fig.tight_layout()
+
+    def update(self, name, df):
+        x = mdates.date2num(df['Timestamp'])
+        self.ax.set_title(f'Comparison: Heart Rate (Sensor vs Biopac) from {name}')
+        self.sensor_line.set_data(x, pd.to_numeric(df['Sensor'], errors='coerce'))
+        self.biopac_line.set_data(x, pd.to_numeric(df['Biopac'], errors='coerce'))
+        _autoscale(self.ax)
+
+
+# Templates are built once per worker process and reused for every session
+_templates = {}
+
+
+def get_template(kind, *args):
+    key = (kind,) + args
+    if key not in _templates:
+        _templates[key] = {
+            'rate': RateTemplate,
+            'calibration': CalibrationTemplate,
+        }[kind](*args)
+    return _templates[key]
+
+
+def find_sessions(directory):
+    """
+    Find the sessions of a directory, as written by batch_process.py
+
+    Every <name>_with_rate.csv is a session; <name>_every10s.csv,
+    <name>_sensor.csv (Timestamp, My sensor) and <name>_calibration.xlsx
+    (Timestamp, Sensor, Biopac) are picked up when present.
+    """
+    sessions = []
+    for rate_path in sorted(glob.glob(os.path.join(directory, '*' + RATE_SUFFIX))):
+        base = rate_path[:-len(RATE_SUFFIX)]
+        session = {'name': os.path.basename(base), 'rate': rate_path}
+        for key, suffix in (('stats', STATS_SUFFIX), ('sensor', SENSOR_SUFFIX),
+                            ('calibration', CALIBRATION_SUFFIX)):
+            if os.path.exists(base + suffix):
+                session[key] = base + suffix
+        sessions.append(session)
+    return sessions
+
+
+def render_session(session, out_dir, formats=('png',)):
+    """Render every figure of one session and return the written paths"""
+    name = session['name']
+    paths = []
+
+    ppg_df = pd.read_csv(session['rate'])
+    time_axis = 'Timestamp' in ppg_df.columns
+    if time_axis:
+        ppg_df['Timestamp'] = pd.to_datetime(ppg_df['Timestamp'])
+        rate_x = mdates.date2num(ppg_df['Timestamp'])
+    else:
+        rate_x = ppg_df['Time'].values
+
+    stats_x, stats_df = None, None
+    if 'stats' in session:
+        stats_df = pd.read_csv(session['stats'])
+        if time_axis and 'Timestamp' in stats_df.columns:
+            stats_x = mdates.date2num(pd.to_datetime(stats_df['Timestamp']))
+        elif not time_axis and 'Time' in stats_df.columns:
+            stats_x = stats_df['Time'].values
+        else:
+            stats_df = None
+    template = get_template('rate', time_axis)
+    template.update(name, rate_x, ppg_df['PPG_Rate'].values, stats_x, stats_df)
+    paths += _save(template.fig, out_dir, f'{name}_rate', formats)
+
+    if 'sensor' in session and time_axis:
+        # The figure of heart_rate_analysis.py itself; it has a fixed layout
+        # and is drawn once per session, so it is not worth a template
+        from heart_rate_analysis import calculate_statistics, create_comparison_plot, process_data
+        sensor_df = pd.read_csv(session['sensor'], parse_dates=['Timestamp'])
+        ppg_processed, sensor_processed = process_data(ppg_df, sensor_df)
+        stats, _ = calculate_statistics(sensor_processed, ppg_processed)
+        fig = create_comparison_plot(sensor_processed, ppg_processed, stats)
+        paths += _save(fig, out_dir, f'{name}_comparison', formats)
+        plt.close(fig)
+    elif 'sensor' in session:
+        print(f"{name}: rate file has relative times only ('Time'), skipping the sensor comparison")
+
+    if 'calibration' in session:
+        from excel_cache import read_excel_cached
+        cal_df = read_excel_cached(session['calibration'], columns=['Timestamp', 'Sensor', 'Biopac'])
+        template = get_template('calibration')
+        template.update(name, cal_df)
+        paths += _save(template.fig, out_dir, f'{name}_calibration', formats)
+
+    return paths
+
+
+def run_report(directory, out_dir='report', formats=('png',), workers=None):
+    """
+    Render the figures of every session of a directory in a process pool
+
+    Args:
+        directory (str): Directory with the session files
+        out_dir (str): Directory for the rendered figures
+        formats (tuple): File formats, e.g. ('png', 'svg')
+        workers (int): Number of worker processes (default: all cores)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    sessions = find_sessions(directory)
+    print(f"Rendering {len(sessions)} sessions to {out_dir}")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_session, s, out_dir, formats): s['name'] for s in sessions}
+        for future in as_completed(futures):
+            try:
+                paths = future.result()
+                print(f"Rendered {futures[future]}: {len(paths)} files")
+            except Exception as e:
+                print(f"Failed to render {futures[future]}: {e}")
+                failed.append(futures[future])
+    return failed
+
+
+def _autoscale(ax, scalex=True, scaley=True):
+    # set_xlim/set_ylim turn autoscaling off; turn it back on for the new data
+    ax.set_autoscalex_on(scalex)
+    ax.set_autoscaley_on(scaley)
+    ax.relim()
+    ax.autoscale_view(scalex=scalex, scaley=scaley)
+
+
+def _save(fig, out_dir, name, formats):
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f'{name}.{fmt}')
+        fig.savefig(path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render all session figures without a display")
+    parser.add_argument('directory', help="Directory with the session files (e.g. batch_process.py output)")
+    parser.add_argument('--out-dir', default='report', help="Directory for the rendered figures")
+    parser.add_argument('--format', action='append', help="Figure format, repeatable (default: png)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    run_report(args.directory, args.out_dir, tuple(args.format or ['png']), args.workers)
@@ -0,0 +1,220 @@
+import argparse
+import os
+
+import numpy as np
+
+from beat_events import BEATS_FILE, STAT_COLUMNS, freq_seconds, rate_arrays, read_beat_arrays
+from profiler import stage
+
+# Widths of the pyramid levels (s) and the level each one is merged from;
+# every width divides a day, so cells are aligned on midnight like resample
+LEVELS = (1, 2, 5, 10, 60, 3600)
+PARENT = {2: 1, 5: 1, 10: 5, 60: 10, 3600: 60}
+# Mergeable aggregates of a cell: covered seconds, integrals of the rate and
+# of its square (BPM*s, BPM^2*s), extremes, the number of beats inside and
+# the rate at the start of the cell (the value of a zero-length window there)
+FIELDS = ('seconds', 'sum', 'sumsq', 'min', 'max', 'beats', 'start_rate')
+MICROS = 1_000_000
+
+
+class RatePyramid:
+    """
+    Multi-resolution rollup of the beat rate (1 s / 2 s / 5 s / 10 s / 1 min / 1 h)
+
+    Each level holds one cell per aligned window with mergeable aggregates
+    (FIELDS), so any coarser window is a merge of cells instead of a pass
+    over the beats: sums and counts add, extremes take min/max. The 1 s
+    cells are exact integrals of the interpolated rate (see
+    beat_events.rate_arrays), and weighting by covered seconds keeps merged
+    means exact, so a query gives the same values as rate_arrays on the beats.
+    """
+
+    def __init__(self, levels, source_stamp=None):
+        """
+        Args:
+            levels (dict): {width in seconds: {'t': cell starts (int64 us since
+                the epoch), field: array}}
+            source_stamp (tuple): (mtime, size) of the beat file it was built from
+        """
+        self.levels = levels
+        self.source_stamp = source_stamp
+
+    @classmethod
+    def from_beats(cls, times, rates, source_stamp=None):
+        """
+        Build every level from beat events
+
+        Args:
+            times (array): Beat times (datetime64), sorted
+            rates (array): Beat rates (BPM) of the beats to use (already quality-filtered)
+        """
+        times = np.asarray(times, dtype='datetime64[us]')
+        with stage('rollup_base', rows=len(times)) as record:
+            starts, columns = rate_arrays(times, rates, '1s', stats=('mean', 'meansq', 'min', 'max'))
+            t = starts.astype(np.int64)
+            first, last = times[0].astype(np.int64), times[-1].astype(np.int64)
+            seconds = (np.minimum(t + MICROS, last) - np.maximum(t, first)) / MICROS
+            beats = np.diff(np.searchsorted(times.astype(np.int64), np.append(t, t[-1] + MICROS)))
+            valid = np.isfinite(rates)
+            start_rate = np.interp(np.maximum(t, first), times.astype(np.int64)[valid], np.asarray(rates)[valid])
+            levels = {1: {'t': t, 'seconds': seconds, 'sum': columns['mean'] * seconds,
+                          'sumsq': columns['meansq'] * seconds, 'min': columns['min'],
+                          'max': columns['max'], 'beats': beats, 'start_rate': start_rate}}
+            record.extra['cells'] = len(t)
+        with stage('rollup_levels'):
+            for width in LEVELS[1:]:
+                levels[width] = merge_cells(levels[PARENT[width]], width * MICROS)
+        return cls(levels, source_stamp)
+
+    def query(self, freq, start=None, end=None, stats=('mean', 'min', 'max')):
+        """
+        Windowed rate statistics from the coarsest level that tiles the windows
+
+        Args:
+            freq (str or float): Window width, a whole number of seconds ('2s',
+                '10s', '90s', '1min', ...); windows are aligned on multiples of
+                freq from midnight of the first day, as in rate_arrays
+            start, end (datetime64): Time range, end included as in
+                rate_arrays (default: all); must fall on whole seconds. An
+                end on a window boundary gives a last, zero-length window
+            stats (tuple): Any of 'mean', 'std', 'min', 'max', 'seconds', 'beats'
+
+        Returns:
+            tuple: (window starts as datetime64[us], {stat: array})
+        """
+        step = int(round(freq_seconds(freq) * MICROS))
+        bounds = [None if b is None else np.datetime64(b, 'us').astype(np.int64) for b in (start, end)]
+        if step % MICROS or any(b is not None and b % MICROS for b in bounds):
+            raise ValueError(f"Window {freq!r} or range is finer than the 1 s base level; use beat_events.rate_arrays")
+        width = max(w for w in LEVELS if step % (w * MICROS) == 0
+                    and all(b is None or b % (w * MICROS) == 0 for b in bounds))
+        cells = self.levels[width]
+
+        t = cells['t']
+        lo = 0 if bounds[0] is None else np.searchsorted(t, bounds[0])
+        hi = len(t) if bounds[1] is None else np.searchsorted(t, bounds[1])
+        if lo >= len(t):
+            return np.array([], dtype='datetime64[us]'), {s: np.array([]) for s in stats}
+        # Windows are counted from midnight of the first day, as DataFrame.resample does
+        day = t[lo] // (86400 * MICROS) * (86400 * MICROS)
+        # The end is included: on a window boundary (or for start == end) it
+        # is a zero-length window holding the rate at the end, as in rate_arrays
+        at_end = hi < len(t) and t[hi] == bounds[1] and (lo == hi or (bounds[1] - day) % step == 0)
+        merged = {name: values[lo:hi] for name, values in cells.items()}
+        if lo < hi:
+            merged = merge_cells(merged, step, origin=day)
+        if at_end:
+            point = {name: values[hi:hi + 1] for name, values in cells.items()}
+            point.update(t=day + (point['t'] - day) // step * step, seconds=np.zeros(1), sum=np.zeros(1),
+                         sumsq=np.zeros(1), beats=np.zeros(1, dtype=int),
+                         min=point['start_rate'], max=point['start_rate'])
+            merged = {name: np.concatenate([merged[name], point[name]]) for name in merged}
+        return merged['t'].astype('datetime64[us]'), cell_stats(merged, stats)
+
+    def save(self, path):
+        """Save all levels to one .npz file"""
+        arrays = {f'{name}_{width}': values for width, cells in self.levels.items()
+                  for name, values in cells.items()}
+        if self.source_stamp is not None:
+            arrays['source_stamp'] = np.array(self.source_stamp, dtype=np.float64)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            levels = {w: {name: data[f'{name}_{w}'] for name in ('t',) + FIELDS} for w in LEVELS}
+            stamp = tuple(data['source_stamp']) if 'source_stamp' in data.files else None
+        return cls(levels, stamp)
+
+
+def merge_cells(cells, step, origin=0):
+    """
+    Merge sorted cells into windows of step microseconds aligned on origin
+
+    Sums add and extremes take min/max, so merging 1 s cells into 10 s
+    windows gives the same aggregates as 1 s -> 5 s -> 10 s.
+    """
+    key = (cells['t'] - origin) // step
+    first = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+    merged = {'t': origin + key[first] * step}
+    for name in ('seconds', 'sum', 'sumsq', 'beats'):
+        merged[name] = np.add.reduceat(cells[name], first)
+    merged['min'] = np.minimum.reduceat(cells['min'], first)
+    merged['max'] = np.maximum.reduceat(cells['max'], first)
+    merged['start_rate'] = cells['start_rate'][first]
+    return merged
+
+
+def cell_stats(cells, stats):
+    """Mean, standard deviation (time-weighted), extremes, covered seconds and beats of cells"""
+    seconds = cells['seconds']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # A zero-length cell (a window starting at the last beat) holds one value, min == max
+        mean = np.where(seconds > 0, cells['sum'] / seconds, cells['min'])
+        variance = np.where(seconds > 0, cells['sumsq'] / seconds - mean * mean, 0.0)
+    values = {'mean': mean, 'std': np.sqrt(np.maximum(variance, 0.0)), 'min': cells['min'],
+              'max': cells['max'], 'seconds': seconds, 'beats': cells['beats']}
+    return {s: values[s] for s in stats}
+
+
+def rollup_path(beats_path=BEATS_FILE):
+    """Pyramid file kept next to a beat CSV"""
+    return os.path.splitext(beats_path)[0] + '_rollup.npz'
+
+
+def load_pyramid(beats_path=BEATS_FILE, path=None):
+    """
+    The pyramid of a beat CSV, rebuilt and saved only when the CSV changed
+    (its modification time or size differs from the one recorded)
+    """
+    path = path or rollup_path(beats_path)
+    info = os.stat(beats_path)
+    stamp = (info.st_mtime, float(info.st_size))
+    if os.path.exists(path):
+        try:
+            pyramid = RatePyramid.load(path)
+        except KeyError:
+            pyramid = None  # saved before a field was added
+        if pyramid is not None and pyramid.source_stamp == stamp:
+            return pyramid
+    times, rates = read_beat_arrays(beats_path)
+    pyramid = RatePyramid.from_beats(times, rates, stamp)
+    pyramid.save(path)
+    return pyramid
+
+
+def rollup_series(pyramid, freq, start=None, end=None, stats=('mean', 'min', 'max')):
+    """
+    query() as a DataFrame with 'Timestamp' and the STAT_COLUMNS of the stats
+    (the columns of beat_events.rate_series)
+    """
+    import pandas as pd
+
+    bounds = [None if b is None else pd.Timestamp(b).to_datetime64() for b in (start, end)]
+    starts, columns = pyramid.query(freq, *bounds, stats=stats)
+    return pd.DataFrame({'Timestamp': starts.astype('datetime64[ns]'),
+                         **{STAT_COLUMNS.get(s, s.capitalize()): columns[s] for s in stats}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rate statistics at any window from the rollup pyramid")
+    parser.add_argument('beats', nargs='?', default=BEATS_FILE, help="Beat CSV (see process_ppg.py)")
+    parser.add_argument('--window', default='10s', help="Window, a whole number of seconds (e.g. 2s, 90s, 1min)")
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--output', default=None, help="CSV file (default: print)")
+    args = parser.parse_args()
+
+    pyramid = load_pyramid(args.beats)
+    for width in LEVELS:
+        print(f"{width:>5} s level: {len(pyramid.levels[width]['t'])} cells")
+    df = rollup_series(pyramid, args.window, args.start, args.end,
+                       stats=('mean', 'std', 'min', 'max', 'beats')).round(2)
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f"Saved {len(df)} windows to {args.output}")
+    else:
+        print(df.to_string(index=False))
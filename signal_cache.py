@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from profiler import stage
+
+CACHE_DIR = '.signal_cache'
+INDEX_FILE = 'index.json'
+
+
+def file_hash(path, block_size=1 << 20):
+    """Return the BLAKE2 hash of a file's content as a hex string"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_hash(path, cache_dir=CACHE_DIR):
+    """
+    Return the content hash of a source file, remembered per (size, mtime)
+    in the cache index so unchanged files are not re-read on every run
+    """
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    stat = os.stat(path)
+    entry = index.get(os.path.abspath(path))
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['hash']
+
+    digest = file_hash(path)
+    index[os.path.abspath(path)] = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': digest,
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, index_path)
+    return digest
+
+
+def load_signal(source, column=1, cache_dir=CACHE_DIR):
+    """
+    Load one column of a CSV or Excel recording as a read-only np.memmap
+
+    The source is parsed only the first time; the column is then kept as a
+    float64 .npy file named after the content hash of the source, and every
+    later call maps that file instead of re-parsing. Timestamp columns are
+    stored as seconds since the epoch (see load_timestamps).
+
+    Args:
+        source (str): Path to a .csv or .xlsx file
+        column (int or str): Column position or name (default: 2nd column, PPG)
+        cache_dir (str): Directory holding the cached arrays
+    """
+    key = f"{source_hash(source, cache_dir)}-{column}"
+    path = os.path.join(cache_dir, key + '.npy')
+
+    if not os.path.exists(path):
+        with stage('parse_column', file=os.path.basename(source)) as record:
+            values = _parse_column(source, column)
+            record.rows = len(values)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = os.path.join(cache_dir, key + '.tmp.npy')
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64, shape=values.shape)
+        array[:] = values
+        array.flush()
+        del array
+        os.replace(tmp_path, path)
+
+    return np.load(path, mmap_mode='r')
+
+
+def load_timestamps(source, column=0, cache_dir=CACHE_DIR):
+    """Load a timestamp column through the cache as a DatetimeIndex"""
+    seconds = load_signal(source, column, cache_dir)
+    return pd.to_datetime(np.asarray(seconds), unit='s').round('us')
+
+
+def _parse_column(source, column):
+    extension = os.path.splitext(source)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        # Imported here so CSV-only scripts do not need openpyxl
+        from excel_cache import read_excel_cached
+        series = read_excel_cached(source, columns=[column]).iloc[:, 0]
+    elif extension == '.xls':
+        # Legacy workbooks: openpyxl cannot stream them, pandas picks the xlrd engine
+        series = pd.read_excel(source, usecols=[column]).iloc[:, 0]
+    else:
+        series = pd.read_csv(source, usecols=[column]).iloc[:, 0]
+
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=np.float64)
+    timestamps = pd.to_datetime(series)
+    return (timestamps - pd.Timestamp(0)).dt.total_seconds().to_numpy()
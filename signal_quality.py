@@ -0,0 +1,193 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from profiler import stage
+
+WINDOW_SECONDS = 5.0
+MIN_SEGMENT_SECONDS = 10.0
+
+# Heart rates the periodicity search covers (BPM)
+RATE_RANGE = (30, 220)
+
+# Default gates of a usable window. Amplitudes are relative to the median
+# window of the recording, since PPG units differ between devices
+MIN_AMPLITUDE = 0.25
+MAX_AMPLITUDE = 4.0
+MIN_PERIODICITY = 0.5
+MAX_CLIPPED = 0.05
+MAX_FLAT = 0.2
+
+
+def window_quality(signal, sampling_rate, window_seconds=WINDOW_SECONDS, min_perfusion=None):
+    """
+    Cheap per-window quality index of a raw PPG signal
+
+    The signal is cut into consecutive windows and every metric is computed
+    for all windows at once, without filtering or peak detection:
+
+    - amplitude: 5-95 percentile range, relative to the median window
+      (flat or detached sensor below, motion bursts above)
+    - perfusion: amplitude over the absolute mean (AC/DC); only meaningful
+      for DC-coupled sensors, so it is gated only when min_perfusion is set
+    - periodicity: highest normalized autocorrelation at a beat period of
+      30-220 BPM, i.e. how well the window matches itself shifted by one
+      beat (a template correlation that needs no template)
+    - clipped: fraction of samples at the window's minimum or maximum (ADC rails)
+    - flat: fraction of samples equal to the previous one
+
+    Args:
+        signal (array): Raw PPG samples
+        sampling_rate (float): Sampling rate (Hz)
+        window_seconds (float): Window length (s); a short last window is dropped
+            from the metrics and takes the quality of the one before
+        min_perfusion (float): Perfusion gate (optional)
+
+    Returns:
+        DataFrame: One row per window with 'start' and 'stop' (samples), the
+            metrics and 'usable'
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    width = int(round(window_seconds * sampling_rate))
+    n_windows = max(len(signal) // width, 1)
+    width = min(width, len(signal))
+
+    with stage('window_quality', rows=len(signal)) as record:
+        windows = signal[:n_windows * width].reshape(n_windows, width)
+        low, high = np.percentile(windows, [5, 95], axis=1)
+        amplitude = high - low
+        dc = np.abs(windows.mean(axis=1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = amplitude / np.median(amplitude)
+            perfusion = amplitude / dc
+
+        # Autocorrelation of every window through one batched FFT
+        centred = windows - windows.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(centred, n=2 * width, axis=1)
+        autocorr = np.fft.irfft(spectrum * spectrum.conj(), axis=1)[:, :width]
+        lo_lag = max(int(sampling_rate * 60 / RATE_RANGE[1]), 1)
+        hi_lag = min(int(sampling_rate * 60 / RATE_RANGE[0]), width - 1)
+        lags = np.arange(lo_lag, hi_lag + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Unbiased: each lag is scaled by the number of overlapping samples
+            normalized = autocorr[:, lags] / autocorr[:, :1] * (width / (width - lags))
+        periodicity = np.nan_to_num(normalized.max(axis=1)) if len(lags) else np.zeros(n_windows)
+
+        # A clean window reaches its extremes once per beat at most; a clipped
+        # one sits on them
+        rails = (windows == windows.max(axis=1, keepdims=True)) | (windows == windows.min(axis=1, keepdims=True))
+        clipped = rails.mean(axis=1)
+        flat = (np.diff(windows, axis=1) == 0).mean(axis=1)
+        record.extra['windows'] = n_windows
+
+    usable = ((relative >= MIN_AMPLITUDE) & (relative <= MAX_AMPLITUDE) & (periodicity >= MIN_PERIODICITY)
+              & (clipped <= MAX_CLIPPED) & (flat <= MAX_FLAT))
+    if min_perfusion is not None:
+        usable &= perfusion >= min_perfusion
+
+    starts = np.arange(n_windows) * width
+    stops = starts + width
+    stops[-1] = len(signal)  # the remainder belongs to the last window
+    return pd.DataFrame({
+        'start': starts,
+        'stop': stops,
+        'amplitude': relative,
+        'perfusion': perfusion,
+        'periodicity': periodicity,
+        'clipped': clipped,
+        'flat': flat,
+        'usable': usable,
+    })
+
+
+def usable_segments(quality, sampling_rate, min_seconds=MIN_SEGMENT_SECONDS):
+    """
+    Runs of consecutive usable windows, as (start, stop) sample ranges
+
+    Args:
+        quality (DataFrame): Result of window_quality
+        sampling_rate (float): Sampling rate (Hz)
+        min_seconds (float): Shorter runs are dropped (too short for the rate pipeline)
+    """
+    usable = quality['usable'].to_numpy().astype(np.int8)
+    edges = np.diff(np.concatenate([[0], usable, [0]]))
+    first = np.flatnonzero(edges == 1)
+    last = np.flatnonzero(edges == -1) - 1
+    starts = quality['start'].to_numpy()[first]
+    stops = quality['stop'].to_numpy()[last]
+    keep = (stops - starts) >= min_seconds * sampling_rate
+    return [(int(a), int(b)) for a, b in zip(starts[keep], stops[keep])]
+
+
+def segment_index(positions, segments):
+    """Index of the segment each sample position falls in (-1 outside all segments)"""
+    positions = np.asarray(positions)
+    if not segments:
+        return np.full(len(positions), -1)
+    starts, stops = np.array(segments).T
+    index = np.searchsorted(starts, positions, side='right') - 1
+    inside = (index >= 0) & (positions < stops[np.maximum(index, 0)])
+    return np.where(inside, index, -1)
+
+
+def ppg_process_gated(ppg, sampling_rate, target_rate=None, window_seconds=WINDOW_SECONDS,
+                      min_seconds=MIN_SEGMENT_SECONDS):
+    """
+    ppg_process_resampled on the usable segments only
+
+    Unusable stretches (artifact, flat or saturated signal) are never
+    cleaned or searched for peaks, so they cost nothing and produce no beats;
+    the interval across a gap is flagged by the beat quality check (see
+    beat_events.beats_from_peaks).
+
+    Returns:
+        tuple: (signals DataFrame over the whole recording at the analysis
+            rate, NaN where skipped; analysis rate; peak times in seconds from
+            the first sample; window quality DataFrame)
+    """
+    from resample import CANONICAL_RATE, ppg_process_resampled
+
+    target_rate = CANONICAL_RATE if target_rate is None else target_rate
+    ppg = np.asarray(ppg)
+    quality = window_quality(ppg, sampling_rate, window_seconds)
+    segments = usable_segments(quality, sampling_rate, min_seconds)
+    if not segments:
+        raise ValueError("No usable PPG segment: the whole recording failed the quality gates")
+
+    parts, peak_times = [], []
+    rate = None
+    for start, stop in segments:
+        with stage('ppg_segment', rows=stop - start):
+            signals, rate, times = ppg_process_resampled(ppg[start:stop], sampling_rate, target_rate)
+        offset = int(round(start * rate / sampling_rate))
+        signals.index = signals.index + offset
+        parts.append(signals)
+        peak_times.append(times + start / sampling_rate)
+
+    n_total = int(np.ceil(len(ppg) * rate / sampling_rate))
+    signals = pd.concat(parts)
+    signals = signals[~signals.index.duplicated()].reindex(pd.RangeIndex(n_total))
+    return signals, rate, np.concatenate(peak_times), quality
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-window PPG signal quality")
+    parser.add_argument('source', help="CSV/Excel recording (time, PPG columns)")
+    parser.add_argument('--window', type=float, default=WINDOW_SECONDS, help="Window length (s)")
+    parser.add_argument('--output', default=None, help="Write the per-window quality to this CSV")
+    args = parser.parse_args()
+
+    from resample import sampling_rate_from_times
+    from signal_cache import load_signal
+
+    ppg = load_signal(args.source, 1)
+    sampling_rate = sampling_rate_from_times(load_signal(args.source, 0)[:1000])
+    quality = window_quality(ppg, sampling_rate, args.window)
+    segments = usable_segments(quality, sampling_rate)
+    usable_seconds = sum(b - a for a, b in segments) / sampling_rate
+    print(f"{quality['usable'].sum()} of {len(quality)} windows usable, "
+          f"{len(segments)} segments, {usable_seconds:.0f} of {len(ppg) / sampling_rate:.0f} s kept")
+    if args.output:
+        quality.to_csv(args.output, index=False)
+        print(f"Saved window quality to {args.output}")
@@ -0,0 +1,208 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+
+
+class StoreWriter:
+    """
+    Write channel samples into a chunked binary store, one .npy file per
+    channel per `chunk_seconds` of signal.
+
+    Layout of a store directory:
+        meta.json           sampling rate, start time and channel list
+        ch0/00000.npy       first chunk of channel 0
+        ch0/00001.npy       ...
+
+    Channels are stored in their own dtype, e.g. the raw int16 counts of an
+    ACQ file with the scale and offset that turn them into physical values.
+    """
+
+    def __init__(self, output_dir, channels, start_time=None, chunk_seconds=60, source_hash=None):
+        """
+        Args:
+            output_dir (str): Directory to create the store in
+            channels (list): One dict per channel with 'name', 'units' and
+                'sampling_rate', and optionally 'dtype' of the stored samples
+                (default float64), 'scale' and 'offset' (physical = sample * scale + offset)
+            start_time (str): ISO timestamp of the first sample (optional)
+            chunk_seconds (float): Length of signal stored in each chunk file
+            source_hash (str): Content hash of the converted file, so a store
+                can be checked against its source (optional)
+        """
+        self.output_dir = output_dir
+        self.start_time = start_time
+        self.source_hash = source_hash
+        self.chunk_seconds = chunk_seconds
+        self.channels = []
+        self._pending = []
+
+        os.makedirs(output_dir, exist_ok=True)
+        for i, channel in enumerate(channels):
+            key = f'ch{i}'
+            os.makedirs(os.path.join(output_dir, key), exist_ok=True)
+            self.channels.append({
+                'name': channel['name'],
+                'key': key,
+                'units': channel.get('units', ''),
+                'sampling_rate': float(channel['sampling_rate']),
+                'dtype': np.dtype(channel.get('dtype', np.float64)).name,
+                'scale': float(channel.get('scale', 1.0)),
+                'offset': float(channel.get('offset', 0.0)),
+                'chunk_size': max(1, int(round(chunk_seconds * channel['sampling_rate']))),
+                'n_samples': 0,
+                'n_chunks': 0,
+            })
+            self._pending.append([])
+
+    def append(self, channel_index, samples):
+        """Append a block of samples (in the channel's stored dtype) to a channel, flushing full chunks to disk"""
+        pending = self._pending[channel_index]
+        pending.append(np.asarray(samples, dtype=self.channels[channel_index]['dtype']))
+        chunk_size = self.channels[channel_index]['chunk_size']
+        if sum(len(p) for p in pending) >= chunk_size:
+            data = np.concatenate(pending)
+            n_full = len(data) // chunk_size
+            for i in range(n_full):
+                self._write_chunk(channel_index, data[i * chunk_size:(i + 1) * chunk_size])
+            self._pending[channel_index] = [data[n_full * chunk_size:]]
+
+    def close(self):
+        """Flush partial chunks and write the metadata file"""
+        for i, pending in enumerate(self._pending):
+            if pending:
+                data = np.concatenate(pending)
+                if len(data):
+                    self._write_chunk(i, data)
+            self._pending[i] = []
+
+        meta = {
+            'start_time': self.start_time,
+            'chunk_seconds': self.chunk_seconds,
+            'source_hash': self.source_hash,
+            'channels': self.channels,
+        }
+        with open(os.path.join(self.output_dir, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    def _write_chunk(self, channel_index, data):
+        channel = self.channels[channel_index]
+        path = os.path.join(self.output_dir, channel['key'], f"{channel['n_chunks']:05d}.npy")
+        np.save(path, data)
+        channel['n_chunks'] += 1
+        channel['n_samples'] += len(data)
+
+
+def read_store_meta(store_dir):
+    """Read the metadata of a store written by StoreWriter"""
+    with open(os.path.join(store_dir, META_FILE)) as f:
+        return json.load(f)
+
+
+def read_signal(store_dir, channel, start=None, stop=None, meta=None):
+    """
+    Read one channel between two times as a Signal, in its stored dtype
+
+    Same arguments as read_channel; no float or time arrays are created.
+    """
+    from signal_container import Signal
+
+    if meta is None:
+        meta = read_store_meta(store_dir)
+    info = _find_channel(meta, channel)
+    first, samples = _read_samples(store_dir, info, start, stop)
+    t0 = meta.get('start_time')
+    if t0 is not None:
+        t0 = pd.Timestamp(t0) + pd.Timedelta(seconds=first / info['sampling_rate'])
+    return Signal(samples, info['sampling_rate'], info.get('scale', 1.0), info.get('offset', 0.0),
+                  t0, info['name'], info.get('units', ''))
+
+
+def read_channel(store_dir, channel, start=None, stop=None, meta=None):
+    """
+    Read one channel between two times without touching the other chunks
+
+    Args:
+        store_dir (str): Path to the store directory
+        channel (str or int): Channel name or index
+        start (float): Start time in seconds from the first sample (optional)
+        stop (float): Stop time in seconds, exclusive (optional)
+        meta (dict): Metadata already read with read_store_meta (optional)
+
+    Returns:
+        tuple: (time in seconds, samples) as numpy arrays
+    """
+    if meta is None:
+        meta = read_store_meta(store_dir)
+    info = _find_channel(meta, channel)
+    first, samples = _read_samples(store_dir, info, start, stop)
+    scale, offset = info.get('scale', 1.0), info.get('offset', 0.0)
+    if samples.dtype != np.float64 or scale != 1 or offset != 0:
+        samples = samples * scale + offset
+    time = np.arange(first, first + len(samples)) / info['sampling_rate']
+    return time, samples
+
+
+def _read_samples(store_dir, info, start, stop):
+    """(index of the first sample, stored samples) of a channel between two times"""
+    fs = info['sampling_rate']
+    chunk_size = info['chunk_size']
+    n_samples = info['n_samples']
+
+    first = 0 if start is None else _sample_index(start, fs)
+    last = n_samples if stop is None else _sample_index(stop, fs)
+    first = min(first, n_samples)
+    last = min(max(last, first), n_samples)
+
+    parts = []
+    for chunk in range(first // chunk_size, -(-last // chunk_size)):
+        path = os.path.join(store_dir, info['key'], f'{chunk:05d}.npy')
+        data = np.load(path, mmap_mode='r')
+        offset = chunk * chunk_size
+        parts.append(data[max(first - offset, 0):last - offset])
+    samples = np.concatenate(parts) if parts else np.empty(0, dtype=info.get('dtype', np.float64))
+    return first, samples
+
+
+def _sample_index(seconds, fs):
+    """First sample at or after a time; float error below 1e-9 samples does not count"""
+    return int(np.ceil(max(seconds, 0) * fs - 1e-9))
+
+
+def read_store(store_dir, start=None, stop=None, channels=None):
+    """
+    Load a time slice of a store as a DataFrame laid out like the converted CSV
+    ('Time' followed by one column per channel)
+
+    Args:
+        store_dir (str): Path to the store directory
+        start (float): Start time in seconds (optional)
+        stop (float): Stop time in seconds, exclusive (optional)
+        channels (list): Channel names or indexes to load (default: all)
+    """
+    meta = read_store_meta(store_dir)
+    if channels is None:
+        channels = [c['name'] for c in meta['channels']]
+
+    rates = {_find_channel(meta, c)['sampling_rate'] for c in channels}
+    if len(rates) > 1:
+        raise ValueError("Channels with different sampling rates must be read with read_channel")
+
+    data_dict = {}
+    for channel in channels:
+        time, samples = read_channel(store_dir, channel, start, stop, meta=meta)
+        data_dict.setdefault('Time', time)
+        data_dict[_find_channel(meta, channel)['name']] = samples
+    return pd.DataFrame(data_dict)
+
+
+def _find_channel(meta, channel):
+    if isinstance(channel, int):
+        return meta['channels'][channel]
+    for info in meta['channels']:
+        if info['name'] == channel:
+            return info
+    raise KeyError(f"Channel '{channel}' not found in store")
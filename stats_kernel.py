@@ -0,0 +1,156 @@
+import numpy as np
+
+DEFAULT_PERCENTILES = (25, 50, 75, 95)
+
+
+class RunningStats:
+    """
+    Count, mean, central moments, min and max of a stream of values
+
+    Chunks are combined with the pairwise update of Chan et al. / Pebay, so
+    statistics of a long recording can be built chunk by chunk (or in
+    parallel and merged) without ever holding the full array.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sums of powers of deviations from the mean
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def from_array(cls, values):
+        """Build the statistics of one chunk of values (NaN values are ignored)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        result = cls()
+        if len(values) == 0:
+            return result
+        result.count = len(values)
+        result.mean = values.mean()
+        d = values - result.mean
+        d2 = d * d
+        result.m2 = d2.sum()
+        result.m3 = (d2 * d).sum()
+        result.m4 = (d2 * d2).sum()
+        result.min = values.min()
+        result.max = values.max()
+        return result
+
+    def update(self, values):
+        """Add a chunk of values"""
+        return self.merge(RunningStats.from_array(values))
+
+    def merge(self, other):
+        """Combine the statistics of another chunk into this one"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        delta_n = delta / n
+
+        m4 = (self.m4 + other.m4
+              + delta * delta_n ** 3 * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b)
+              + 6 * delta_n ** 2 * (n_a * n_a * other.m2 + n_b * n_b * self.m2)
+              + 4 * delta_n * (n_a * other.m3 - n_b * self.m3))
+        m3 = (self.m3 + other.m3
+              + delta * delta_n ** 2 * n_a * n_b * (n_a - n_b)
+              + 3 * delta_n * (n_a * other.m2 - n_b * self.m2))
+        m2 = self.m2 + other.m2 + delta * delta_n * n_a * n_b
+
+        self.count = n
+        self.mean = self.mean + delta_n * n_b
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def variance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return np.nan
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.variance(ddof))
+
+    def skewness(self):
+        """Biased sample skewness, as scipy.stats.skew"""
+        if self.count == 0 or self.m2 == 0:
+            return np.nan
+        return np.sqrt(self.count) * self.m3 / self.m2 ** 1.5
+
+    def kurtosis(self):
+        """Biased excess kurtosis, as scipy.stats.kurtosis"""
+        if self.count == 0 or self.m2 == 0:
+            return np.nan
+        return self.count * self.m4 / self.m2 ** 2 - 3
+
+
+def percentiles(values, qs=DEFAULT_PERCENTILES):
+    """
+    Linear-interpolated percentiles (as np.percentile) from a single
+    np.partition of the values
+
+    Returns:
+        dict: percentile -> value
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {q: np.nan for q in qs}
+
+    positions = (len(values) - 1) * np.asarray(qs, dtype=np.float64) / 100
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    ordered = np.partition(values, np.unique(np.concatenate([lower, upper])))
+    result = ordered[lower] + (positions - lower) * (ordered[upper] - ordered[lower])
+    return dict(zip(qs, result))
+
+
+def describe(values, qs=DEFAULT_PERCENTILES, ddof=0):
+    """
+    Descriptive statistics of an array of heart rates in one call
+
+    Args:
+        values (array): Values to describe (NaN values are ignored)
+        qs (tuple): Percentiles to report
+        ddof (int): Delta degrees of freedom for std/var (0 like numpy, 1 like pandas)
+
+    Returns:
+        dict: count, mean, median, mode, std, var, range, iqr, min, max,
+            skew, kurtosis and a 'percentiles' dict
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    moments = RunningStats.from_array(values)
+    quantiles = percentiles(values, tuple(sorted(set(qs) | {25, 50, 75})))
+
+    if len(values):
+        unique, counts = np.unique(values, return_counts=True)
+        mode = unique[np.argmax(counts)]
+    else:
+        mode = np.nan
+
+    return {
+        'count': moments.count,
+        'mean': moments.mean if moments.count else np.nan,
+        'median': quantiles[50],
+        'mode': mode,
+        'std': moments.std(ddof),
+        'var': moments.variance(ddof),
+        'range': moments.max - moments.min if moments.count else np.nan,
+        'iqr': quantiles[75] - quantiles[25],
+        'min': moments.min if moments.count else np.nan,
+        'max': moments.max if moments.count else np.nan,
+        'skew': moments.skewness(),
+        'kurtosis': moments.kurtosis(),
+        'percentiles': {q: quantiles[q] for q in qs},
+    }